@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class BlogsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blogs'
+
+    def ready(self):
+        # Connects the signals revoking tokens on password and status changes
+        from . import authentication  # noqa: F401
@@ -0,0 +1,187 @@
+import math
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    MethodNotAllowed,
+    NotAuthenticated,
+    NotFound,
+    Throttled,
+)
+from rest_framework.request import Request
+from rest_framework.settings import api_settings as drf_settings
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import StatelessJWTAuthentication, auser_from_claims
+from .models import Blog, Like, Comment
+from .pagination import BlogCursorPagination, CommentCursorPagination
+from .renderers import FastJSONRenderer
+from .serializers import BlogListSerializer, CommentSerializer
+from .views import blog_list_rows
+from . import cache, conditional, likes, timeline, trending
+
+
+# Native async counterparts of the hot read and like endpoints for ASGI
+# deployments. The sync views in views.py remain the WSGI entry points.
+
+
+async def aauthenticate(request):
+    """
+    Async counterpart of StatelessJWTAuthentication.authenticate()
+    """
+    authentication = StatelessJWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = authentication.get_validated_token(raw_token)
+    user = await auser_from_claims(validated_token)
+    if user is not None:
+        return user
+    user_id = validated_token[api_settings.USER_ID_CLAIM]
+    try:
+        user = await User.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+    except User.DoesNotExist:
+        raise AuthenticationFailed("User not found")
+    if not user.is_active:
+        raise AuthenticationFailed("User is inactive")
+    return user
+
+
+async def athrottle(request):
+    """
+    Async counterpart of APIView.check_throttles() for the token bucket
+    throttles
+    """
+    waits = []
+    for throttle_class in drf_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not await throttle.aallow_request(request):
+            waits.append(throttle.wait())
+    if waits:
+        raise Throttled(wait=max(waits))
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        FastJSONRenderer().render(data),
+        status=status_code,
+        content_type="application/json",
+    )
+
+
+def async_api_view(methods):
+    """
+    Authenticate and throttle an async view and turn API exceptions into
+    responses
+    """
+
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise MethodNotAllowed(request.method)
+                user = await aauthenticate(request)
+                if user is None:
+                    raise NotAuthenticated()
+                request = Request(request, authenticators=())
+                request.user = user
+                await athrottle(request)
+                return await view(request, *args, **kwargs)
+            except APIException as error:
+                detail = error.detail
+                if not isinstance(detail, dict):
+                    detail = {"detail": detail}
+                response = render(detail, error.status_code)
+                if isinstance(error, Throttled) and error.wait is not None:
+                    response["Retry-After"] = str(math.ceil(error.wait))
+                return response
+
+        return wrapper
+
+    return decorator
+
+
+@async_api_view(["GET"])
+async def home_blogs(request):
+    author_ids = await timeline.apulled_authors(request.user)
+    queryset = timeline.home_queryset(request.user, author_ids)
+    paginator = BlogCursorPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    blog_ids = [entry.blog_id for entry in page]
+    blogs = await cache.aget_blogs(
+        blog_ids,
+        BlogListSerializer,
+        Blog.objects.defer("content").with_excerpt(),
+    )
+    pending = await likes.apending(request.user, blog_ids)
+    data = blog_list_rows(page, blogs, request, pending)
+    return render(paginator.get_paginated_data(data))
+
+
+@async_api_view(["GET"])
+async def blog_detail(request, pk):
+    data = (await cache.aget_blogs([pk])).get(pk)
+    if data is None:
+        raise NotFound()
+    is_liked = await Like.objects.filter(user=request.user, blog_id=pk).aexists()
+    pending = (await likes.apending(request.user, [pk])).get(pk)
+    data, is_liked = likes.apply_pending(data, is_liked, pending)
+    etag, last_modified = conditional.blog_validators(data, is_liked, pending)
+    response = conditional.not_modified(request, etag, last_modified)
+    if response is None:
+        response = render({**data, "is_liked": is_liked})
+        conditional.set_validators(response, etag, last_modified)
+    return response
+
+
+@async_api_view(["GET"])
+async def comment_list(request, fk):
+    fields = CommentSerializer.values_fields(request)
+    columns = CommentSerializer.values_columns(fields)
+    queryset = Comment.objects.filter(blog_id=fk).values(*{*columns, "updated_at"})
+    paginator = CommentCursorPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    etag, last_modified = conditional.page_validators(page, paginator)
+    response = conditional.not_modified(request, etag, last_modified)
+    if response is None:
+        data = CommentSerializer.serialize_values(page, fields)
+        response = render(paginator.get_paginated_data(data))
+        conditional.set_validators(response, etag, last_modified)
+    return response
+
+
+@async_api_view(["POST", "DELETE"])
+async def like_blog(request, fk):
+    """
+    Like a blog, or delete a like from a blog, returning the new like count
+    """
+    if likes.enabled():
+        like_count = await likes.arecord(request.user, fk, request.method == "POST")
+        if like_count is None:
+            raise NotFound()
+        if request.method == "POST":
+            return render({"num_likes": like_count}, status.HTTP_201_CREATED)
+        return render({"num_likes": like_count}, status.HTTP_200_OK)
+
+    # Django has no async transactions yet, so the write runs in a thread
+    if request.method == "POST":
+        like_count = await sync_to_async(Like.objects.like)(
+            request.user, fk, trend_score=trending.like_score()
+        )
+        status_code = status.HTTP_201_CREATED
+    else:
+        like_count = await sync_to_async(Like.objects.unlike)(request.user, fk)
+        status_code = status.HTTP_200_OK
+    if like_count is None:
+        raise NotFound()
+    await cache.ainvalidate_blog(fk)
+    return render({"num_likes": like_count}, status_code)
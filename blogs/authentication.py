@@ -0,0 +1,187 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, pre_save, post_save
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import TokenRevocation
+
+# Claims embedded by tokens_for_user(), enough to authenticate without the DB
+USER_CLAIMS = ["username", "is_active"]
+# The user's revocation marker when the token was issued
+TOKEN_VERSION_CLAIM = "token_version"
+# User fields whose change revokes the user's tokens
+REVOKING_FIELDS = ["password", "is_active"]
+# Seconds a revocation marker is cached, and so the longest a revocation
+# made by another process takes to apply with a per-process cache
+TOKEN_VERSION_CACHE_TIMEOUT = getattr(settings, "TOKEN_VERSION_CACHE_TIMEOUT", 60)
+
+
+def _token_version_key(user_id):
+    return f"blogs:token-version:{user_id}"
+
+
+def _marker(revoked_at):
+    """
+    Microseconds since the epoch of a revocation, 0 for none
+    """
+    return 0 if revoked_at is None else round(revoked_at.timestamp() * 1_000_000)
+
+
+def get_token_version(user_id):
+    """
+    The user's revocation marker, read from the database on cache misses
+    and at least every TOKEN_VERSION_CACHE_TIMEOUT seconds
+    """
+    version = cache.get(_token_version_key(user_id))
+    if version is None:
+        version = _marker(
+            TokenRevocation.objects.filter(user_id=user_id)
+            .values_list("revoked_at", flat=True)
+            .first()
+        )
+        cache.set(_token_version_key(user_id), version, TOKEN_VERSION_CACHE_TIMEOUT)
+    return version
+
+
+async def aget_token_version(user_id):
+    version = await cache.aget(_token_version_key(user_id))
+    if version is None:
+        version = _marker(
+            await TokenRevocation.objects.filter(user_id=user_id)
+            .values_list("revoked_at", flat=True)
+            .afirst()
+        )
+        await cache.aset(
+            _token_version_key(user_id), version, TOKEN_VERSION_CACHE_TIMEOUT
+        )
+    return version
+
+
+def revoke_tokens(user):
+    """
+    Invalidate every token issued to the user so far
+    """
+    revoked_at = timezone.now()
+    TokenRevocation.objects.update_or_create(
+        user_id=user.pk, defaults={"revoked_at": revoked_at}
+    )
+    # Set at once, a rolled back revocation still rejects the old tokens
+    # until the cache entry expires
+    cache.set(
+        _token_version_key(user.pk), _marker(revoked_at), TOKEN_VERSION_CACHE_TIMEOUT
+    )
+
+
+def tokens_for_user(user):
+    """
+    Issue a refresh token whose access tokens carry the user's claims
+    """
+    refresh = RefreshToken.for_user(user)
+    for claim in USER_CLAIMS:
+        refresh[claim] = getattr(user, claim)
+    refresh[TOKEN_VERSION_CLAIM] = get_token_version(user.pk)
+    return refresh
+
+
+def token_user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken("Token contained no recognizable user identification")
+
+
+def check_not_revoked(validated_token, version):
+    """
+    Reject tokens issued before the user's last revocation
+    """
+    if TOKEN_VERSION_CLAIM in validated_token:
+        revoked = validated_token[TOKEN_VERSION_CLAIM] < version
+    else:
+        # Tokens issued without the claim only carry whole seconds
+        revoked = validated_token.get("iat", 0) * 1_000_000 < version
+    if revoked:
+        raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+
+
+def _claims_user(validated_token, user_id):
+    if not all(claim in validated_token for claim in USER_CLAIMS):
+        return None
+    if not validated_token["is_active"]:
+        raise AuthenticationFailed("User is inactive", code="user_inactive")
+    claims = {api_settings.USER_ID_FIELD: user_id}
+    claims.update({claim: validated_token[claim] for claim in USER_CLAIMS})
+    fields = [
+        field.attname
+        for field in User._meta.concrete_fields
+        if field.attname in claims
+    ]
+    return User.from_db(DEFAULT_DB_ALIAS, fields, [claims[name] for name in fields])
+
+
+def user_from_claims(validated_token):
+    """
+    Reject revoked tokens, then build a User from the token claims without
+    querying the database, or return None for tokens issued without the
+    claims. Other fields are deferred and load from the database on first
+    access
+    """
+    user_id = token_user_id(validated_token)
+    check_not_revoked(validated_token, get_token_version(user_id))
+    return _claims_user(validated_token, user_id)
+
+
+async def auser_from_claims(validated_token):
+    user_id = token_user_id(validated_token)
+    check_not_revoked(validated_token, await aget_token_version(user_id))
+    return _claims_user(validated_token, user_id)
+
+
+def _remember_revoking_fields(sender, instance, raw, update_fields, **kwargs):
+    """
+    Flag saves changing the user's password or active status, read from the
+    database since the instance may have been loaded with them deferred
+    """
+    instance._revoke_tokens = False
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not update_fields & set(REVOKING_FIELDS):
+        return
+    saved = User.objects.filter(pk=instance.pk).values(*REVOKING_FIELDS).first()
+    instance._revoke_tokens = saved is not None and any(
+        saved[name] != getattr(instance, name) for name in REVOKING_FIELDS
+    )
+
+
+def _revoke_changed(sender, instance, **kwargs):
+    if getattr(instance, "_revoke_tokens", False):
+        instance._revoke_tokens = False
+        revoke_tokens(instance)
+
+
+def _revoke_deleted(sender, instance, **kwargs):
+    # The TokenRevocation row outlives the user and rejects their tokens
+    revoke_tokens(instance)
+
+
+pre_save.connect(_remember_revoking_fields, sender=User)
+post_save.connect(_revoke_changed, sender=User)
+post_delete.connect(_revoke_deleted, sender=User)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that trusts the signed user claims instead of loading
+    the user on every request
+    """
+
+    def get_user(self, validated_token):
+        user = user_from_claims(validated_token)
+        if user is None:
+            return super().get_user(validated_token)
+        return user
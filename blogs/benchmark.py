@@ -0,0 +1,315 @@
+import logging
+import statistics
+import time
+from itertools import count
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from rest_framework.renderers import JSONRenderer
+from .authentication import tokens_for_user
+from .models import Blog, Like, Comment, Follow, TimelineEntry
+from .serializers import BULK_MAX_ITEMS
+from . import trending
+
+BENCHMARK_PASSWORD = "bench-password-123"
+
+logger = logging.getLogger(__name__)
+
+
+def seed(users=10, blogs=100, likes=1000, comments=1000, batch_size=1000):
+    """
+    Bulk create benchmark data and return the objects the routes need
+    """
+    author = User.objects.create_user(
+        username=f"bench-{time.time_ns()}", password=BENCHMARK_PASSWORD
+    )
+    prefix = author.username
+    user_objs = User.objects.bulk_create(
+        (User(username=f"{prefix}-{i}", password="!") for i in range(users)),
+        batch_size=batch_size,
+    )
+    user_objs.insert(0, author)
+    blog_objs = Blog.objects.bulk_create(
+        (
+            Blog(
+                title=f"Benchmark blog {i}",
+                content="Benchmark content text " * 100,
+                tagline="benchmark django python",
+                author=user_objs[i % len(user_objs)],
+            )
+            for i in range(blogs)
+        ),
+        batch_size=batch_size,
+    )
+    # Every (user, blog) pair is liked at most once
+    likes = min(likes, len(user_objs) * len(blog_objs))
+    Like.objects.bulk_create(
+        (
+            Like(
+                user=user_objs[i % len(user_objs)],
+                blog=blog_objs[i // len(user_objs)],
+            )
+            for i in range(likes)
+        ),
+        batch_size=batch_size,
+    )
+    comment_objs = Comment.objects.bulk_create(
+        (
+            Comment(
+                author=user_objs[i % len(user_objs)],
+                blog=blog_objs[i % len(blog_objs)],
+                text=f"Benchmark comment {i}",
+            )
+            for i in range(comments)
+        ),
+        batch_size=batch_size,
+    )
+    admin = User.objects.create_user(
+        username=f"{prefix}-admin", password=BENCHMARK_PASSWORD, is_staff=True
+    )
+    # The author follows everyone, so their home timeline has every blog
+    Follow.objects.bulk_create(
+        (Follow(follower=author, author=user) for user in user_objs[1:]),
+        batch_size=batch_size,
+    )
+    blog_ids = [blog.pk for blog in blog_objs]
+    seeded = Blog.objects.filter(pk__in=blog_ids)
+    seeded.recount()
+    seeded.update_search_vector()
+    for start in range(0, len(blog_ids), batch_size):
+        TimelineEntry.objects.fan_out(blog_ids[start : start + batch_size])
+        trending.recompute(blog_ids[start : start + batch_size])
+    return {
+        "user": author,
+        "admin": admin,
+        "blog": blog_objs[0],
+        "blog_ids": blog_ids[:BULK_MAX_ITEMS],
+        "comment": comment_objs[0] if comment_objs else None,
+        "followed": user_objs[-1],
+    }
+
+
+def url_names():
+    """
+    Return the names of the API routes, namespaced like "blogs:home"
+    """
+    names = set()
+    resolvers = [(get_resolver("project.urls_api"), "")]
+    while resolvers:
+        resolver, prefix = resolvers.pop()
+        for pattern in resolver.url_patterns:
+            if isinstance(pattern, URLResolver):
+                namespace = pattern.namespace
+                resolvers.append(
+                    (pattern, f"{prefix}{namespace}:" if namespace else prefix)
+                )
+            elif pattern.name:
+                names.add(prefix + pattern.name)
+    return names
+
+
+def routes(seeded):
+    """
+    Return (name, method, prepare, user) for every API route, where
+    prepare(i) builds the path and body of the i-th request outside of the
+    timing, and user sends it
+    """
+    user = seeded["user"]
+    admin = seeded["admin"]
+    blog = seeded["blog"]
+    refresh = str(tokens_for_user(user))
+    unique = count()
+
+    def path(name, *args):
+        return lambda i: (reverse(name, args=args), None)
+
+    def body(name, data, *args):
+        return lambda i: (reverse(name, args=args), data)
+
+    def register(i):
+        username = f"bench-register-{time.time_ns()}-{next(unique)}"
+        data = {"username": username, "password": BENCHMARK_PASSWORD}
+        return reverse("register-user"), data
+
+    def update_blog(i):
+        return reverse("blogs:update-blog", args=(blog.pk,)), {"title": f"Blog {i}"}
+
+    def delete_blog(i):
+        new_blog = Blog.objects.create(
+            title="Benchmark blog", content="Content", tagline="", author=user
+        )
+        return reverse("blogs:delete-blog", args=(new_blog.pk,)), None
+
+    def unlike_blog(i):
+        Like.objects.like(user, blog.pk)
+        return reverse("blogs:like-blog", args=(blog.pk,)), None
+
+    def unlike_blogs(i):
+        Like.objects.like_many(user, seeded["blog_ids"])
+        return reverse("blogs:bulk-like-blogs"), likes
+
+    def delete_comment(i):
+        comment = Comment.objects.create(author=user, blog=blog, text="Comment")
+        return reverse("blogs:delete-comment", args=(comment.pk,)), None
+
+    def thread(i):
+        comment = seeded["comment"] or Comment.objects.create(
+            author=user, blog=blog, text="Comment"
+        )
+        return reverse("blogs:comment-thread", args=(blog.pk, comment.pk)), None
+
+    login = {"username": user.username, "password": BENCHMARK_PASSWORD}
+    new_blog = {"title": "Benchmark blog", "content": "Content", "tagline": "bench"}
+    comment = {"text": "Benchmark comment"}
+    comments = [comment] * BULK_MAX_ITEMS
+    new_blogs = [new_blog] * BULK_MAX_ITEMS
+    likes = [{"blog": blog_id} for blog_id in seeded["blog_ids"]]
+    user_routes = [
+        ("register-user", "POST", register),
+        ("token", "POST", body("token", login)),
+        ("token-refresh", "POST", body("token-refresh", {"refresh": refresh})),
+        ("profile-user", "GET", path("profile-user")),
+        ("user", "GET", path("user", user.pk)),
+        ("user-list", "GET", path("user-list")),
+        ("follow-user", "POST", path("follow-user", seeded["followed"].pk)),
+        ("blogs:home", "GET", path("blogs:home")),
+        ("blogs:async-home", "GET", path("blogs:async-home")),
+        ("blogs:search", "GET", lambda i: (f"{reverse('blogs:search')}?q=blog", None)),
+        ("blogs:trending", "GET", path("blogs:trending")),
+        ("blogs:blog", "GET", path("blogs:blog", blog.pk)),
+        ("blogs:async-blog", "GET", path("blogs:async-blog", blog.pk)),
+        ("blogs:blog-list", "GET", path("blogs:blog-list")),
+        ("blogs:blog-list", "POST", body("blogs:blog-list", new_blog)),
+        ("blogs:update-blog", "PATCH", update_blog),
+        ("blogs:delete-blog", "DELETE", delete_blog),
+        ("blogs:like-blog", "POST", path("blogs:like-blog", blog.pk)),
+        ("blogs:like-blog", "DELETE", unlike_blog),
+        ("blogs:async-like-blog", "POST", path("blogs:async-like-blog", blog.pk)),
+        ("blogs:comment-list", "GET", path("blogs:comment-list", blog.pk)),
+        ("blogs:async-comment-list", "GET", path("blogs:async-comment-list", blog.pk)),
+        ("blogs:comment-list", "POST", body("blogs:comment-list", comment, blog.pk)),
+        ("blogs:comment-threads", "GET", path("blogs:comment-threads", blog.pk)),
+        ("blogs:comment-thread", "GET", thread),
+        ("blogs:delete-comment", "DELETE", delete_comment),
+        ("blogs:bulk-comments", "POST", body("blogs:bulk-comments", comments, blog.pk)),
+        ("blogs:bulk-blogs", "POST", body("blogs:bulk-blogs", new_blogs)),
+        ("blogs:bulk-like-blogs", "POST", body("blogs:bulk-like-blogs", likes)),
+        ("blogs:bulk-like-blogs", "DELETE", unlike_blogs),
+    ]
+    admin_routes = [
+        ("blogs:export", "GET", path("blogs:export")),
+        ("metrics", "GET", path("metrics")),
+    ]
+    return [(*route, user) for route in user_routes] + [
+        (*route, admin) for route in admin_routes
+    ]
+
+
+def run_commit_hooks():
+    """
+    Run the on_commit callbacks registered so far, as committing would. The
+    benchmark runs in a transaction that is rolled back, so they would
+    otherwise never run
+    """
+    callbacks = connection.run_on_commit
+    while callbacks:
+        _, callback, robust = callbacks.pop(0)
+        if not robust:
+            callback()
+            continue
+        try:
+            callback()
+        except Exception:
+            logger.exception("Benchmark on_commit callback failed")
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+def response_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def time_requests(client, method, prepare, headers, requests, warmup):
+    """
+    Send warmup + requests requests and return their statistics and the
+    last response
+    """
+    latencies = []
+    cpu_times = []
+    queries = []
+    sizes = []
+    statuses = set()
+    for i in range(warmup + requests):
+        url, data = prepare(i)
+        run_commit_hooks()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            response = client.generic(
+                method,
+                url,
+                data=b"" if data is None else JSONRenderer().render(data),
+                content_type="application/json",
+                headers=headers,
+            )
+            size = response_size(response)
+            run_commit_hooks()
+            cpu_time = time.process_time() - cpu_start
+            elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        cpu_times.append(cpu_time * 1000)
+        queries.append(len(captured))
+        sizes.append(size)
+        statuses.add(response.status_code)
+    stats = {
+        "requests": requests,
+        "status": sorted(statuses),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "cpu_ms_per_request": round(statistics.mean(cpu_times), 3),
+        "queries_per_request": statistics.mean(queries),
+        "bytes_per_response": statistics.mean(sizes),
+    }
+    return stats, response
+
+
+def measure(seeded, requests=20, warmup=1, only=None):
+    """
+    Time every route with the in-process test client. GET routes answering
+    with an ETag are timed again revalidating it with If-None-Match. The
+    on_commit callbacks of a request are timed with it
+    """
+    run_commit_hooks()
+    client = Client()
+    results = []
+    for name, method, prepare, user in routes(seeded):
+        if only and name not in only:
+            continue
+        access = str(tokens_for_user(user).access_token)
+        headers = {"Authorization": f"Bearer {access}"}
+        stats, response = time_requests(
+            client, method, prepare, headers, requests, warmup
+        )
+        row = {"route": name, "method": method, **stats}
+        if method == "GET" and response.has_header("ETag"):
+            row["revalidated"], _ = time_requests(
+                client,
+                method,
+                prepare,
+                {**headers, "If-None-Match": response["ETag"]},
+                requests,
+                warmup,
+            )
+        results.append(row)
+    return results
@@ -0,0 +1,166 @@
+import threading
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from .models import Blog
+from .serializers import BlogSerializer
+
+BLOG_CACHE_TIMEOUT = getattr(settings, "BLOG_CACHE_TIMEOUT", 300)
+# Seconds a blog's version is kept, longer than the entries cached under it.
+# An expired version is replaced by a new one, which only costs a miss
+BLOG_VERSION_TIMEOUT = getattr(
+    settings, "BLOG_VERSION_TIMEOUT", 2 * BLOG_CACHE_TIMEOUT
+)
+
+
+class CacheStats:
+    """
+    In-process hit/miss counters for the blog cache
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def snapshot(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+stats = CacheStats()
+
+
+def _version_key(blog_id):
+    return f"blogs:blog:{blog_id}:version"
+
+
+def _data_key(blog_id, version, serializer_class):
+    return f"blogs:blog:{blog_id}:{version}:{serializer_class.__name__}"
+
+
+def _get_versions(blog_ids):
+    keys = {_version_key(blog_id): blog_id for blog_id in blog_ids}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid4().hex, BLOG_VERSION_TIMEOUT)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def serialize_blog(blog, serializer_class=BlogSerializer):
+    """
+    Serialize the user-independent part of a blog
+    """
+    data = dict(serializer_class(blog, context={"request": None}).data)
+    data.pop("is_liked")
+    return data
+
+
+def get_blogs(blog_ids, serializer_class=BlogSerializer, queryset=None):
+    """
+    Return {id: data} for the given blog ids, reading through the cache.
+    Misses are loaded from queryset and serialized with serializer_class.
+    Blogs that do not exist are missing from the result
+    """
+    if queryset is None:
+        queryset = Blog.objects.all()
+    versions = _get_versions(blog_ids)
+    keys = {
+        _data_key(blog_id, versions[blog_id], serializer_class): blog_id
+        for blog_id in blog_ids
+    }
+    found = {keys[key]: data for key, data in cache.get_many(keys).items()}
+    missing = [blog_id for blog_id in blog_ids if blog_id not in found]
+    stats.record(len(found), len(missing))
+    if missing:
+        loaded = {
+            blog.pk: serialize_blog(blog, serializer_class)
+            for blog in queryset.filter(pk__in=missing)
+        }
+        cache.set_many(
+            {
+                _data_key(blog_id, versions[blog_id], serializer_class): data
+                for blog_id, data in loaded.items()
+            },
+            BLOG_CACHE_TIMEOUT,
+        )
+        found.update(loaded)
+    return found
+
+
+def invalidate_blog(blog_id):
+    """
+    Move the blog to a new cache version so stale entries are never read again
+    """
+    cache.set(_version_key(blog_id), uuid4().hex, BLOG_VERSION_TIMEOUT)
+
+
+def invalidate_blogs(blog_ids):
+    """
+    invalidate_blog() for several blogs with a single cache round trip
+    """
+    cache.set_many(
+        {_version_key(blog_id): uuid4().hex for blog_id in blog_ids},
+        BLOG_VERSION_TIMEOUT,
+    )
+
+
+async def _aget_versions(blog_ids):
+    keys = {_version_key(blog_id): blog_id for blog_id in blog_ids}
+    found = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            await cache.aadd(key, uuid4().hex, BLOG_VERSION_TIMEOUT)
+        found.update(await cache.aget_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+async def aget_blogs(blog_ids, serializer_class=BlogSerializer, queryset=None):
+    """
+    Async version of get_blogs()
+    """
+    if queryset is None:
+        queryset = Blog.objects.all()
+    versions = await _aget_versions(blog_ids)
+    keys = {
+        _data_key(blog_id, versions[blog_id], serializer_class): blog_id
+        for blog_id in blog_ids
+    }
+    found = {keys[key]: data for key, data in (await cache.aget_many(keys)).items()}
+    missing = [blog_id for blog_id in blog_ids if blog_id not in found]
+    stats.record(len(found), len(missing))
+    if missing:
+        loaded = {
+            blog.pk: serialize_blog(blog, serializer_class)
+            async for blog in queryset.filter(pk__in=missing)
+        }
+        await cache.aset_many(
+            {
+                _data_key(blog_id, versions[blog_id], serializer_class): data
+                for blog_id, data in loaded.items()
+            },
+            BLOG_CACHE_TIMEOUT,
+        )
+        found.update(loaded)
+    return found
+
+
+async def ainvalidate_blog(blog_id):
+    """
+    Async version of invalidate_blog()
+    """
+    await cache.aset(_version_key(blog_id), uuid4().hex, BLOG_VERSION_TIMEOUT)
@@ -0,0 +1,78 @@
+import hashlib
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+
+
+def etag(*parts):
+    """
+    Strong ETag of the values a representation is built from, so it is
+    computed without rendering or hashing the body
+    """
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def blog_validators(data, is_liked, pending=None):
+    """
+    Return (etag, last modified) of a cached blog and the reader's like.
+    The reader's pending like (see blogs.likes) changes the counts without
+    advancing updated_at, so there is no last modified time while they have
+    one
+    """
+    return (
+        etag(
+            data["id"],
+            data["updated_at"],
+            data["num_likes"],
+            data["num_comments"],
+            is_liked,
+            pending,
+        ),
+        parse_datetime(data["updated_at"]) if pending is None else None,
+    )
+
+
+def page_validators(rows, paginator, extra=()):
+    """
+    Return (etag, last modified) of a page of .values() rows with their id
+    and updated_at, and the extra values the response is built from.
+    Replies and counters advance updated_at, and the ids change when rows
+    are added to or deleted from the page. Pages have no
+    last modified time: deleting a row leaves the latest updated_at of the
+    others unchanged, so If-Modified-Since would answer 304
+    """
+    return (
+        etag(
+            [(row["id"], row["updated_at"]) for row in rows],
+            paginator.has_next,
+            paginator.has_previous,
+            extra,
+        ),
+        None,
+    )
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    # Responses depend on the reader, and clients revalidate before reuse
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """
+    Return the 304 Not Modified (or 412 Precondition Failed) response when
+    the request's If-None-Match or If-Modified-Since still match, else None.
+    If-None-Match takes precedence, Last-Modified only has whole seconds
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=None if last_modified is None else int(last_modified.timestamp()),
+    )
+    if response is None:
+        return None
+    return set_validators(response, etag, last_modified)
@@ -0,0 +1,204 @@
+"""
+Optional write buffer for likes, for viral blogs whose like_count row becomes
+a lock hotspot. With LIKE_BUFFER on, like_blog records the reader's intent
+and answers at once. Each process flushes its intents every
+LIKE_BUFFER_INTERVAL seconds, deduplicated to the last intent per reader and
+blog, with batched statements and one like_count update per changed blog.
+
+The latest intent is also kept in the cache, which must be shared by the
+processes like the blog cache, so that:
+- the reader's own reads see their like and its count before the flush,
+  whichever process serves them
+- a flush writes the latest intent, even one recorded by another process
+Other readers see the new counts once the flush commits.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from .cache import aget_blogs, get_blogs, invalidate_blogs
+from .models import Blog, Like
+from . import trending
+
+logger = logging.getLogger(__name__)
+
+# Seconds between flushes, 0 to only flush when flush() is called
+LIKE_BUFFER_INTERVAL = getattr(settings, "LIKE_BUFFER_INTERVAL", 1.0)
+# Seconds an intent stays readable, long enough to outlive its flush
+LIKE_BUFFER_INTENT_TIMEOUT = getattr(settings, "LIKE_BUFFER_INTENT_TIMEOUT", 300)
+
+
+def enabled():
+    """
+    Whether likes are buffered, read on every call so tests can override it
+    """
+    return getattr(settings, "LIKE_BUFFER", False)
+
+
+def _intent_key(user_id, blog_id):
+    return f"blogs:like:{user_id}:{blog_id}"
+
+
+class LikeBuffer:
+    """
+    The intents recorded by this process since its last flush
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._intents = {}
+        self._flusher = None
+
+    def add(self, user_id, blog_id, liked):
+        with self._lock:
+            self._intents[(user_id, blog_id)] = liked
+            if self._flusher is None and LIKE_BUFFER_INTERVAL:
+                self._flusher = threading.Thread(
+                    target=self._run, name="like-buffer", daemon=True
+                )
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(LIKE_BUFFER_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered likes failed")
+            finally:
+                # The flusher thread has its own database connection
+                close_old_connections()
+
+    def flush(self):
+        """
+        Write the buffered intents, returning the number written. Intents
+        that fail to write are kept for the next flush
+        """
+        with self._lock:
+            intents, self._intents = self._intents, {}
+        if not intents:
+            return 0
+        # Another process may have recorded a newer intent
+        keys = {_intent_key(*pair): pair for pair in intents}
+        for key, liked in cache.get_many(keys).items():
+            intents[keys[key]] = liked
+        try:
+            with transaction.atomic():
+                added, deleted = Like.objects.apply_intents(intents)
+                for blog_id, count in added.items():
+                    Blog.objects.filter(pk=blog_id).bump_trending(
+                        trending.event_score(trending.TRENDING_LIKE_WEIGHT * count)
+                    )
+        except Exception:
+            with self._lock:
+                for pair, liked in intents.items():
+                    self._intents.setdefault(pair, liked)
+            raise
+        invalidate_blogs(added.keys() | deleted.keys())
+        return len(intents)
+
+
+buffer = LikeBuffer()
+
+
+def pending(user, blog_ids):
+    """
+    Return {blog id: liked} of the reader's intents that may not be written
+    yet, empty when likes are not buffered
+    """
+    if not enabled() or not blog_ids:
+        return {}
+    keys = {_intent_key(user.pk, blog_id): blog_id for blog_id in blog_ids}
+    return {keys[key]: liked for key, liked in cache.get_many(keys).items()}
+
+
+async def apending(user, blog_ids):
+    if not enabled() or not blog_ids:
+        return {}
+    keys = {_intent_key(user.pk, blog_id): blog_id for blog_id in blog_ids}
+    return {keys[key]: liked for key, liked in (await cache.aget_many(keys)).items()}
+
+
+def apply_pending(data, is_liked, liked):
+    """
+    Return (data, is_liked) of a blog read from the database, as seen by a
+    reader whose pending intent is liked (None without one)
+    """
+    if liked is None or liked == is_liked:
+        return data, is_liked
+    return {**data, "num_likes": data["num_likes"] + (1 if liked else -1)}, liked
+
+
+def apply_pending_rows(user, liked_by_user, data):
+    """
+    Apply the reader's pending likes to serialized blog rows, given the
+    (blog id, liked flag) read from the database for each row
+    """
+    intents = pending(user, [blog_id for blog_id, is_liked in liked_by_user])
+    if not intents:
+        return data
+    for (blog_id, is_liked), row in zip(liked_by_user, data):
+        liked = intents.get(blog_id)
+        if liked is None or liked == is_liked:
+            continue
+        if "num_likes" in row:
+            row["num_likes"] += 1 if liked else -1
+        if "is_liked" in row:
+            row["is_liked"] = liked
+    return data
+
+
+def record(user, blog_id, liked):
+    """
+    Buffer the reader's like (or unlike) of a blog, returning the like count
+    they see afterwards, or None if the blog does not exist or they unlike a
+    blog they have not liked. Reads only, the write waits for the flush
+    """
+    data = get_blogs([blog_id]).get(blog_id)
+    if data is None:
+        return None
+    is_liked = Like.objects.filter(user=user, blog_id=blog_id).exists()
+    data, current = apply_pending(
+        data, is_liked, pending(user, [blog_id]).get(blog_id)
+    )
+    if not liked and not current:
+        return None
+    if liked != current:
+        cache.set(_intent_key(user.pk, blog_id), liked, LIKE_BUFFER_INTENT_TIMEOUT)
+        buffer.add(user.pk, blog_id, liked)
+    return data["num_likes"] + (liked - current)
+
+
+async def arecord(user, blog_id, liked):
+    data = (await aget_blogs([blog_id])).get(blog_id)
+    if data is None:
+        return None
+    is_liked = await Like.objects.filter(user=user, blog_id=blog_id).aexists()
+    data, current = apply_pending(
+        data, is_liked, (await apending(user, [blog_id])).get(blog_id)
+    )
+    if not liked and not current:
+        return None
+    if liked != current:
+        await cache.aset(
+            _intent_key(user.pk, blog_id), liked, LIKE_BUFFER_INTENT_TIMEOUT
+        )
+        buffer.add(user.pk, blog_id, liked)
+    return data["num_likes"] + (liked - current)
+
+
+def written(user, blog_ids, liked):
+    """
+    Record likes written directly by the bulk endpoint as the reader's
+    latest intents, so buffered older ones do not undo them
+    """
+    if enabled() and blog_ids:
+        cache.set_many(
+            {_intent_key(user.pk, blog_id): liked for blog_id in blog_ids},
+            LIKE_BUFFER_INTENT_TIMEOUT,
+        )
@@ -0,0 +1,102 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.connection import ConnectionDoesNotExist
+from django.db.utils import ConnectionHandler
+from blogs.benchmark import percentile
+from project.db.pooled.base import ConnectionPool, close_pools
+
+# DB_POOL mode -> settings applied on top of the configured database
+MODES = {
+    "none": {
+        "ENGINE": "django.db.backends.postgresql",
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": False,
+    },
+    "persistent": {
+        "ENGINE": "django.db.backends.postgresql",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+    },
+    "pool": {
+        "ENGINE": "project.db.pooled",
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": False,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request database latency without connection reuse, with "
+        "persistent connections and with the connection pool"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--mode", action="append", choices=list(MODES))
+
+    def handle(self, *args, **options):
+        try:
+            settings_dict = connections.settings[options["database"]]
+        except ConnectionDoesNotExist as error:
+            raise CommandError(error)
+        if not settings_dict["ENGINE"].startswith(
+            ("django.db.backends.postgresql", "project.db.pooled")
+        ):
+            raise CommandError("Connection reuse is only benchmarked on PostgreSQL")
+        options_dict = {
+            key: value
+            for key, value in settings_dict["OPTIONS"].items()
+            if key != "pool"
+        }
+        self.stdout.write(f"{'mode':<12}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+        modes = options["mode"] or list(MODES)
+        if "pool" in modes and ConnectionPool is None:
+            raise CommandError("The pool mode requires the psycopg-pool package")
+        for mode in modes:
+            # ConnectionHandler requires a "default" alias
+            handler = ConnectionHandler(
+                {
+                    "default": {
+                        **settings_dict,
+                        **MODES[mode],
+                        "OPTIONS": {
+                            **options_dict,
+                            **({"pool": {"min_size": 1}} if mode == "pool" else {}),
+                        },
+                    }
+                }
+            )
+            latencies = self.measure(handler["default"], options["requests"])
+            self.stdout.write(
+                f"{mode:<12}{percentile(latencies, 50):>10.3f}"
+                f"{percentile(latencies, 95):>10.3f}"
+                f"{statistics.mean(latencies):>10.3f}"
+            )
+            handler.close_all()
+        close_pools()
+
+    def measure(self, connection, requests):
+        """
+        Run one small query per simulated request, reusing or closing the
+        connection at the request boundaries like close_old_connections()
+        """
+        # Warm up: open the pool or the persistent connection
+        self.query(connection)
+        connection.close_if_unusable_or_obsolete()
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            connection.close_if_unusable_or_obsolete()
+            self.query(connection)
+            connection.close_if_unusable_or_obsolete()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    def query(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
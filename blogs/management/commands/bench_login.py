@@ -0,0 +1,56 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand, CommandError
+from blogs import passwords
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare password verification throughput on the request threads "
+        "with the login process pool"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=64)
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Concurrent request threads"
+        )
+
+    def handle(self, *args, **options):
+        logins = options["logins"]
+        encoded = hashers.make_password("bench-password")
+        cores = os.cpu_count()
+        pool_cores = min(passwords.LOGIN_HASH_WORKERS or 1, cores)
+
+        def inline(i):
+            return hashers.check_password("bench-password", encoded)
+
+        def pooled(i):
+            return passwords.run_hasher(
+                hashers.check_password, "bench-password", encoded
+            )
+
+        # Start the pool before timing so process startup is not measured
+        pooled(0)
+        self.stdout.write(
+            f"{cores} cores, {options['concurrency']} request threads, "
+            f"{passwords.LOGIN_HASH_WORKERS} hash workers"
+        )
+        self.stdout.write(f"{'path':<10}{'logins/s':>10}{'per core':>10}")
+        for name, function, used_cores in [
+            ("inline", inline, cores),
+            ("pool", pooled, pool_cores),
+        ]:
+            with ThreadPoolExecutor(options["concurrency"]) as executor:
+                start = time.perf_counter()
+                results = list(executor.map(function, range(logins)))
+                elapsed = time.perf_counter() - start
+            if not all(results):
+                raise CommandError("Password verification failed")
+            throughput = logins / elapsed
+            self.stdout.write(
+                f"{name:<10}{throughput:>10.1f}{throughput / used_cores:>10.2f}"
+            )
+        self.stdout.write(f"pool stats: {passwords.stats.snapshot()}")
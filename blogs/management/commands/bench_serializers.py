@@ -0,0 +1,85 @@
+import timeit
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from blogs.models import Blog, Comment
+from blogs.renderers import FastJSONRenderer
+from blogs.serializers import BlogSerializer, CommentSerializer, UserSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ModelSerializer + JSONRenderer with the .values() fast path. "
+        "Rows are seeded in a transaction that is rolled back afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = options["sizes"]
+        with transaction.atomic():
+            self.seed(max(sizes))
+            self.stdout.write(
+                f"{'serializer':<12}{'rows':>6}{'slow ms':>10}"
+                f"{'fast ms':>10}{'speedup':>9}"
+            )
+            for size in sizes:
+                for name, serializer_class, queryset in self.querysets(size):
+                    slow, fast = self.measure(
+                        serializer_class, queryset, options["repeat"]
+                    )
+                    self.stdout.write(
+                        f"{name:<12}{size:>6}{slow * 1000:>10.2f}"
+                        f"{fast * 1000:>10.2f}{slow / fast:>8.1f}x"
+                    )
+            transaction.set_rollback(True)
+
+    def seed(self, size):
+        users = User.objects.bulk_create(
+            User(username=f"bench-user-{i}", password="!") for i in range(size)
+        )
+        blogs = Blog.objects.bulk_create(
+            Blog(
+                title=f"Bench blog {i}",
+                content="Content text " * 200,
+                tagline="bench",
+                author=users[0],
+            )
+            for i in range(size)
+        )
+        Comment.objects.bulk_create(
+            Comment(author=users[0], blog=blogs[0], text=f"Comment {i}")
+            for i in range(size)
+        )
+
+    def querysets(self, size):
+        user = User.objects.filter(username="bench-user-0").get()
+        blogs = Blog.objects.filter(tagline="bench").for_user(user).order_by("pk")
+        comments = Comment.objects.filter(author=user).order_by("pk")
+        users = User.objects.filter(username__startswith="bench-user-").order_by("pk")
+        return [
+            ("blog", BlogSerializer, blogs[:size]),
+            ("comment", CommentSerializer, comments[:size]),
+            ("user", UserSerializer, users[:size]),
+        ]
+
+    def measure(self, serializer_class, queryset, repeat):
+        def slow():
+            serializer = serializer_class(
+                queryset.all(), many=True, context={"request": None}
+            )
+            return JSONRenderer().render(serializer.data)
+
+        def fast():
+            fields = serializer_class.values_fields()
+            rows = queryset.values(*serializer_class.values_columns(fields))
+            data = serializer_class.serialize_values(rows, fields)
+            return FastJSONRenderer().render(data)
+
+        return (
+            min(timeit.repeat(slow, number=1, repeat=repeat)),
+            min(timeit.repeat(fast, number=1, repeat=repeat)),
+        )
@@ -0,0 +1,77 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter per sample, so imports are measured cold
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+os.environ["DJANGO_SETTINGS_MODULE"] = sys.argv[1]
+import django
+django.setup()
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client
+from django.urls import reverse
+WSGIHandler()
+url = reverse("blogs:home")
+cold_start = time.perf_counter() - start
+# An unauthenticated request runs the whole middleware and DRF stack
+# without touching the database
+client = Client(HTTP_HOST="localhost")
+client.get(url)
+start = time.perf_counter()
+for _ in range(int(sys.argv[2])):
+    status = client.get(url).status_code
+per_request = (time.perf_counter() - start) / int(sys.argv[2])
+print(
+    json.dumps(
+        {"cold_start": cold_start, "per_request": per_request, "status": status}
+    )
+)
+"""
+
+
+class Command(BaseCommand):
+    help = "Compare the cold start and per-request cost of settings profiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            action="append",
+            help="Settings module to compare, repeat for several",
+        )
+        parser.add_argument(
+            "--runs", type=int, default=5, help="Processes per profile"
+        )
+        parser.add_argument("--requests", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        profiles = options["profile"] or ["project.settings", "project.settings_api"]
+        self.stdout.write(f"{'profile':<24}{'cold start ms':>16}{'request us':>14}")
+        for profile in profiles:
+            samples = [
+                self.probe(profile, options["requests"])
+                for _ in range(options["runs"])
+            ]
+            cold_start = statistics.median(sample["cold_start"] for sample in samples)
+            per_request = statistics.median(sample["per_request"] for sample in samples)
+            self.stdout.write(
+                f"{profile:<24}{cold_start * 1000:>16.1f}{per_request * 1e6:>14.1f}"
+            )
+
+    def probe(self, profile, requests):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE, profile, str(requests)],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        )
+        if result.returncode:
+            raise CommandError(f"{profile} failed:\n{result.stderr}")
+        sample = json.loads(result.stdout.splitlines()[-1])
+        if sample["status"] != 401:
+            raise CommandError(f"{profile} answered {sample['status']}, expected 401")
+        return sample
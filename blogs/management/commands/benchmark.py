@@ -0,0 +1,85 @@
+import json
+import platform
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from blogs import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed benchmark data and measure latency percentiles, queries and "
+        "response size for every API route, printing the results as JSON. "
+        "All data is created in a transaction that is rolled back afterwards"
+    )
+    notes = [
+        "Requests run in one transaction that is rolled back afterwards. "
+        "Their on_commit callbacks (tasks, timeline fan-out, cache "
+        "invalidation) are run and timed with them, but the commit itself "
+        "is not measured",
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--blogs", type=int, default=100)
+        parser.add_argument("--likes", type=int, default=1000)
+        parser.add_argument("--comments", type=int, default=1000)
+        parser.add_argument(
+            "--requests", type=int, default=20, help="Timed requests per route"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=1, help="Untimed requests per route"
+        )
+        parser.add_argument(
+            "--route", action="append", help="Only measure the given route names"
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        volumes = {
+            name: options[name] for name in ["users", "blogs", "likes", "comments"]
+        }
+        # Use a private cache, accept the test client's host name and do not
+        # run out of throttle quota
+        with override_settings(
+            ALLOWED_HOSTS=["testserver"],
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}},
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                    "LOCATION": "benchmark",
+                }
+            },
+        ), transaction.atomic():
+            seeded = benchmark.seed(**volumes)
+            benchmarked = {route[0] for route in benchmark.routes(seeded)}
+            missing = sorted(benchmark.url_names() - benchmarked)
+            results = benchmark.measure(
+                seeded,
+                requests=options["requests"],
+                warmup=options["warmup"],
+                only=options["route"],
+            )
+            transaction.set_rollback(True)
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "volumes": volumes,
+            "requests": options["requests"],
+            "routes": results,
+            "missing_routes": missing,
+            "notes": self.notes,
+        }
+        if missing:
+            self.stderr.write(
+                self.style.WARNING(f"Routes not benchmarked: {', '.join(missing)}")
+            )
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
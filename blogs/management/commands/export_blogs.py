@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from blogs import export
+
+
+class Command(BaseCommand):
+    help = "Stream blogs and comments as newline-delimited JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            action="append",
+            choices=list(export.EXPORT_TYPES),
+            help="Type to export, repeat for several, defaults to all",
+        )
+        parser.add_argument(
+            "--since", help="Only rows created at or after this ISO datetime"
+        )
+        parser.add_argument(
+            "--since-id",
+            help="With --since, only rows after this id at the --since datetime",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=export.EXPORT_CHUNK_SIZE
+        )
+        parser.add_argument("--output", help="File to write instead of stdout")
+
+    def handle(self, *args, **options):
+        try:
+            since, since_id = export.parse_since(options["since"], options["since_id"])
+        except ValueError as error:
+            raise CommandError(error)
+        lines = export.export_lines(
+            options["type"], since, since_id, options["chunk_size"]
+        )
+        count = 0
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for line in lines:
+                    output.write(line)
+                    count += 1
+        else:
+            for line in lines:
+                self.stdout.write(line.decode(), ending="")
+                count += 1
+        self.stderr.write(f"Exported {count} rows")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from blogs import trending
+from blogs.models import Blog
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the trend_score column of blogs from their recent likes and "
+        "comments, run periodically to drop unliked and deleted engagement"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of blogs updated per transaction",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        now = timezone.now()
+        ids = Blog.objects.order_by("pk").values_list("pk", flat=True)
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                updated += trending.recompute(batch, now)
+            last_id = batch[-1]
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {updated} blogs"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blogs.models import Blog
+
+
+class Command(BaseCommand):
+    help = "Recompute the like_count and comment_count columns of blogs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of blogs updated per transaction",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        ids = Blog.objects.order_by("pk").values_list("pk", flat=True)
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                updated += Blog.objects.filter(
+                    pk__gte=batch[0], pk__lte=batch[-1]
+                ).recount()
+            last_id = batch[-1]
+        self.stdout.write(self.style.SUCCESS(f"Recounted {updated} blogs"))
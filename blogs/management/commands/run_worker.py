@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from blogs.tasks import DatabaseBackend
+
+
+class Command(BaseCommand):
+    help = "Run the tasks queued by the database task backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no task is due instead of polling",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when no task is due",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Tasks run between checks for shutdown",
+        )
+
+    def handle(self, *args, **options):
+        backend = DatabaseBackend()
+        total = 0
+        try:
+            while True:
+                done = backend.run_pending(options["batch_size"])
+                total += done
+                if done:
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Ran {total} tasks"))
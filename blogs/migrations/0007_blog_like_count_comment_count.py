@@ -0,0 +1,48 @@
+# Generated by Django 5.0.3 on 2026-10-18 08:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Blog = apps.get_model('blogs', 'Blog')
+    Like = apps.get_model('blogs', 'Like')
+    Comment = apps.get_model('blogs', 'Comment')
+    likes = (
+        Like.objects.filter(blog=OuterRef('pk'))
+        .values('blog')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    comments = (
+        Comment.objects.filter(blog=OuterRef('pk'))
+        .values('blog')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Blog.objects.update(
+        like_count=Coalesce(Subquery(likes), 0),
+        comment_count=Coalesce(Subquery(comments), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0006_blog_blogs_blog_created_5b2cf2_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
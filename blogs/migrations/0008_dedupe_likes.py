@@ -0,0 +1,50 @@
+# Generated by Django 5.0.3 on 2026-10-18 08:14
+
+from functools import reduce
+from operator import or_
+
+from django.db import migrations
+from django.db.models import Count, F, Min, Q
+
+BATCH_SIZE = 1000
+
+
+def dedupe_likes(apps, schema_editor):
+    Like = apps.get_model('blogs', 'Like')
+    Blog = apps.get_model('blogs', 'Blog')
+    duplicates = (
+        Like.objects.values('user_id', 'blog_id')
+        .annotate(total=Count('id'), keep=Min('id'))
+        .filter(total__gt=1)
+        .order_by('keep')
+    )
+    last_keep = 0
+    while True:
+        batch = list(duplicates.filter(keep__gt=last_keep)[:BATCH_SIZE])
+        if not batch:
+            break
+        extra_rows = reduce(
+            or_,
+            (
+                Q(user_id=row['user_id'], blog_id=row['blog_id']) & ~Q(id=row['keep'])
+                for row in batch
+            ),
+        )
+        Like.objects.filter(extra_rows).delete()
+        # Every duplicate row was counted once in like_count
+        for row in batch:
+            Blog.objects.filter(pk=row['blog_id']).update(
+                like_count=F('like_count') - (row['total'] - 1)
+            )
+        last_keep = batch[-1]['keep']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0007_blog_like_count_comment_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_likes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.3 on 2026-10-18 08:22
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def fill_search_vectors(apps, schema_editor):
+    # The stored vectors are PostgreSQL only, other databases use the
+    # substring fallback in BlogQuerySet.search()
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Blog = apps.get_model('blogs', 'Blog')
+    Blog.objects.update(
+        search_vector=SearchVector('title', weight='A', config='english')
+        + SearchVector('tagline', weight='B', config='english')
+        + SearchVector('content', weight='C', config='english')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0009_like_unique_like'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='blog',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='blogs_blog_search_vector_gin'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.3 on 2026-10-18 09:03
+
+import django.db.models.functions.datetime
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_like_created_at(apps, schema_editor):
+    # The time of existing likes is unknown, their blog's creation is the
+    # earliest it can be and keeps them out of recent trending windows
+    Like = apps.get_model("blogs", "Like")
+    Blog = apps.get_model("blogs", "Blog")
+    Like.objects.update(
+        created_at=models.Subquery(
+            Blog.objects.filter(pk=models.OuterRef("blog_id")).values("created_at")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0013_comment_threads'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='trend_score',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='like',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_like_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='like',
+            name='created_at',
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now()),
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(condition=models.Q(('trend_score__isnull', False)), fields=['-trend_score', '-id'], name='blogs_blog_trending'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['blog', 'created_at'], name='blogs_like_blog_id_7b7a3a_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.3 on 2026-10-18 09:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def start_at_created_at(apps, schema_editor):
+    for name in ["Blog", "Comment"]:
+        model = apps.get_model("blogs", name)
+        model.objects.update(updated_at=models.F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blogs', '0014_trending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blog',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(start_at_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from rest_framework.response import Response
+from . import conditional
+
+
+class ValuesListMixin:
+    """
+    Render list responses through the serializer's .values() fast path when
+    fast_serialization is enabled on the view
+    """
+
+    fast_serialization = False
+    # Answer conditional requests from the page rows' id and updated_at
+    # before serializing them
+    conditional = False
+    # Columns loaded besides the requested fields, for serialize_page()
+    extra_columns = ()
+
+    def validator_parts(self, page):
+        """
+        Values the response is built from besides the page rows, part of the
+        conditional validators
+        """
+        return ()
+
+    def serialize_page(self, page, fields):
+        return self.get_serializer_class().serialize_values(page, fields)
+
+    def list(self, request, *args, **kwargs):
+        if not self.fast_serialization:
+            return super().list(request, *args, **kwargs)
+        serializer_class = self.get_serializer_class()
+        fields = serializer_class.values_fields(request)
+        columns = serializer_class.values_columns(fields)
+        # The paginator reads its cursor position from the ordering columns
+        ordering = getattr(self.paginator, "ordering", None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        columns += [name.lstrip("-") for name in ordering]
+        columns += self.extra_columns
+        if self.conditional:
+            columns += ["id", "updated_at"]
+        queryset = self.filter_queryset(self.get_queryset()).values(*set(columns))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            if self.conditional:
+                etag, last_modified = conditional.page_validators(
+                    page, self.paginator, self.validator_parts(page)
+                )
+                response = conditional.not_modified(request, etag, last_modified)
+                if response is not None:
+                    return response
+            data = self.serialize_page(page, fields)
+            response = self.get_paginated_response(data)
+            if self.conditional:
+                conditional.set_validators(response, etag, last_modified)
+            return response
+        return Response(serializer_class.serialize_values(queryset, fields))
@@ -1,31 +1,653 @@
-from django.db import models
+import math
+from collections import Counter
+from django.db import connection, models, transaction
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+    Window,
+)
+from django.db.models.functions import (
+    Coalesce,
+    Greatest,
+    Least,
+    Ln,
+    Now,
+    Power,
+    RowNumber,
+    Substr,
+)
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField,
+)
+
+EXCERPT_LENGTH = 200
+SEARCH_CONFIG = "english"
+# Levels of replies below a top-level comment, bounded so Comment.path fits
+# its column
+COMMENT_MAX_DEPTH = 20
 
 
 # Create your models here.
 
 
+class BlogQuerySet(models.QuerySet):
+    def with_is_liked(self, user):
+        if user is None or not user.is_authenticated:
+            return self.annotate(liked_by_user=Value(False))
+        return self.annotate(
+            liked_by_user=Exists(
+                Like.objects.filter(blog=OuterRef("pk"), user=user)
+            )
+        )
+
+    def with_excerpt(self):
+        return self.annotate(excerpt=Substr("content", 1, EXCERPT_LENGTH))
+
+    def for_user(self, user):
+        """
+        Annotate the user's liked flag in the same query as the blogs
+        """
+        return self.with_is_liked(user)
+
+    def update_search_vector(self):
+        """
+        Refresh the stored search vector, which only exists on PostgreSQL
+        """
+        if connection.vendor != "postgresql":
+            return 0
+        return self.update(
+            search_vector=SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("tagline", weight="B", config=SEARCH_CONFIG)
+            + SearchVector("content", weight="C", config=SEARCH_CONFIG)
+        )
+
+    def search(self, text):
+        """
+        Filter blogs matching text and annotate their relevance as rank.
+        PostgreSQL uses the GIN-indexed search vector, other databases fall
+        back to a substring scan
+        """
+        if connection.vendor == "postgresql":
+            query = SearchQuery(text, search_type="websearch", config=SEARCH_CONFIG)
+            return self.filter(search_vector=query).annotate(
+                rank=SearchRank(F("search_vector"), query)
+            )
+        return self.filter(
+            Q(title__icontains=text)
+            | Q(tagline__icontains=text)
+            | Q(content__icontains=text)
+        ).annotate(
+            rank=Case(
+                When(title__icontains=text, then=Value(1.0)),
+                When(tagline__icontains=text, then=Value(0.4)),
+                default=Value(0.2),
+                output_field=models.FloatField(),
+            )
+        )
+
+    def bump_trending(self, score):
+        """
+        Add an engagement event to trend_score. The column holds the log2 of
+        the sum of 2 ** score over the blog's events, where an event's score
+        grows with its time (see blogs.trending), so adding one is a
+        log-sum-exp that cannot overflow
+        """
+        score = Value(score, output_field=models.FloatField())
+        high = Greatest("trend_score", score)
+        low = Least("trend_score", score)
+        return self.update(
+            trend_score=Case(
+                When(trend_score__isnull=True, then=score),
+                default=high + Ln(1 + Power(2, low - high)) / math.log(2),
+                output_field=models.FloatField(),
+            )
+        )
+
+    def add_likes(self, counts):
+        """
+        Add counts[id] to the like_count of each blog with one UPDATE
+        """
+        if not counts:
+            return 0
+        return self.filter(pk__in=counts).update(
+            like_count=F("like_count")
+            + Case(*(When(pk=pk, then=Value(n)) for pk, n in counts.items())),
+            updated_at=timezone.now(),
+        )
+
+    def trending(self):
+        """
+        Blogs with recent engagement, hottest first, read from the partial
+        trend_score index
+        """
+        return self.filter(trend_score__isnull=False).order_by("-trend_score", "-id")
+
+    def recount(self):
+        """
+        Recompute like_count and comment_count from the Like and Comment tables
+        """
+        likes = (
+            Like.objects.filter(blog=OuterRef("pk"))
+            .values("blog")
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        comments = (
+            Comment.objects.filter(blog=OuterRef("pk"))
+            .values("blog")
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        return self.update(
+            like_count=Coalesce(Subquery(likes), 0),
+            comment_count=Coalesce(Subquery(comments), 0),
+        )
+
+
 class Blog(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also advanced by the like and comment counter updates
+    updated_at = models.DateTimeField(auto_now=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="blogs")
     tagline = models.TextField()
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Time-decayed engagement in log2 space, None without recent engagement
+    trend_score = models.FloatField(null=True, editable=False)
+
+    objects = BlogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["author", "created_at"]),
+            # A plain index on other databases, where search_vector stays null
+            GinIndex(fields=["search_vector"], name="blogs_blog_search_vector_gin"),
+            models.Index(
+                fields=["-trend_score", "-id"],
+                name="blogs_blog_trending",
+                condition=Q(trend_score__isnull=False),
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.title
 
     def num_likes(self):
-        return self.likes.count()
+        return self.like_count
+
+    def num_comments(self):
+        return self.comment_count
+
+
+def _now_param():
+    """
+    The current time as a raw SQL parameter, the way the ORM would store it
+    """
+    return connection.ops.adapt_datetimefield_value(timezone.now())
+
+
+class LikeQuerySet(models.QuerySet):
+    def _apply(self, statement, params, blog_id, sign, trend_score=None):
+        """
+        Run the like/unlike statement and shift the blog's like_count by the
+        number of affected rows, returning (affected rows, new like count).
+        A new like adds trend_score to the blog's trend_score when given
+        """
+        blog_table = connection.ops.quote_name(Blog._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(statement, params)
+            affected = cursor.rowcount
+            if affected:
+                cursor.execute(
+                    f"UPDATE {blog_table} "
+                    "SET like_count = like_count + %s, updated_at = %s "
+                    "WHERE id = %s RETURNING like_count",
+                    [sign * affected, _now_param(), blog_id],
+                )
+            else:
+                cursor.execute(
+                    f"SELECT like_count FROM {blog_table} WHERE id = %s", [blog_id]
+                )
+            row = cursor.fetchone()
+            if row is None:
+                transaction.set_rollback(True)
+                return affected, None
+            if affected and sign > 0 and trend_score is not None:
+                Blog.objects.filter(pk=blog_id).bump_trending(trend_score)
+        return affected, row[0]
+
+    def _apply_many(self, statement, params, sign, trend_score=None):
+        """
+        Run a like/unlike statement that returns the affected blog ids and
+        shift their like counts, returning {blog id: new like count}
+        """
+        blog_table = connection.ops.quote_name(Blog._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(statement, params)
+            blog_ids = [row[0] for row in cursor.fetchall()]
+            if not blog_ids:
+                return {}
+            placeholders = ", ".join(["%s"] * len(blog_ids))
+            cursor.execute(
+                f"UPDATE {blog_table} "
+                "SET like_count = like_count + %s, updated_at = %s "
+                f"WHERE id IN ({placeholders}) RETURNING id, like_count",
+                [sign, _now_param(), *blog_ids],
+            )
+            like_counts = dict(cursor.fetchall())
+            if sign > 0 and trend_score is not None:
+                Blog.objects.filter(pk__in=blog_ids).bump_trending(trend_score)
+            return like_counts
+
+    def like(self, user, blog_id, trend_score=None):
+        """
+        Idempotently like a blog with INSERT ... ON CONFLICT DO NOTHING,
+        returning the new like count or None if the blog does not exist
+        """
+        like_table = connection.ops.quote_name(self.model._meta.db_table)
+        affected, like_count = self._apply(
+            f"INSERT INTO {like_table} (user_id, blog_id) VALUES (%s, %s) "
+            "ON CONFLICT (user_id, blog_id) DO NOTHING",
+            [user.pk, blog_id],
+            blog_id,
+            1,
+            trend_score,
+        )
+        return like_count
+
+    def like_many(self, user, blog_ids, trend_score=None):
+        """
+        Idempotently like several blogs with one INSERT ... SELECT, returning
+        {blog id: new like count} for the blogs that exist
+        """
+        if not blog_ids:
+            return {}
+        like_table = connection.ops.quote_name(self.model._meta.db_table)
+        blog_table = connection.ops.quote_name(Blog._meta.db_table)
+        placeholders = ", ".join(["%s"] * len(blog_ids))
+        like_counts = self._apply_many(
+            f"INSERT INTO {like_table} (user_id, blog_id) "
+            f"SELECT %s, id FROM {blog_table} WHERE id IN ({placeholders}) "
+            "ON CONFLICT (user_id, blog_id) DO NOTHING RETURNING blog_id",
+            [user.pk, *blog_ids],
+            1,
+            trend_score,
+        )
+        # Blogs the user had already liked keep their count
+        liked_before = set(blog_ids) - like_counts.keys()
+        if liked_before:
+            like_counts.update(
+                Blog.objects.filter(pk__in=liked_before).values_list(
+                    "pk", "like_count"
+                )
+            )
+        return like_counts
+
+    def unlike(self, user, blog_id):
+        """
+        Delete a like with a single DELETE, returning the new like count or
+        None if the user had not liked the blog
+        """
+        like_table = connection.ops.quote_name(self.model._meta.db_table)
+        affected, like_count = self._apply(
+            f"DELETE FROM {like_table} WHERE user_id = %s AND blog_id = %s",
+            [user.pk, blog_id],
+            blog_id,
+            -1,
+        )
+        if not affected:
+            return None
+        return like_count
+
+    def unlike_many(self, user, blog_ids):
+        """
+        Delete the user's likes from several blogs with one DELETE, returning
+        {blog id: new like count} for the blogs the user had liked
+        """
+        if not blog_ids:
+            return {}
+        like_table = connection.ops.quote_name(self.model._meta.db_table)
+        placeholders = ", ".join(["%s"] * len(blog_ids))
+        return self._apply_many(
+            f"DELETE FROM {like_table} "
+            f"WHERE user_id = %s AND blog_id IN ({placeholders}) RETURNING blog_id",
+            [user.pk, *blog_ids],
+            -1,
+        )
+
+    def apply_intents(self, intents, batch_size=500):
+        """
+        Write buffered like intents {(user id, blog id): liked} with one
+        INSERT ... ON CONFLICT DO NOTHING and one DELETE per batch, then shift
+        the like_count of each changed blog once. Intents for deleted blogs
+        or users are dropped. Returns (likes added, likes deleted) per blog
+        """
+        like_table = connection.ops.quote_name(self.model._meta.db_table)
+        blog_table = connection.ops.quote_name(Blog._meta.db_table)
+        user_table = connection.ops.quote_name(User._meta.db_table)
+        liked = [pair for pair, value in intents.items() if value]
+        unliked = [pair for pair, value in intents.items() if not value]
+        added, deleted = Counter(), Counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(liked), batch_size):
+                pairs = liked[start : start + batch_size]
+                values = ", ".join(["(%s, %s)"] * len(pairs))
+                # WHERE true keeps SQLite from parsing ON CONFLICT as a join
+                cursor.execute(
+                    f"INSERT INTO {like_table} (user_id, blog_id) "
+                    f"SELECT v.column1, v.column2 FROM (VALUES {values}) AS v "
+                    f"JOIN {blog_table} b ON b.id = v.column2 "
+                    f"JOIN {user_table} u ON u.id = v.column1 WHERE true "
+                    "ON CONFLICT (user_id, blog_id) DO NOTHING RETURNING blog_id",
+                    [value for pair in pairs for value in pair],
+                )
+                added.update(row[0] for row in cursor.fetchall())
+            for start in range(0, len(unliked), batch_size):
+                pairs = unliked[start : start + batch_size]
+                values = ", ".join(["(%s, %s)"] * len(pairs))
+                cursor.execute(
+                    f"DELETE FROM {like_table} "
+                    f"WHERE (user_id, blog_id) IN (VALUES {values}) "
+                    "RETURNING blog_id",
+                    [value for pair in pairs for value in pair],
+                )
+                deleted.update(row[0] for row in cursor.fetchall())
+            changes = Counter(added)
+            changes.subtract(deleted)
+            Blog.objects.add_likes(
+                {blog_id: n for blog_id, n in changes.items() if n}
+            )
+        return added, deleted
 
 
 class Like(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name="likes")
+    # Set by the database, the like statements are raw SQL
+    created_at = models.DateTimeField(db_default=Now())
+
+    objects = LikeQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "blog"], name="unique_like"),
+        ]
+        indexes = [
+            models.Index(fields=["blog", "created_at"]),
+        ]
+
+
+class CommentQuerySet(models.QuerySet):
+    def top_level(self):
+        return self.filter(path="")
+
+    def thread(self, comment):
+        """
+        The comment and all the replies below it
+        """
+        return self.filter(Q(pk=comment.pk) | Q(path__startswith=comment.child_path))
+
+    def parents(self, blog_id, parent_ids):
+        """
+        Return {id: comment} of the comments of the blog that can be replied
+        to, with only the columns needed to place the replies
+        """
+        comments = self.filter(blog_id=blog_id, pk__in=parent_ids).only("id", "path")
+        return {comment.pk: comment for comment in comments}
+
+    def first_replies(self, parent_ids, limit):
+        """
+        The first limit direct replies of each of the comments, oldest first
+        """
+        return (
+            self.filter(parent_id__in=parent_ids)
+            .annotate(
+                reply_rank=Window(
+                    RowNumber(),
+                    partition_by=F("parent_id"),
+                    order_by=[F("created_at").asc(), F("id").asc()],
+                )
+            )
+            .filter(reply_rank__lte=limit)
+            .order_by("parent_id", "created_at", "id")
+        )
+
+    def add_replies(self, counts):
+        """
+        Add counts[id] to the reply_count of each comment with one UPDATE
+        """
+        if not counts:
+            return 0
+        return self.filter(pk__in=counts).update(
+            reply_count=F("reply_count")
+            + Case(*(When(pk=pk, then=Value(n)) for pk, n in counts.items())),
+            updated_at=timezone.now(),
+        )
+
+    def delete_thread(self, comment):
+        """
+        Delete the comment and its replies with one statement, instead of
+        loading the whole thread to cascade the delete level by level.
+        Returns the number of comments deleted
+        """
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with connection.cursor() as cursor:
+            # Paths only hold digits and "/", so they need no LIKE escaping
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id = %s OR path LIKE %s",
+                [comment.pk, comment.child_path + "%"],
+            )
+            return cursor.rowcount
 
 
 class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
     blog = models.ForeignKey(Blog, on_delete=models.CASCADE, related_name="comments")
+    parent = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="replies",
+    )
+    # Ids of the ancestors, top-level comment first, each followed by "/".
+    # Empty for top-level comments, and a thread is a prefix match
+    path = models.CharField(max_length=255, default="", editable=False)
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also advanced when reply_count changes
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["blog", "created_at"]),
+            models.Index(fields=["created_at", "id"]),
+            # Top-level comments and direct replies in created_at order
+            models.Index(fields=["blog", "path", "created_at", "id"]),
+            # Prefix matches of threads, which a collation-aware index
+            # cannot serve
+            models.Index(
+                fields=["path"],
+                name="blogs_comment_path_like",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
+
+    @property
+    def depth(self):
+        return self.path.count("/")
+
+    @property
+    def child_path(self):
+        return f"{self.path}{self.pk}/"
+
+
+class Follow(models.Model):
+    follower = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="following"
+    )
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followers")
+    # Whether the author's blogs are pushed into the follower's timeline on
+    # write, or merged into it on read because the author has many followers
+    fan_out = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["follower", "author"], name="unique_follow"
+            ),
+        ]
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """
+        Annotate the user's liked flag of each entry's blog
+        """
+        return self.annotate(
+            liked_by_user=Exists(
+                Like.objects.filter(blog=OuterRef("blog_id"), user=user)
+            )
+        )
+
+    def fan_out(self, blog_ids):
+        """
+        Insert new blogs into their author's timeline and the timelines of
+        the followers whose follow is fanned out on write
+        """
+        if not blog_ids:
+            return 0
+        timeline_table = connection.ops.quote_name(self.model._meta.db_table)
+        blog_table = connection.ops.quote_name(Blog._meta.db_table)
+        follow_table = connection.ops.quote_name(Follow._meta.db_table)
+        placeholders = ", ".join(["%s"] * len(blog_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {timeline_table} (user_id, blog_id, created_at) "
+                f"SELECT author_id, id, created_at FROM {blog_table} "
+                f"WHERE id IN ({placeholders}) "
+                "UNION ALL "
+                f"SELECT f.follower_id, b.id, b.created_at FROM {blog_table} b "
+                f"JOIN {follow_table} f ON f.author_id = b.author_id "
+                f"WHERE b.id IN ({placeholders}) AND f.fan_out",
+                [*blog_ids, *blog_ids],
+            )
+            return cursor.rowcount
+
+    def backfill(self, follow, limit):
+        """
+        Copy the author's latest blogs into the follower's timeline
+        """
+        blogs = Blog.objects.filter(author_id=follow.author_id).order_by(
+            "-created_at", "-id"
+        )[:limit]
+        return len(
+            self.bulk_create(
+                (
+                    TimelineEntry(
+                        user_id=follow.follower_id,
+                        blog_id=blog_id,
+                        created_at=created_at,
+                    )
+                    for blog_id, created_at in blogs.values_list("id", "created_at")
+                ),
+                ignore_conflicts=True,
+            )
+        )
+
+
+class TimelineEntry(models.Model):
+    """
+    A blog in a user's home timeline, copied from the blog on write so the
+    home page is a range scan over (user, created_at)
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    blog = models.ForeignKey(
+        Blog, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    created_at = models.DateTimeField()
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "blog"], name="unique_timeline_entry"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "created_at", "id"]),
+        ]
+
+
+class QueuedTaskQuerySet(models.QuerySet):
+    def due(self):
+        return self.filter(failed=False, run_at__lte=timezone.now()).order_by(
+            "run_at", "id"
+        )
+
+
+class QueuedTask(models.Model):
+    """
+    A task of the database task backend, see blogs.tasks
+    """
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    # Retries exhausted, kept for inspection
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = QueuedTaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["run_at", "id"],
+                name="blogs_queuedtask_due",
+                condition=Q(failed=False),
+            ),
+        ]
+
+
+class TokenRevocation(models.Model):
+    """
+    When the user's tokens were last revoked, see blogs.authentication. The
+    cache holds a copy for TOKEN_VERSION_CACHE_TIMEOUT seconds. The row is
+    kept when the user is deleted, so their tokens stay revoked
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name="+",
+    )
+    revoked_at = models.DateTimeField()
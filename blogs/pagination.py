@@ -0,0 +1,52 @@
+from asgiref.sync import sync_to_async
+from rest_framework.pagination import CursorPagination
+
+
+class AsyncCursorPaginationMixin:
+    """
+    Adds apaginate_queryset(), which runs CursorPagination.paginate_queryset
+    in the thread async views use for database access
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+
+    def get_paginated_data(self, data):
+        return {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        }
+
+
+class BlogCursorPagination(AsyncCursorPaginationMixin, CursorPagination):
+    """
+    Keyset pagination over (created_at, id), newest blogs first
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class BlogSearchCursorPagination(AsyncCursorPaginationMixin, CursorPagination):
+    """
+    Keyset pagination over (rank, id), most relevant blogs first
+    """
+
+    ordering = ("-rank", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class CommentCursorPagination(AsyncCursorPaginationMixin, CursorPagination):
+    """
+    Keyset pagination over (created_at, id), oldest comments first
+    """
+
+    ordering = ("created_at", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+
+# Processes hashing passwords, 0 hashes on the request thread instead
+LOGIN_HASH_WORKERS = getattr(settings, "LOGIN_HASH_WORKERS", os.cpu_count())
+# Hash jobs allowed to wait or run at once before logins are turned away
+LOGIN_HASH_MAX_PENDING = getattr(settings, "LOGIN_HASH_MAX_PENDING", 64)
+LOGIN_HASH_QUEUE_TIMEOUT = getattr(settings, "LOGIN_HASH_QUEUE_TIMEOUT", 5)
+LOGIN_MAX_FAILURES = getattr(settings, "LOGIN_MAX_FAILURES", 5)
+LOGIN_MAX_FAILURES_PER_IP = getattr(settings, "LOGIN_MAX_FAILURES_PER_IP", 50)
+LOGIN_FAILURE_WINDOW = getattr(settings, "LOGIN_FAILURE_WINDOW", 300)
+
+
+class LoginUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many logins in progress, try again later."
+    default_code = "login_unavailable"
+
+
+class HashPoolStats:
+    """
+    In-process queueing counters for the password hashing pool
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+
+    def enter(self):
+        with self._lock:
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+
+    def leave(self, seconds):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += seconds
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "peak_pending": self.peak_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "total_seconds": self.total_seconds,
+            }
+
+
+stats = HashPoolStats()
+_slots = threading.BoundedSemaphore(LOGIN_HASH_MAX_PENDING)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=LOGIN_HASH_WORKERS)
+        return _executor
+
+
+def run_hasher(function, *args):
+    """
+    Run a password hashing function in the process pool, waiting at most
+    LOGIN_HASH_QUEUE_TIMEOUT seconds for a free slot
+    """
+    if not LOGIN_HASH_WORKERS:
+        return function(*args)
+    if not _slots.acquire(timeout=LOGIN_HASH_QUEUE_TIMEOUT):
+        stats.reject()
+        raise LoginUnavailable()
+    start = time.monotonic()
+    stats.enter()
+    try:
+        return _get_executor().submit(function, *args).result()
+    finally:
+        stats.leave(time.monotonic() - start)
+        _slots.release()
+
+
+def _username_key(username):
+    # Usernames are client input, hashed so the key stays short and free of
+    # the spaces and control characters memcached rejects
+    digest = hashlib.sha256(username.encode()).hexdigest()
+    return f"blogs:login-failures:user:{digest}"
+
+
+def _failure_keys(username, ip):
+    return {
+        _username_key(username): LOGIN_MAX_FAILURES,
+        f"blogs:login-failures:ip:{ip}": LOGIN_MAX_FAILURES_PER_IP,
+    }
+
+
+def check_failures(username, ip):
+    """
+    Reject the login before hashing when the username or IP failed too often
+    """
+    limits = _failure_keys(username, ip)
+    counts = cache.get_many(limits)
+    if any(counts.get(key, 0) >= limit for key, limit in limits.items()):
+        raise Throttled(wait=LOGIN_FAILURE_WINDOW)
+
+
+def record_failure(username, ip):
+    for key in _failure_keys(username, ip):
+        if not cache.add(key, 1, LOGIN_FAILURE_WINDOW):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, LOGIN_FAILURE_WINDOW)
+
+
+def clear_failures(username):
+    cache.delete(_username_key(username))
+
+
+def verify_credentials(username, password):
+    """
+    Return the active user matching the credentials or None, like
+    ModelBackend.authenticate() but hashing in the process pool. Passwords
+    stored with outdated hasher parameters are re-hashed on success
+    """
+    try:
+        user = User._default_manager.get_by_natural_key(username)
+    except User.DoesNotExist:
+        # Spend the same hashing time as for an existing user
+        run_hasher(hashers.make_password, password)
+        return None
+    encoded = user.password
+    if not run_hasher(hashers.check_password, password, encoded):
+        return None
+    if not user.is_active:
+        return None
+    hasher = hashers.identify_hasher(encoded)
+    default_hasher = hashers.get_hasher()
+    if hasher.algorithm != default_hasher.algorithm or hasher.must_update(encoded):
+        user.password = run_hasher(hashers.make_password, password)
+        User.objects.filter(pk=user.pk).update(password=user.password)
+    return user
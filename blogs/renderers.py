@@ -0,0 +1,32 @@
+from django.conf import settings
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Whether views offer the browsable API next to JSON
+BROWSABLE_API = getattr(settings, "BROWSABLE_API", True)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed, falling back
+    to the stock encoder otherwise or when indented output is requested
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent:
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=JSONEncoder().default)
+
+
+# Renderers of the views on the values fast path
+FAST_RENDERER_CLASSES = [FastJSONRenderer]
+if BROWSABLE_API:
+    FAST_RENDERER_CLASSES.append(BrowsableAPIRenderer)
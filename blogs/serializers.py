@@ -1,11 +1,136 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from rest_framework import serializers
-from .models import Blog, Comment
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers, status
+from rest_framework.exceptions import ValidationError
+from .models import Blog, Comment, COMMENT_MAX_DEPTH, EXCERPT_LENGTH
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.tokens import Token
+from project import metrics
 
+# Items accepted by a single bulk write request
+BULK_MAX_ITEMS = getattr(settings, "BULK_MAX_ITEMS", 1000)
+# Direct replies listed under each top-level comment, by default and at most
+COMMENT_REPLY_PREVIEW = getattr(settings, "COMMENT_REPLY_PREVIEW", 3)
+COMMENT_REPLY_PREVIEW_MAX = getattr(settings, "COMMENT_REPLY_PREVIEW_MAX", 20)
 
-class UserSerializer(serializers.ModelSerializer):
+
+class BulkCreateListSerializer(serializers.ListSerializer):
+    """
+    many=True serializer that keeps the valid items when others fail
+    validation, so they can be saved with one bulk_create() while the
+    invalid ones are reported per item
+    """
+
+    def run_child_validation(self, data):
+        try:
+            validated = super().run_child_validation(data)
+        except ValidationError as exc:
+            self.item_errors.append(exc.detail)
+            return None
+        self.item_errors.append({})
+        return validated
+
+    def to_internal_value(self, data):
+        self.item_errors = []
+        validated = super().to_internal_value(data)
+        return [attrs for attrs in validated if attrs is not None]
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return model.objects.bulk_create(model(**attrs) for attrs in validated_data)
+
+    def item_results(self, results):
+        """
+        Merge the results of the valid items with the errors of the invalid
+        ones, in request order
+        """
+        results = iter(results)
+        return [
+            {"status": status.HTTP_400_BAD_REQUEST, "errors": errors}
+            if errors
+            else next(results)
+            for errors in self.item_errors
+        ]
+
+
+class TimedSerializerMixin:
+    """
+    Count the time spent serializing instances as the serialize phase of
+    sampled requests
+    """
+
+    def to_representation(self, instance):
+        with metrics.timer("serialize"):
+            return super().to_representation(instance)
+
+
+class ValuesSerializerMixin:
+    """
+    Fast path that builds plain dicts from .values() rows instead of
+    serializing model instances field by field
+    """
+
+    # Serializer field name -> column or annotation it is read from
+    values_sources = {}
+
+    @classmethod
+    def requested_fields(cls, request):
+        return set(cls.Meta.fields)
+
+    @classmethod
+    def values_fields(cls, request=None):
+        requested = cls.requested_fields(request)
+        extra_kwargs = getattr(cls.Meta, "extra_kwargs", {})
+        return [
+            name
+            for name in cls.Meta.fields
+            if name in requested
+            and not extra_kwargs.get(name, {}).get("write_only", False)
+        ]
+
+    @classmethod
+    def values_columns(cls, fields):
+        return [cls.values_sources.get(name, name) for name in fields]
+
+    @classmethod
+    def serialize_values(cls, rows, fields):
+        # Run the query first so it is not timed as serialization
+        rows = list(rows)
+        with metrics.timer("serialize"):
+            convert = cls.values_converter(fields)
+            return [convert(row) for row in rows]
+
+    @classmethod
+    def values_converter(cls, fields):
+        """
+        Return a function turning one .values() row into the serialized dict
+        """
+        opts = cls.Meta.model._meta
+        datetime_field = serializers.DateTimeField()
+        converters = []
+        for name in fields:
+            source = cls.values_sources.get(name, name)
+            try:
+                is_datetime = isinstance(opts.get_field(source), models.DateTimeField)
+            except FieldDoesNotExist:
+                is_datetime = False
+            convert = datetime_field.to_representation if is_datetime else None
+            converters.append((name, source, convert))
+
+        def convert_row(row):
+            return {
+                name: convert(row[source]) if convert else row[source]
+                for name, source, convert in converters
+            }
+
+        return convert_row
+
+
+class UserSerializer(
+    TimedSerializerMixin, ValuesSerializerMixin, serializers.ModelSerializer
+):
     class Meta:
         model = User
         fields = ["id", "username", "email", "first_name", "last_name", "password"]
@@ -15,11 +140,29 @@ class UserSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         return user
 
+    def update(self, instance, validated_data):
+        # Hashed, and saving the new password revokes the user's tokens
+        password = validated_data.pop("password", None)
+        if password is not None:
+            instance.set_password(password)
+        return super().update(instance, validated_data)
+
 
-class BlogSerializer(serializers.ModelSerializer):
+class BlogSerializer(
+    TimedSerializerMixin, ValuesSerializerMixin, serializers.ModelSerializer
+):
     is_liked = serializers.SerializerMethodField()
 
+    values_sources = {
+        "author": "author_id",
+        "num_likes": "like_count",
+        "num_comments": "comment_count",
+        "is_liked": "liked_by_user",
+    }
+
     def get_is_liked(self, obj):
+        if hasattr(obj, "liked_by_user"):
+            return obj.liked_by_user
         request = self.context["request"]
         if request and hasattr(request, "user"):
             return obj.likes.filter(user=request.user).exists()
@@ -32,16 +175,138 @@ class BlogSerializer(serializers.ModelSerializer):
             "title",
             "content",
             "created_at",
+            "updated_at",
             "author",
             "tagline",
             "num_likes",
+            "num_comments",
+            "is_liked",
+        ]
+        read_only_fields = ["author", "num_likes", "num_comments", "is_liked"]
+        list_serializer_class = BulkCreateListSerializer
+
+
+class SparseFieldsetMixin:
+    """
+    Limit the serialized fields to the ones listed in ?fields=
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        allowed = self.requested_fields(self.context.get("request"))
+        for name in list(self.fields):
+            if name not in allowed:
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        fields = set(cls.Meta.fields)
+        if request is None:
+            return fields
+        param = request.query_params.get("fields")
+        if not param:
+            return fields - set(getattr(cls.Meta, "optional_fields", []))
+        return fields & set(param.split(","))
+
+
+class BlogListSerializer(SparseFieldsetMixin, BlogSerializer):
+    excerpt = serializers.SerializerMethodField()
+
+    def get_excerpt(self, obj):
+        if hasattr(obj, "excerpt"):
+            return obj.excerpt
+        return obj.content[:EXCERPT_LENGTH]
+
+    class Meta(BlogSerializer.Meta):
+        fields = [
+            "id",
+            "title",
+            "tagline",
+            "created_at",
+            "updated_at",
+            "author",
+            "num_likes",
+            "num_comments",
             "is_liked",
+            "excerpt",
         ]
-        read_only_fields = ["author", "num_likes", "is_liked"]
+        optional_fields = ["excerpt"]
+        read_only_fields = fields
+
+
+class CommentListSerializer(BulkCreateListSerializer):
+    """
+    Look up the parents of all the items with one query before validating
+    them one by one
+    """
 
+    def to_internal_value(self, data):
+        parent_ids = set()
+        if isinstance(data, list):
+            for item in data:
+                try:
+                    parent_ids.add(int(item["parent"]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+        self.child.parents = (
+            Comment.objects.parents(self.context["blog_id"], parent_ids)
+            if parent_ids
+            else {}
+        )
+        return super().to_internal_value(data)
+
+
+class CommentSerializer(
+    TimedSerializerMixin, ValuesSerializerMixin, serializers.ModelSerializer
+):
+    parent = serializers.IntegerField(
+        source="parent_id", required=False, allow_null=True, min_value=1
+    )
+
+    values_sources = {"author": "author_id", "blog": "blog_id", "parent": "parent_id"}
+
+    # {id: comment} prefetched by CommentListSerializer, None to query
+    parents = None
 
-class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        fields = ["id", "author", "blog", "text", "created_at"]
+        fields = [
+            "id",
+            "author",
+            "blog",
+            "parent",
+            "reply_count",
+            "text",
+            "created_at",
+            "updated_at",
+        ]
         extra_kwargs = {"author": {"read_only": True}, "blog": {"read_only": True}}
+        list_serializer_class = CommentListSerializer
+
+    def validate(self, attrs):
+        """
+        Check that the parent is a comment of the same blog, and set the
+        path of the reply below it. The blog comes from context["blog_id"]
+        """
+        parent_id = attrs.get("parent_id")
+        if parent_id is None:
+            return attrs
+        parents = self.parents
+        if parents is None:
+            parents = Comment.objects.parents(self.context["blog_id"], [parent_id])
+        parent = parents.get(parent_id)
+        if parent is None:
+            raise ValidationError({"parent": ["No such comment on this blog."]})
+        if parent.depth >= COMMENT_MAX_DEPTH:
+            raise ValidationError(
+                {"parent": [f"Replies cannot nest more than {COMMENT_MAX_DEPTH} deep."]}
+            )
+        attrs["path"] = parent.child_path
+        return attrs
+
+
+class LikeSerializer(serializers.Serializer):
+    blog = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        list_serializer_class = BulkCreateListSerializer
@@ -0,0 +1,221 @@
+"""
+Background tasks for the heavy side effects of the write endpoints (search
+indexing, timeline fan-out, trending), so they return as soon as the primary
+rows are committed. Cache invalidation stays on commit in the request, so
+writers read their own writes. TASK_BACKEND picks where tasks run:
+
+    thread      an in-process thread pool of TASK_WORKERS threads
+    database    QueuedTask rows, run by `manage.py run_worker`, which
+                survive restarts and are inserted in the caller's
+                transaction. The worker is another process, so the cache
+                must be shared
+    immediate   in the calling thread, for tests and debugging
+
+Only tasks of committed transactions run, failed tasks are retried up to
+their retries with a delay doubling from TASK_RETRY_DELAY seconds.
+"""
+
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import Blog, QueuedTask, TimelineEntry
+from . import trending
+
+logger = logging.getLogger(__name__)
+
+TASK_WORKERS = getattr(settings, "TASK_WORKERS", 4)
+TASK_RETRIES = getattr(settings, "TASK_RETRIES", 3)
+TASK_RETRY_DELAY = getattr(settings, "TASK_RETRY_DELAY", 1.0)
+
+# Task name -> Task, so queued tasks can be found by name
+registry = {}
+
+
+class Task:
+    def __init__(self, func, retries):
+        self.func = func
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.retries = TASK_RETRIES if retries is None else retries
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        """
+        Run the task in the background once the current transaction commits.
+        Arguments must be JSON serializable for the database backend
+        """
+        get_backend().enqueue(self, args, kwargs)
+
+
+def task(func=None, *, retries=None):
+    """
+    Register a function as a task, called inline or run with .enqueue()
+    """
+
+    def register(func):
+        registered = Task(func, retries)
+        registry[registered.name] = registered
+        return registered
+
+    return register if func is None else register(func)
+
+
+def retry_delay(attempt):
+    return TASK_RETRY_DELAY * 2 ** (attempt - 1)
+
+
+class ImmediateBackend:
+    def enqueue(self, task, args, kwargs):
+        transaction.on_commit(lambda: self.run(task, args, kwargs), robust=True)
+
+    def run(self, task, args, kwargs):
+        for attempt in range(1, task.retries + 2):
+            try:
+                return task(*args, **kwargs)
+            except Exception:
+                if attempt > task.retries:
+                    logger.exception("Task %s failed %d times", task.name, attempt)
+                    return
+                logger.warning("Task %s failed, retrying", task.name, exc_info=True)
+                time.sleep(retry_delay(attempt))
+
+
+class ThreadBackend(ImmediateBackend):
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    TASK_WORKERS, thread_name_prefix="tasks"
+                )
+        return self._executor
+
+    def enqueue(self, task, args, kwargs):
+        transaction.on_commit(
+            lambda: self.executor.submit(self.run, task, args, kwargs), robust=True
+        )
+
+    def run(self, task, args, kwargs):
+        try:
+            super().run(task, args, kwargs)
+        finally:
+            # The pool threads have their own database connections
+            close_old_connections()
+
+
+# Caches private to each process
+PROCESS_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+class DatabaseBackend:
+    def __init__(self):
+        backend = settings.CACHES.get("default", {}).get("BACKEND")
+        if backend in PROCESS_CACHES:
+            logger.warning(
+                "TASK_BACKEND 'database' runs tasks in run_worker processes, "
+                "which do not share the %s cache of the web processes",
+                backend,
+            )
+
+    def enqueue(self, task, args, kwargs):
+        # Rolled back with the caller's transaction, so no on_commit needed
+        QueuedTask.objects.create(name=task.name, args=list(args), kwargs=kwargs)
+
+    def run_pending(self, limit=100):
+        """
+        Run up to limit due tasks, each in a transaction holding its row
+        lock so concurrent workers skip it. Returns the number of tasks run
+        """
+        done = 0
+        while done < limit:
+            with transaction.atomic():
+                queued = QueuedTask.objects.due().select_for_update(
+                    skip_locked=True
+                ).first()
+                if queued is None:
+                    break
+                self.run(queued)
+            done += 1
+        return done
+
+    def run(self, queued):
+        registered = registry.get(queued.name)
+        try:
+            # A savepoint, so the failed task's writes are undone but its
+            # retry is recorded
+            with transaction.atomic():
+                if registered is None:
+                    raise LookupError(f"Unknown task {queued.name}")
+                registered(*queued.args, **queued.kwargs)
+        except Exception:
+            queued.attempts += 1
+            queued.last_error = traceback.format_exc()
+            retries = TASK_RETRIES if registered is None else registered.retries
+            if queued.attempts > retries:
+                queued.failed = True
+                logger.exception(
+                    "Task %s failed %d times", queued.name, queued.attempts
+                )
+            else:
+                queued.run_at = timezone.now() + timedelta(
+                    seconds=retry_delay(queued.attempts)
+                )
+            queued.save(update_fields=["attempts", "last_error", "failed", "run_at"])
+        else:
+            queued.delete()
+
+
+BACKENDS = {
+    "immediate": ImmediateBackend,
+    "thread": ThreadBackend,
+    "database": DatabaseBackend,
+}
+_backends = {}
+
+
+def get_backend():
+    """
+    The backend named by TASK_BACKEND, read on every call so tests can
+    override it
+    """
+    name = getattr(settings, "TASK_BACKEND", "thread")
+    backend = _backends.get(name)
+    if backend is None:
+        try:
+            backend = _backends.setdefault(name, BACKENDS[name]())
+        except KeyError:
+            raise ImproperlyConfigured(f"Unknown TASK_BACKEND {name!r}")
+    return backend
+
+
+# Side effects of the write endpoints
+
+
+@task
+def index_blogs(blog_ids):
+    Blog.objects.filter(pk__in=blog_ids).update_search_vector()
+
+
+@task
+def fan_out_blogs(blog_ids):
+    TimelineEntry.objects.fan_out(blog_ids)
+
+
+@task
+def record_comments(blog_id, count):
+    trending.record_comments(blog_id, count)
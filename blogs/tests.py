@@ -1,8 +1,50 @@
-from django.test import TestCase, Client
+import json
+import threading
+import time
+import warnings
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
 from rest_framework import status
-from .models import Comment
-from .serializers import CommentSerializer
+from rest_framework.exceptions import Throttled
+from project import metrics, middleware
+from project.queries import QueryBudgetTestMixin, fingerprint
+from .models import (
+    Blog,
+    Like,
+    Comment,
+    QueuedTask,
+    TimelineEntry,
+    TokenRevocation,
+)
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import get_token_version, revoke_tokens
+from .renderers import FastJSONRenderer
+from .serializers import BULK_MAX_ITEMS, CommentSerializer, UserSerializer
+from . import cache as blog_cache
+from . import (
+    authentication,
+    likes,
+    passwords,
+    tasks,
+    throttling,
+    timeline,
+    trending,
+)
 
 client = Client()
 
@@ -22,23 +64,250 @@ def register_user_and_get_access_token(username, password):
     return (response.data["access"], register_user_response)
 
 
+def without_content(blog):
+    return {key: value for key, value in blog.items() if key != "content"}
+
+
+def clear_blog_cache():
+    """
+    Empty the cache but keep the users' token revocation markers, which are
+    read from the database once per user
+    """
+    cache.clear()
+    for user_id in User.objects.values_list("pk", flat=True):
+        get_token_version(user_id)
+
+
 def create_blog(access_token, data):
-    response = client.post(
-        reverse("blogs:blog-list"),
-        data,
-        headers={"Authorization": f"Bearer {access_token}"},
-    )
+    # Also run the fan-out and indexing tasks queued on commit
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        response = client.post(
+            reverse("blogs:blog-list"),
+            data,
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
     return response.data
 
 
+# Tasks run in the test thread, when the test captures on_commit callbacks
+@override_settings(TASK_BACKEND="immediate")
+class BlogsTestCase(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        # The cache outlives the per-test database rollback
+        cache.clear()
+        blog_cache.stats.reset()
+
+
 # Create your tests here.
-class CreateUserViewTests(TestCase):
+class CreateUserViewTests(BlogsTestCase):
     def test_register_user(self):
         response = register_user("Tester", "test123")
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
 
-class BlogListCreateViewTests(TestCase):
+class UserLoginTests(BlogsTestCase):
+    def login(self, password):
+        return self.client.post(
+            reverse("token"), {"username": "Tester", "password": password}
+        )
+
+    def test_failure_keys_accept_any_username(self):
+        username = "name with spaces\n" + "x" * 300
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", CacheKeyWarning)
+            for _ in range(passwords.LOGIN_MAX_FAILURES):
+                passwords.record_failure(username, "127.0.0.1")
+            with self.assertRaises(Throttled):
+                passwords.check_failures(username, "127.0.0.2")
+            passwords.clear_failures(username)
+            passwords.check_failures(username, "127.0.0.2")
+
+    @mock.patch("blogs.passwords.LOGIN_MAX_FAILURES_PER_IP", 2)
+    def test_failures_are_counted_per_client_behind_proxies(self):
+        register_user("Tester", "test123")
+        with override_settings(
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, "NUM_PROXIES": 1}
+        ):
+            for username in ("First", "Second", "Third"):
+                response = self.client.post(
+                    reverse("token"),
+                    {"username": username, "password": "wrong"},
+                    headers={"X-Forwarded-For": "10.0.0.1"},
+                )
+            self.assertEqual(
+                response.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+            )
+            # Another client behind the same proxy
+            response = self.client.post(
+                reverse("token"),
+                {"username": "Tester", "password": "test123"},
+                headers={"X-Forwarded-For": "10.0.0.2"},
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_failed_attempts_are_rejected_before_hashing(self):
+        register_user("Tester", "test123")
+        for _ in range(passwords.LOGIN_MAX_FAILURES):
+            response = self.login("wrong")
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        completed = passwords.stats.snapshot()["completed"]
+        response = self.login("test123")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(passwords.stats.snapshot()["completed"], completed)
+
+    def test_outdated_hash_is_upgraded(self):
+        user = User.objects.create_user(username="Tester")
+        user.password = PBKDF2PasswordHasher().encode("test123", "salt", 1000)
+        user.save()
+        response = self.login("test123")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertNotEqual(user.password.split("$")[1], "1000")
+        self.assertTrue(user.check_password("test123"))
+
+
+class StatelessJWTAuthenticationTests(BlogsTestCase):
+    def assert_rejected(self, access_token):
+        headers = {"Authorization": f"Bearer {access_token}"}
+        for name in ("blogs:home", "blogs:async-home"):
+            response = self.client.get(reverse(name), headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        user = User.objects.get(username="Tester")
+        user.is_active = False
+        user.save()
+        self.assert_rejected(access_token)
+
+    def test_password_change_revokes_tokens(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        # Logins only update last_login, which keeps the tokens valid
+        self.client.post(reverse("token"), {"username": "Tester", "password": "test123"})
+        response = self.client.get(
+            reverse("blogs:home"), headers={"Authorization": f"Bearer {access_token}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(
+            reverse("user", args=(user_response.data["id"],)),
+            {"username": "Tester", "password": "changed123"},
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assert_rejected(access_token)
+        response = self.client.post(
+            reverse("token"), {"username": "Tester", "password": "changed123"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(
+            reverse("blogs:home"),
+            headers={"Authorization": f"Bearer {response.data['access']}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_set_password_revokes_tokens(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        user = User.objects.get(username="Tester")
+        user.set_password("changed123")
+        user.save()
+        self.assert_rejected(access_token)
+
+    def test_revocation_outlives_the_cache(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        revoke_tokens(User.objects.get(username="Tester"))
+        cache.clear()
+        self.assert_rejected(access_token)
+
+    def test_revocation_by_another_process_applies_once_cached_marker_expires(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        headers = {"Authorization": f"Bearer {access_token}"}
+        self.assertEqual(
+            self.client.get(reverse("blogs:home"), headers=headers).status_code,
+            status.HTTP_200_OK,
+        )
+        # As written by a process whose cache this one does not see
+        TokenRevocation.objects.create(
+            user_id=user_response.data["id"], revoked_at=timezone.now()
+        )
+        expired = time.time() + authentication.TOKEN_VERSION_CACHE_TIMEOUT + 1
+        with mock.patch("time.time", return_value=expired):
+            self.assert_rejected(access_token)
+
+    def test_deleted_user_is_rejected(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        User.objects.get(username="Tester").delete()
+        cache.clear()
+        self.assert_rejected(access_token)
+        response = self.client.post(
+            reverse("blogs:blog-list"),
+            {"title": "Blog", "content": "Content", "tagline": "tag"},
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_without_claims_are_revoked(self):
+        user = User.objects.create_user(username="Tester", password="test123")
+        access_token = RefreshToken.for_user(user).access_token
+        access_token["iat"] -= 10
+        revoke_tokens(user)
+        self.assert_rejected(access_token)
+
+    def test_profile_loads_full_user(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        User.objects.filter(username="Tester").update(email="tester@example.com")
+        response = self.client.get(
+            reverse("profile-user"),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.data["email"], "tester@example.com")
+
+    def test_revoked_token(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        revoke_tokens(User.objects.get(username="Tester"))
+        response = self.client.get(
+            reverse("blogs:home"),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        # Tokens issued after the revocation are accepted
+        response = self.client.post(
+            reverse("token"), {"username": "Tester", "password": "test123"}
+        )
+        access_token = response.data["access"]
+        response = self.client.get(
+            reverse("blogs:home"),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_token_without_claims(self):
+        user = User.objects.create_user(username="Tester", password="test123")
+        access_token = RefreshToken.for_user(user).access_token
+        response = self.client.get(
+            reverse("blogs:home"),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class BlogListCreateViewTests(BlogsTestCase):
     def test_no_blog(self):
         access_token, user_response = register_user_and_get_access_token(
             "Tester", "test123"
@@ -48,7 +317,7 @@ class BlogListCreateViewTests(TestCase):
             headers={"Authorization": f"Bearer {access_token}"},
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, [])
+        self.assertEqual(response.data["results"], [])
 
     def test_blog_list_with_blog(self):
         access_token, user_response = register_user_and_get_access_token(
@@ -66,7 +335,7 @@ class BlogListCreateViewTests(TestCase):
             reverse("blogs:blog-list"),
             headers={"Authorization": f"Bearer {access_token}"},
         )
-        self.assertEqual(response.data, [blog])
+        self.assertEqual(response.data["results"], [without_content(blog)])
 
     def test_blog_list_with_two_blogs(self):
         access_token, user_response = register_user_and_get_access_token(
@@ -92,10 +361,225 @@ class BlogListCreateViewTests(TestCase):
             reverse("blogs:blog-list"),
             headers={"Authorization": f"Bearer {access_token}"},
         )
-        self.assertEqual(response.data, [blog, blog2])
+        self.assertEqual(
+            response.data["results"], [without_content(blog2), without_content(blog)]
+        )
+
+
+class BlogListSparseFieldsetTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        self.blog = create_blog(
+            self.access_token,
+            {
+                "title": "Test blog",
+                "content": "Content text " * 100,
+                "tagline": "blog python django",
+            },
+        )
+
+    def get_results(self, url):
+        response = self.client.get(
+            url, headers={"Authorization": f"Bearer {self.access_token}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["results"]
+
+    def test_fields(self):
+        for name in ["blogs:home", "blogs:blog-list"]:
+            results = self.get_results(reverse(name) + "?fields=id,title,unknown")
+            self.assertEqual(results, [{"id": self.blog["id"], "title": "Test blog"}])
+
+    def test_excerpt(self):
+        for name in ["blogs:home", "blogs:blog-list"]:
+            results = self.get_results(reverse(name) + "?fields=id,excerpt")
+            self.assertEqual(
+                results,
+                [{"id": self.blog["id"], "excerpt": self.blog["content"][:200]}],
+            )
+
+
+class BlogListQueryCountTests(BlogsTestCase):
+    def create_blogs_with_likes(self, access_token, count):
+        for i in range(count):
+            blog = create_blog(
+                access_token,
+                {
+                    "title": f"Test blog {i}",
+                    "content": "Content text",
+                    "tagline": "blog python django",
+                },
+            )
+            self.client.post(
+                reverse("blogs:like-blog", args=(blog["id"],)),
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
+
+    def assert_constant_queries(self, url, num_queries):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        self.create_blogs_with_likes(access_token, 1)
+        clear_blog_cache()
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(
+                url, headers={"Authorization": f"Bearer {access_token}"}
+            )
+        self.assertEqual(len(response.data["results"]), 1)
+        self.create_blogs_with_likes(access_token, 9)
+        clear_blog_cache()
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(
+                url, headers={"Authorization": f"Bearer {access_token}"}
+            )
+        results = response.data["results"]
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(blog["is_liked"] for blog in results))
+        self.assertTrue(all(blog["num_likes"] == 1 for blog in results))
+
+    def test_home_blog_list_queries(self):
+        # Load the authors merged in on read, fetch the page of timeline
+        # entries and load the blogs missing from the cache, the user is
+        # authenticated from the token claims
+        self.assert_constant_queries(reverse("blogs:home"), 3)
+
+    def test_blog_list_queries(self):
+        # Fetch the page
+        self.assert_constant_queries(reverse("blogs:blog-list"), 1)
+
+
+class BlogCacheTests(BlogsTestCase):
+    def test_cached_blog_detail(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        blog = create_blog(
+            access_token,
+            {
+                "title": "Test blog",
+                "content": "Content text",
+                "tagline": "blog python django",
+            },
+        )
+        url = reverse("blogs:blog", args=(blog["id"],))
+        response = self.client.get(
+            url, headers={"Authorization": f"Bearer {access_token}"}
+        )
+        self.assertEqual(blog_cache.stats.snapshot(), {"hits": 0, "misses": 1})
+        # Check is_liked, the blog itself comes from the cache
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                url, headers={"Authorization": f"Bearer {access_token}"}
+            )
+        self.assertEqual(response.data, blog)
+        self.assertEqual(blog_cache.stats.snapshot(), {"hits": 1, "misses": 1})
+
+    def test_like_invalidates_cached_blog(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        blog = create_blog(
+            access_token,
+            {
+                "title": "Test blog",
+                "content": "Content text",
+                "tagline": "blog python django",
+            },
+        )
+        response = self.client.get(
+            reverse("blogs:home"),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.data["results"][0]["num_likes"], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("blogs:like-blog", args=(blog["id"],)),
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
+        response = self.client.get(
+            reverse("blogs:home"),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.data["results"][0]["num_likes"], 1)
+        self.assertTrue(response.data["results"][0]["is_liked"])
+        self.assertEqual(blog_cache.stats.snapshot(), {"hits": 0, "misses": 2})
+
+    def test_blog_versions_expire(self):
+        access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        blog = create_blog(
+            access_token, {"title": "Blog", "content": "Content", "tagline": "tag"}
+        )
+        blog_cache.get_blogs([blog["id"]])
+        blog_cache.invalidate_blogs([blog["id"]])
+        key = blog_cache._version_key(blog["id"])
+        self.assertIsNotNone(cache.get(key))
+        expired = time.time() + blog_cache.BLOG_VERSION_TIMEOUT + 1
+        with mock.patch("time.time", return_value=expired):
+            self.assertIsNone(cache.get(key))
+            self.assertEqual(
+                blog_cache.get_blogs([blog["id"]])[blog["id"]]["title"], "Blog"
+            )
+
+    def test_update_invalidates_cached_blog(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        blog = create_blog(
+            access_token,
+            {
+                "title": "Test blog",
+                "content": "Content text",
+                "tagline": "blog python django",
+            },
+        )
+        url = reverse("blogs:blog", args=(blog["id"],))
+        self.client.get(url, headers={"Authorization": f"Bearer {access_token}"})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                reverse("blogs:update-blog", args=(blog["id"],)),
+                {"title": "New title"},
+                content_type="application/json",
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
+        response = self.client.get(
+            url, headers={"Authorization": f"Bearer {access_token}"}
+        )
+        self.assertEqual(response.data["title"], "New title")
+
+
+class BlogCursorPaginationTests(BlogsTestCase):
+    def test_walk_pages_with_cursor(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        blogs = [
+            create_blog(
+                access_token,
+                {
+                    "title": f"Test blog {i}",
+                    "content": "Content text",
+                    "tagline": "blog python django",
+                },
+            )
+            for i in range(5)
+        ]
+        url = reverse("blogs:home") + "?page_size=2"
+        ids = []
+        while url:
+            response = self.client.get(
+                url, headers={"Authorization": f"Bearer {access_token}"}
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            ids += [blog["id"] for blog in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(ids, [blog["id"] for blog in reversed(blogs)])
 
 
-class BlogRetrieveViewTestCase(TestCase):
+class BlogRetrieveViewTestCase(BlogsTestCase):
     def test_get_blog(self):
         access_token, user_response = register_user_and_get_access_token(
             "Tester", "test123"
@@ -116,7 +600,7 @@ class BlogRetrieveViewTestCase(TestCase):
         self.assertEqual(response.data, blog)
 
 
-class BlogDeleteViewTests(TestCase):
+class BlogDeleteViewTests(BlogsTestCase):
     def test_delete_blog(self):
         access_token, user_response = register_user_and_get_access_token(
             "Tester", "test123"
@@ -138,10 +622,10 @@ class BlogDeleteViewTests(TestCase):
             reverse("blogs:blog-list"),
             headers={"Authorization": f"Bearer {access_token}"},
         )
-        self.assertEqual(response.data, [])
+        self.assertEqual(response.data["results"], [])
 
 
-class BlogLikeViewTests(TestCase):
+class BlogLikeViewTests(BlogsTestCase):
     def test_increment_num_likes(self):
         # Create a user
         access_token, user_response = register_user_and_get_access_token(
@@ -206,7 +690,8 @@ class BlogLikeViewTests(TestCase):
             reverse("blogs:like-blog", args=(blog["id"],)),
             headers={"Authorization": f"Bearer {access_token_2}"},
         )
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["num_likes"], 1)
         # Get the liked blog
         response = self.client.get(
             reverse("blogs:blog", args=(blog["id"],)),
@@ -215,7 +700,50 @@ class BlogLikeViewTests(TestCase):
         self.assertEqual(response.data["num_likes"], 1)
 
 
-class CommentCreateDeleteTests(TestCase):
+    def test_like_is_idempotent(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        blog = create_blog(
+            access_token,
+            {
+                "title": "Test blog",
+                "content": "Content text",
+                "tagline": "blog python django",
+            },
+        )
+        for _ in range(2):
+            response = self.client.post(
+                reverse("blogs:like-blog", args=(blog["id"],)),
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.data["num_likes"], 1)
+        self.assertEqual(Like.objects.filter(blog=blog["id"]).count(), 1)
+        response = self.client.delete(
+            reverse("blogs:like-blog", args=(blog["id"],)),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.data["num_likes"], 0)
+        response = self.client.delete(
+            reverse("blogs:like-blog", args=(blog["id"],)),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_like_missing_blog(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        response = self.client.post(
+            reverse("blogs:like-blog", args=(1000,)),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Like.objects.exists())
+
+
+class CommentCreateDeleteTests(BlogsTestCase):
     def test_create_comment(self):
         access_token, user_response = register_user_and_get_access_token(
             "Tester", "test123"
@@ -237,3 +765,1391 @@ class CommentCreateDeleteTests(TestCase):
         serializer = CommentSerializer(comments, many=True)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(serializer.data, [response.data])
+
+    def test_comment_counter(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        blog = create_blog(
+            access_token,
+            {
+                "title": "Test blog",
+                "content": "Content text",
+                "tagline": "blog python django",
+            },
+        )
+        response = self.client.post(
+            reverse("blogs:comment-list", args=(blog["id"],)),
+            {"text": "Comment text"},
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(Blog.objects.get(pk=blog["id"]).comment_count, 1)
+        response = self.client.delete(
+            reverse("blogs:delete-comment", args=(response.data["id"],)),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Blog.objects.get(pk=blog["id"]).comment_count, 0)
+
+
+class ConditionalRequestTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.blog = create_blog(
+            access_token, {"title": "Blog", "content": "Content", "tagline": "tag"}
+        )
+        self.comments_url = reverse("blogs:comment-list", args=(self.blog["id"],))
+        self.comment = self.client.post(
+            self.comments_url, {"text": "Comment"}, headers=self.headers
+        ).data
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers={**self.headers, **headers})
+
+    def test_blog_detail_revalidates_without_body(self):
+        for name in ["blogs:blog", "blogs:async-blog"]:
+            with self.subTest(view=name):
+                url = reverse(name, args=(self.blog["id"],))
+                response = self.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertIn("no-cache", response["Cache-Control"])
+                etag = response["ETag"]
+                # The cached blog is reused, only the reader's like is queried
+                with self.assertQueryBudget(1):
+                    response = self.get(url, if_none_match=etag)
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEqual(response.content, b"")
+                self.assertEqual(response["ETag"], etag)
+
+    def test_blog_etag_changes_with_likes_and_comments(self):
+        url = reverse("blogs:blog", args=(self.blog["id"],))
+        etags = [self.get(url)["ETag"]]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("blogs:like-blog", args=(self.blog["id"],)),
+                headers=self.headers,
+            )
+        etags.append(self.get(url)["ETag"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                self.comments_url, {"text": "Again"}, headers=self.headers
+            )
+        response = self.get(url, if_none_match=etags[-1])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etags.append(response["ETag"])
+        self.assertEqual(len(set(etags)), 3)
+
+    def test_blog_detail_if_modified_since(self):
+        url = reverse("blogs:blog", args=(self.blog["id"],))
+        last_modified = self.get(url)["Last-Modified"]
+        response = self.get(url, if_modified_since=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.get(url, if_modified_since="Mon, 01 Jan 2024 00:00:00 GMT")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_comment_pages_revalidate_before_serializing(self):
+        for name in ["blogs:comment-list", "blogs:async-comment-list"]:
+            with self.subTest(view=name):
+                url = reverse(name, args=(self.blog["id"],))
+                etag = self.get(url)["ETag"]
+                with mock.patch.object(
+                    CommentSerializer, "serialize_values"
+                ) as serialize_values:
+                    response = self.get(url, if_none_match=etag)
+                serialize_values.assert_not_called()
+                self.assertEqual(
+                    response.status_code, status.HTTP_304_NOT_MODIFIED
+                )
+
+    def test_comment_page_etag_changes_with_replies_and_new_comments(self):
+        etag = self.get(self.comments_url)["ETag"]
+        threads_url = reverse("blogs:comment-threads", args=(self.blog["id"],))
+        threads_etag = self.get(threads_url)["ETag"]
+        self.client.post(
+            self.comments_url,
+            {"text": "Reply", "parent": self.comment["id"]},
+            headers=self.headers,
+        )
+        response = self.get(self.comments_url, if_none_match=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+        response = self.get(threads_url, if_none_match=threads_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["reply_count"], 1)
+
+    def test_thread_etag_changes_with_previewed_replies(self):
+        reply = self.client.post(
+            self.comments_url,
+            {"text": "Reply", "parent": self.comment["id"]},
+            headers=self.headers,
+        ).data
+        url = reverse("blogs:comment-threads", args=(self.blog["id"],))
+        etag = self.get(url)["ETag"]
+        response = self.get(url + "?replies=0", if_none_match=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["replies"], [])
+        self.client.post(
+            self.comments_url,
+            {"text": "Nested", "parent": reply["id"]},
+            headers=self.headers,
+        )
+        response = self.get(url, if_none_match=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["replies"][0]["reply_count"], 1)
+
+    def test_comment_page_if_modified_since_after_delete(self):
+        other = self.client.post(
+            self.comments_url, {"text": "Other"}, headers=self.headers
+        ).data
+        for name in ["blogs:comment-list", "blogs:async-comment-list"]:
+            with self.subTest(view=name):
+                url = reverse(name, args=(self.blog["id"],))
+                self.assertNotIn("Last-Modified", self.get(url))
+        response = self.get(self.comments_url)
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse("blogs:delete-comment", args=(self.comment["id"],)),
+                headers=self.headers,
+            )
+        response = self.get(
+            self.comments_url,
+            if_modified_since=http_date(time.time() + 60),
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]], [other["id"]]
+        )
+        response = self.get(self.comments_url, if_none_match=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ThreadedCommentTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.blog = create_blog(
+            access_token, {"title": "Blog", "content": "Content", "tagline": "tag"}
+        )
+        self.comments_url = reverse("blogs:comment-list", args=(self.blog["id"],))
+
+    def comment(self, text, parent=None):
+        data = {"text": text} if parent is None else {"text": text, "parent": parent}
+        response = self.client.post(self.comments_url, data, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return response.data
+
+    def test_reply_is_placed_below_its_parent(self):
+        top = self.comment("Top")
+        reply = self.comment("Reply", top["id"])
+        nested = self.comment("Nested", reply["id"])
+        self.assertEqual(reply["parent"], top["id"])
+        self.assertEqual(Comment.objects.get(pk=nested["id"]).depth, 2)
+        self.assertEqual(Comment.objects.get(pk=top["id"]).reply_count, 1)
+        self.assertEqual(Comment.objects.get(pk=reply["id"]).reply_count, 1)
+        self.assertEqual(Blog.objects.get(pk=self.blog["id"]).comment_count, 3)
+
+    def test_comment_on_missing_blog(self):
+        response = self.client.post(
+            reverse("blogs:comment-list", args=(self.blog["id"] + 1,)),
+            {"text": "Comment"},
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_reply_to_comment_of_other_blog_is_rejected(self):
+        other = create_blog(
+            register_user_and_get_access_token("Other", "test123")[0],
+            {"title": "Other", "content": "Content", "tagline": "tag"},
+        )
+        other_comment = Comment.objects.create(
+            author=User.objects.get(username="Other"), blog_id=other["id"], text="x"
+        )
+        response = self.client.post(
+            self.comments_url,
+            {"text": "Reply", "parent": other_comment.pk},
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("parent", response.data)
+
+    def test_nesting_depth_is_limited(self):
+        parent = self.comment("Top")
+        with mock.patch("blogs.serializers.COMMENT_MAX_DEPTH", 2):
+            for depth in range(2):
+                parent = self.comment(f"Depth {depth + 1}", parent["id"])
+            response = self.client.post(
+                self.comments_url,
+                {"text": "Too deep", "parent": parent["id"]},
+                headers=self.headers,
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_threads_list_top_level_with_first_replies(self):
+        tops = [self.comment(f"Top {i}") for i in range(3)]
+        replies = [self.comment(f"Reply {i}", tops[0]["id"]) for i in range(4)]
+        self.comment("Nested", replies[0]["id"])
+        self.comment("Reply", tops[2]["id"])
+        url = reverse("blogs:comment-threads", args=(self.blog["id"],))
+        with self.assertQueryBudget(2):
+            response = self.client.get(url + "?replies=2", headers=self.headers)
+        results = response.data["results"]
+        self.assertEqual([row["id"] for row in results], [top["id"] for top in tops])
+        self.assertEqual(results[0]["reply_count"], 4)
+        self.assertEqual(
+            [row["id"] for row in results[0]["replies"]],
+            [reply["id"] for reply in replies[:2]],
+        )
+        self.assertEqual(results[1]["replies"], [])
+        self.assertEqual(len(results[2]["replies"]), 1)
+
+    def test_thread_is_paginated_in_created_order(self):
+        top = self.comment("Top")
+        reply = self.comment("Reply", top["id"])
+        nested = self.comment("Nested", reply["id"])
+        self.comment("Other top")
+        sibling = self.comment("Sibling", top["id"])
+        url = reverse("blogs:comment-thread", args=(self.blog["id"], top["id"]))
+        response = self.client.get(url + "?page_size=2", headers=self.headers)
+        ids = [row["id"] for row in response.data["results"]]
+        response = self.client.get(response.data["next"], headers=self.headers)
+        ids += [row["id"] for row in response.data["results"]]
+        self.assertEqual(ids, [top["id"], reply["id"], nested["id"], sibling["id"]])
+        self.assertIsNone(response.data["next"])
+
+    def test_deleting_a_comment_deletes_its_replies(self):
+        top = self.comment("Top")
+        reply = self.comment("Reply", top["id"])
+        self.comment("Nested", reply["id"])
+        self.comment("Sibling", top["id"])
+        response = self.client.delete(
+            reverse("blogs:delete-comment", args=(reply["id"],)), headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(Comment.objects.get(pk=top["id"]).reply_count, 1)
+        self.assertEqual(Blog.objects.get(pk=self.blog["id"]).comment_count, 2)
+
+    def test_bulk_replies_look_up_parents_once(self):
+        tops = [self.comment(f"Top {i}") for i in range(2)]
+        items = [
+            {"text": f"Reply {i}", "parent": tops[i % 2]["id"]} for i in range(6)
+        ]
+        items.append({"text": "Orphan", "parent": 10**9})
+        with self.assertQueryBudget(10):
+            response = self.client.post(
+                reverse("blogs:bulk-comments", args=(self.blog["id"],)),
+                items,
+                headers=self.headers,
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data["results"][-1]["status"], 400)
+        self.assertEqual(
+            [Comment.objects.get(pk=top["id"]).reply_count for top in tops], [3, 3]
+        )
+
+
+class FastSerializationTests(BlogsTestCase):
+    def test_comment_list_matches_serializer(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        blog = create_blog(
+            access_token,
+            {
+                "title": "Test blog",
+                "content": "Content text",
+                "tagline": "blog python django",
+            },
+        )
+        for i in range(3):
+            self.client.post(
+                reverse("blogs:comment-list", args=(blog["id"],)),
+                {"text": f"Comment text {i}"},
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
+        response = self.client.get(
+            reverse("blogs:comment-list", args=(blog["id"],)),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        comments = Comment.objects.filter(blog=blog["id"]).order_by("created_at")
+        serializer = CommentSerializer(comments, many=True)
+        self.assertEqual(response.data["results"], serializer.data)
+
+    def test_user_list_matches_serializer(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        register_user("User", "user123")
+        response = self.client.get(
+            reverse("user-list"),
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        serializer = UserSerializer(User.objects.all(), many=True)
+        self.assertEqual(response.data, serializer.data)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {"id": 1, "title": "Тест", "results": [{"is_liked": False}]}
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data)
+        )
+
+
+class AsyncViewTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        self.headers = {"Authorization": f"Bearer {self.access_token}"}
+        self.blog = create_blog(
+            self.access_token,
+            {
+                "title": "Test blog",
+                "content": "Content text",
+                "tagline": "blog python django",
+            },
+        )
+        self.client.post(
+            reverse("blogs:comment-list", args=(self.blog["id"],)),
+            {"text": "Comment text"},
+            headers=self.headers,
+        )
+
+    def assert_same_response(self, sync_url, async_url):
+        sync_response = self.client.get(sync_url, headers=self.headers)
+        async_response = self.client.get(async_url, headers=self.headers)
+        self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(async_response.json(), sync_response.json())
+
+    def test_home(self):
+        self.assert_same_response(reverse("blogs:home"), reverse("blogs:async-home"))
+
+    def test_blog_detail(self):
+        self.assert_same_response(
+            reverse("blogs:blog", args=(self.blog["id"],)),
+            reverse("blogs:async-blog", args=(self.blog["id"],)),
+        )
+
+    def test_comment_list(self):
+        self.assert_same_response(
+            reverse("blogs:comment-list", args=(self.blog["id"],)),
+            reverse("blogs:async-comment-list", args=(self.blog["id"],)),
+        )
+
+    def test_cursor_pages(self):
+        for i in range(2):
+            self.client.post(
+                reverse("blogs:comment-list", args=(self.blog["id"],)),
+                {"text": f"Comment {i}"},
+                headers=self.headers,
+            )
+        pages = {}
+        for name in ["blogs:comment-list", "blogs:async-comment-list"]:
+            url = reverse(name, args=(self.blog["id"],)) + "?page_size=1"
+            pages[name] = []
+            # Forward through every page, then back a page
+            for link in ["next", "next", "next", "previous"]:
+                data = self.client.get(url, headers=self.headers).json()
+                pages[name].append(
+                    ([row["id"] for row in data["results"]], data["previous"] is None)
+                )
+                url = data[link] or url
+        self.assertEqual(len({row[0][0] for row in pages["blogs:comment-list"]}), 3)
+        self.assertEqual(pages["blogs:async-comment-list"], pages["blogs:comment-list"])
+
+    def test_like_blog(self):
+        url = reverse("blogs:async-like-blog", args=(self.blog["id"],))
+        response = self.client.post(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json(), {"num_likes": 1})
+        response = self.client.get(
+            reverse("blogs:async-blog", args=(self.blog["id"],)), headers=self.headers
+        )
+        self.assertTrue(response.json()["is_liked"])
+        response = self.client.delete(url, headers=self.headers)
+        self.assertEqual(response.json(), {"num_likes": 0})
+        response = self.client.delete(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_requires_authentication(self):
+        response = self.client.get(reverse("blogs:async-home"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class BulkWriteTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        self.headers = {"Authorization": f"Bearer {self.access_token}"}
+
+    def post(self, url, items):
+        return self.client.post(
+            url, items, content_type="application/json", headers=self.headers
+        )
+
+    def test_bulk_create_blogs_reports_invalid_items(self):
+        items = [
+            {"title": "First", "content": "Content", "tagline": "one"},
+            {"title": "Missing content", "tagline": "two"},
+            {"title": "Third", "content": "Content", "tagline": "three"},
+        ]
+        response = self.post(reverse("blogs:bulk-blogs"), items)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.data["results"]
+        self.assertEqual(
+            [result["status"] for result in results], [201, 400, 201]
+        )
+        self.assertIn("content", results[1]["errors"])
+        self.assertEqual(results[2]["data"]["title"], "Third")
+        self.assertFalse(results[2]["data"]["is_liked"])
+        self.assertEqual(
+            list(Blog.objects.values_list("title", flat=True).order_by("id")),
+            ["First", "Third"],
+        )
+
+    def test_bulk_create_rejects_too_many_items(self):
+        items = [{"title": "Blog", "content": "Content", "tagline": "tag"}] * (
+            BULK_MAX_ITEMS + 1
+        )
+        response = self.post(reverse("blogs:bulk-blogs"), items)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Blog.objects.exists())
+
+    def test_bulk_create_comments_in_batched_queries(self):
+        blog = create_blog(
+            self.access_token, {"title": "Blog", "content": "Text", "tagline": "tag"}
+        )
+        items = [{"text": f"Comment {i}"} for i in range(BULK_MAX_ITEMS)]
+        url = reverse("blogs:bulk-comments", args=(blog["id"],))
+        with CaptureQueriesContext(connection) as captured:
+            response = self.post(url, items)
+        # One counter update and a few batched INSERTs, not a query per item.
+        # SQLite caps the bound parameters, so each batch holds ~140 rows
+        self.assertLess(len(captured), 15)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["results"]), BULK_MAX_ITEMS)
+        self.assertEqual(Comment.objects.filter(blog_id=blog["id"]).count(), 1000)
+        self.assertEqual(Blog.objects.get(pk=blog["id"]).comment_count, 1000)
+
+    def test_bulk_create_comments_on_missing_blog(self):
+        response = self.post(reverse("blogs:bulk-comments", args=(1,)), [{"text": "a"}])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_bulk_like_and_unlike(self):
+        first = create_blog(
+            self.access_token, {"title": "One", "content": "Text", "tagline": "tag"}
+        )
+        second = create_blog(
+            self.access_token, {"title": "Two", "content": "Text", "tagline": "tag"}
+        )
+        url = reverse("blogs:bulk-like-blogs")
+        self.client.post(
+            reverse("blogs:like-blog", args=(first["id"],)), headers=self.headers
+        )
+        items = [{"blog": first["id"]}, {"blog": second["id"]}, {"blog": 999}]
+        response = self.post(url, items)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            response.data["results"],
+            [
+                {"status": 201, "data": {"blog": first["id"], "num_likes": 1}},
+                {"status": 201, "data": {"blog": second["id"], "num_likes": 1}},
+                {"status": 404, "errors": {"detail": "Not found."}},
+            ],
+        )
+        response = self.client.delete(
+            url, items[:2], content_type="application/json", headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(
+            list(Blog.objects.values_list("like_count", flat=True)), [0, 0]
+        )
+
+
+class HomeTimelineTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author_token, _ = register_user_and_get_access_token("Author", "test123")
+        self.reader_token, _ = register_user_and_get_access_token("Reader", "test123")
+        self.author = User.objects.get(username="Author")
+
+    def follow(self, method="post"):
+        return getattr(self.client, method)(
+            reverse("follow-user", args=(self.author.pk,)),
+            headers={"Authorization": f"Bearer {self.reader_token}"},
+        )
+
+    def home_ids(self):
+        response = self.client.get(
+            reverse("blogs:home"),
+            headers={"Authorization": f"Bearer {self.reader_token}"},
+        )
+        return [blog["id"] for blog in response.data["results"]]
+
+    def create_blog(self, title):
+        return create_blog(
+            self.author_token,
+            {"title": title, "content": "Content text", "tagline": "tag"},
+        )
+
+    def test_home_only_has_followed_authors(self):
+        self.create_blog("Not followed")
+        self.assertEqual(self.home_ids(), [])
+
+    def test_new_blogs_are_fanned_out_to_followers(self):
+        old = self.create_blog("Before following")
+        response = self.follow()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data["fan_out"])
+        new = self.create_blog("After following")
+        self.assertEqual(
+            TimelineEntry.objects.filter(user__username="Reader").count(), 2
+        )
+        self.assertEqual(self.home_ids(), [new["id"], old["id"]])
+
+    def test_unfollow_removes_blogs_from_timeline(self):
+        self.follow()
+        self.create_blog("Blog")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.follow("delete")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.home_ids(), [])
+        self.assertEqual(self.follow("delete").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_popular_authors_are_merged_on_read(self):
+        with mock.patch.object(timeline, "TIMELINE_FANOUT_MAX_FOLLOWERS", 0):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.follow()
+        self.assertFalse(response.data["fan_out"])
+        blog = self.create_blog("Popular")
+        self.assertFalse(
+            TimelineEntry.objects.filter(user__username="Reader").exists()
+        )
+        self.assertEqual(self.home_ids(), [blog["id"]])
+
+    def test_pushed_and_pulled_blogs_are_paginated_together(self):
+        other_token, _ = register_user_and_get_access_token("Other", "test123")
+        other = User.objects.get(username="Other")
+        self.follow()
+        with mock.patch.object(timeline, "TIMELINE_FANOUT_MAX_FOLLOWERS", 0):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse("follow-user", args=(other.pk,)),
+                    headers={"Authorization": f"Bearer {self.reader_token}"},
+                )
+        self.assertFalse(response.data["fan_out"])
+        blog_ids = []
+        for i in range(5):
+            token = self.author_token if i % 2 else other_token
+            blog = create_blog(
+                token, {"title": f"Blog {i}", "content": "Content", "tagline": "tag"}
+            )
+            blog_ids.insert(0, blog["id"])
+        for name in ("blogs:home", "blogs:async-home"):
+            url = reverse(name) + "?page_size=2"
+            ids = []
+            while url:
+                response = self.client.get(
+                    url, headers={"Authorization": f"Bearer {self.reader_token}"}
+                )
+                data = response.json()
+                ids += [blog["id"] for blog in data["results"]]
+                url = data["next"]
+            self.assertEqual(ids, blog_ids)
+
+    def test_cannot_follow_yourself(self):
+        response = self.client.post(
+            reverse("follow-user", args=(self.author.pk,)),
+            headers={"Authorization": f"Bearer {self.author_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TrendingTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.blogs = [
+            create_blog(
+                access_token,
+                {"title": f"Blog {i}", "content": "Content", "tagline": "tag"},
+            )
+            for i in range(3)
+        ]
+        self.url = reverse("blogs:trending")
+
+    def like(self, blog):
+        return self.client.post(
+            reverse("blogs:like-blog", args=(blog["id"],)), headers=self.headers
+        )
+
+    def comment(self, blog):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("blogs:comment-list", args=(blog["id"],)),
+                {"text": "Comment"},
+                headers=self.headers,
+            )
+
+    def trending_ids(self):
+        response = self.client.get(self.url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_engagement_ranks_blogs(self):
+        first, second, third = self.blogs
+        self.like(second)
+        self.comment(third)
+        self.like(third)
+        self.assertEqual(self.trending_ids(), [third["id"], second["id"]])
+        response = self.client.get(self.url, headers=self.headers)
+        self.assertTrue(response.data["results"][0]["is_liked"])
+
+    def test_repeated_like_does_not_add_score(self):
+        blog = self.blogs[0]
+        self.like(blog)
+        score = Blog.objects.get(pk=blog["id"]).trend_score
+        self.like(blog)
+        self.assertEqual(Blog.objects.get(pk=blog["id"]).trend_score, score)
+        self.assertAlmostEqual(trending.decayed(score), 1.0, places=3)
+
+    def test_recent_engagement_outranks_older(self):
+        old, new, _ = self.blogs
+        two_days_ago = timezone.now() - timedelta(days=2)
+        Blog.objects.filter(pk=old["id"]).bump_trending(
+            trending.event_score(10, two_days_ago)
+        )
+        Blog.objects.filter(pk=new["id"]).bump_trending(trending.event_score(1))
+        self.assertEqual(self.trending_ids(), [new["id"], old["id"]])
+
+    def test_recompute_drops_removed_engagement(self):
+        first, second, _ = self.blogs
+        self.like(first)
+        self.comment(second)
+        self.client.delete(
+            reverse("blogs:like-blog", args=(first["id"],)), headers=self.headers
+        )
+        call_command("recompute_trending", stdout=StringIO())
+        self.assertIsNone(Blog.objects.get(pk=first["id"]).trend_score)
+        self.assertAlmostEqual(
+            trending.decayed(Blog.objects.get(pk=second["id"]).trend_score),
+            trending.TRENDING_COMMENT_WEIGHT,
+            delta=0.1,
+        )
+        self.assertEqual(self.trending_ids(), [second["id"]])
+
+
+calls = []
+
+
+@tasks.task(retries=2)
+def record_call(value):
+    calls.append(value)
+
+
+@tasks.task(retries=1)
+def fail_once(value):
+    if value not in calls:
+        calls.append(value)
+        raise RuntimeError("First attempt fails")
+    calls.append("retried")
+
+
+@tasks.task(retries=1)
+def always_fail():
+    raise RuntimeError("Always fails")
+
+
+class TaskTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        calls.clear()
+
+    def test_tasks_run_after_commit_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_call.enqueue(1)
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [1])
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                record_call.enqueue(2)
+                transaction.set_rollback(True)
+        self.assertEqual(calls, [1])
+
+    @mock.patch("blogs.tasks.TASK_RETRY_DELAY", 0)
+    def test_failed_task_is_retried(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            fail_once.enqueue("first")
+        self.assertEqual(calls, ["first", "retried"])
+
+    @override_settings(TASK_BACKEND="thread")
+    def test_thread_backend(self):
+        done = threading.Event()
+        with mock.patch.object(record_call, "func", lambda value: done.set()):
+            with self.captureOnCommitCallbacks(execute=True):
+                record_call.enqueue(1)
+            self.assertTrue(done.wait(5))
+
+    @override_settings(TASK_BACKEND="database")
+    def test_database_backend_queues_in_transaction(self):
+        record_call.enqueue(1)
+        fail_once.enqueue("first")
+        with transaction.atomic():
+            record_call.enqueue(2)
+            transaction.set_rollback(True)
+        self.assertEqual(QueuedTask.objects.count(), 2)
+        stdout = StringIO()
+        call_command("run_worker", once=True, stdout=stdout)
+        self.assertIn("Ran 2 tasks", stdout.getvalue())
+        self.assertEqual(calls, [1, "first"])
+        # The failed task waits for its retry
+        queued = QueuedTask.objects.get()
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn("First attempt fails", queued.last_error)
+        QueuedTask.objects.update(run_at=timezone.now())
+        call_command("run_worker", once=True, stdout=StringIO())
+        self.assertEqual(calls, [1, "first", "retried"])
+        self.assertFalse(QueuedTask.objects.exists())
+
+    @override_settings(TASK_BACKEND="database")
+    def test_database_backend_keeps_exhausted_tasks(self):
+        always_fail.enqueue()
+        for _ in range(2):
+            QueuedTask.objects.update(run_at=timezone.now())
+            call_command("run_worker", once=True, stdout=StringIO())
+        queued = QueuedTask.objects.get()
+        self.assertTrue(queued.failed)
+        self.assertEqual(queued.attempts, 2)
+        self.assertEqual(tasks.DatabaseBackend().run_pending(), 0)
+
+    def test_write_endpoints_enqueue_side_effects(self):
+        access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        headers = {"Authorization": f"Bearer {access_token}"}
+        with override_settings(TASK_BACKEND="database"):
+            response = self.client.post(
+                reverse("blogs:blog-list"),
+                {"title": "Blog", "content": "Content", "tagline": "tag"},
+                headers=headers,
+            )
+        self.assertEqual(
+            sorted(QueuedTask.objects.values_list("name", flat=True)),
+            ["blogs.tasks.fan_out_blogs", "blogs.tasks.index_blogs"],
+        )
+        self.assertFalse(TimelineEntry.objects.exists())
+        call_command("run_worker", once=True, stdout=StringIO())
+        self.assertTrue(
+            TimelineEntry.objects.filter(blog_id=response.data["id"]).exists()
+        )
+
+    def test_writers_read_their_own_updates(self):
+        access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        headers = {"Authorization": f"Bearer {access_token}"}
+        blog = create_blog(
+            access_token, {"title": "Blog", "content": "Content", "tagline": "tag"}
+        )
+        url = reverse("blogs:blog", args=(blog["id"],))
+        self.client.get(url, headers=headers)
+        with override_settings(TASK_BACKEND="database"):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(
+                    reverse("blogs:update-blog", args=(blog["id"],)),
+                    {"title": "Updated"},
+                    content_type="application/json",
+                    headers=headers,
+                )
+        self.assertEqual(
+            list(QueuedTask.objects.values_list("name", flat=True)),
+            ["blogs.tasks.index_blogs"],
+        )
+        self.assertEqual(self.client.get(url, headers=headers).data["title"], "Updated")
+
+    def test_database_backend_warns_about_process_caches(self):
+        with self.assertLogs("blogs.tasks", "WARNING"):
+            tasks.DatabaseBackend()
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                    "LOCATION": "redis://localhost:6379",
+                }
+            }
+        ):
+            with self.assertNoLogs("blogs.tasks", "WARNING"):
+                tasks.DatabaseBackend()
+
+
+@override_settings(LIKE_BUFFER=True)
+@mock.patch("blogs.likes.LIKE_BUFFER_INTERVAL", 0)
+class LikeBufferTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        likes.buffer.flush()
+        access_token, _ = register_user_and_get_access_token("Author", "test123")
+        self.blog = create_blog(
+            access_token,
+            {"title": "Viral", "content": "Content", "tagline": "viral"},
+        )
+        self.author = {"Authorization": f"Bearer {access_token}"}
+        access_token, _ = register_user_and_get_access_token("Reader", "test123")
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        self.reader = User.objects.get(username="Reader")
+        self.url = reverse("blogs:like-blog", args=(self.blog["id"],))
+
+    def get_blog(self, headers):
+        return self.client.get(
+            reverse("blogs:blog", args=(self.blog["id"],)), headers=headers
+        ).data
+
+    def flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return likes.buffer.flush()
+
+    def test_likes_are_written_by_the_flush(self):
+        response = self.client.post(self.url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {"num_likes": 1})
+        self.assertFalse(Like.objects.exists())
+        # The reader sees their like before the flush, others after it
+        blog = self.get_blog(self.headers)
+        self.assertEqual((blog["num_likes"], blog["is_liked"]), (1, True))
+        self.assertEqual(self.get_blog(self.author)["num_likes"], 0)
+        self.assertEqual(self.flush(), 1)
+        self.assertTrue(Like.objects.filter(user=self.reader).exists())
+        blog = Blog.objects.get(pk=self.blog["id"])
+        self.assertEqual(blog.like_count, 1)
+        self.assertIsNotNone(blog.trend_score)
+        self.assertEqual(self.get_blog(self.author)["num_likes"], 1)
+        blog = self.get_blog(self.headers)
+        self.assertEqual((blog["num_likes"], blog["is_liked"]), (1, True))
+
+    def test_lists_show_pending_likes(self):
+        self.client.post(self.url, headers=self.author)
+        for name, params in [("blogs:blog-list", {}), ("blogs:search", {"q": "Viral"})]:
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name), params, headers=self.author)
+                blog = response.data["results"][0]
+                self.assertEqual((blog["num_likes"], blog["is_liked"]), (1, True))
+
+    def test_pending_like_is_not_modified_since(self):
+        urls = [
+            reverse(name, args=(self.blog["id"],))
+            for name in ["blogs:blog", "blogs:async-blog"]
+        ]
+        last_modified = self.client.get(urls[0], headers=self.headers)[
+            "Last-Modified"
+        ]
+        self.client.post(self.url, headers=self.headers)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, headers={**self.headers, "if_modified_since": last_modified}
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.json()["num_likes"], 1)
+                self.assertNotIn("Last-Modified", response)
+
+    def test_intents_are_coalesced(self):
+        for method in ("post", "delete", "post", "delete"):
+            getattr(self.client, method)(self.url, headers=self.headers)
+        response = self.client.delete(self.url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(self.url, headers=self.author)
+        self.assertEqual(response.data, {"num_likes": 1})
+        self.assertEqual(self.flush(), 2)
+        self.assertEqual(
+            list(Like.objects.values_list("user__username", flat=True)), ["Author"]
+        )
+        self.assertEqual(Blog.objects.get(pk=self.blog["id"]).like_count, 1)
+        response = self.client.delete(self.url, headers=self.author)
+        self.assertEqual(response.data, {"num_likes": 0})
+        blog = self.get_blog(self.author)
+        self.assertEqual((blog["num_likes"], blog["is_liked"]), (0, False))
+        self.flush()
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(Blog.objects.get(pk=self.blog["id"]).like_count, 0)
+
+    def test_flush_writes_the_latest_intent(self):
+        self.client.post(self.url, headers=self.headers)
+        # Recorded by another process, or written by the bulk endpoint
+        likes.written(self.reader, [self.blog["id"]], False)
+        self.flush()
+        self.assertFalse(Like.objects.exists())
+
+    def test_missing_blog(self):
+        response = self.client.post(
+            reverse("blogs:like-blog", args=(1000,)), headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(likes.buffer.flush(), 0)
+
+    def test_failed_flush_keeps_intents(self):
+        self.client.post(self.url, headers=self.headers)
+        with mock.patch.object(
+            Like.objects, "apply_intents", side_effect=RuntimeError("Down")
+        ):
+            with self.assertRaises(RuntimeError):
+                likes.buffer.flush()
+        self.assertEqual(self.flush(), 1)
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_async_like_blog(self):
+        url = reverse("blogs:async-like-blog", args=(self.blog["id"],))
+        response = self.client.post(url, headers=self.headers)
+        self.assertEqual(response.json(), {"num_likes": 1})
+        response = self.client.get(
+            reverse("blogs:async-blog", args=(self.blog["id"],)), headers=self.headers
+        )
+        self.assertTrue(response.json()["is_liked"])
+        self.assertEqual(self.flush(), 1)
+        self.assertEqual(Like.objects.count(), 1)
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {
+            "user_read": "3/min",
+            "user_write": "2/min",
+            "ip_read": "5/min",
+            "login": "2/min",
+        },
+    }
+)
+class ThrottleTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        self.headers = {"Authorization": f"Bearer {access_token}"}
+        access_token, _ = register_user_and_get_access_token("Other", "test123")
+        self.other = {"Authorization": f"Bearer {access_token}"}
+
+    def test_reads_are_throttled_per_user(self):
+        for remaining in (2, 1, 0):
+            response = self.client.get(reverse("blogs:home"), headers=self.headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response["X-RateLimit-Limit"], "3")
+            self.assertEqual(response["X-RateLimit-Remaining"], str(remaining))
+        response = self.client.get(reverse("blogs:home"), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "20")
+        self.assertEqual(response["X-RateLimit-Remaining"], "0")
+        # Writes and other users have their own buckets
+        response = self.client.post(
+            reverse("blogs:blog-list"),
+            {"title": "Blog", "content": "Content", "tagline": "tag"},
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(reverse("blogs:home"), headers=self.other)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Until the client IP runs out of quota
+        response = self.client.get(reverse("blogs:home"), headers=self.other)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_async_views_are_throttled(self):
+        for _ in range(3):
+            response = self.client.get(
+                reverse("blogs:async-home"), headers=self.headers
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse("blogs:async-home"), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "20")
+        self.assertEqual(response["X-RateLimit-Remaining"], "0")
+
+    def test_logins_are_throttled(self):
+        # The two registrations above logged in
+        response = self.client.post(
+            reverse("token"), {"username": "Tester", "password": "test123"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_does_not_reset_ip_buckets(self):
+        for i in range(2):
+            response = self.client.post(
+                reverse("token"),
+                {"username": "Tester", "password": "test123"},
+                headers={"X-Forwarded-For": f"10.0.0.{i}"},
+            )
+            self.assertEqual(
+                response.status_code, status.HTTP_429_TOO_MANY_REQUESTS
+            )
+
+    def test_buckets_cost_one_cache_call_until_half_empty(self):
+        bucket = throttling.Bucket("test", 4, 60)
+        bucket.take()
+        with mock.patch.object(throttling, "cache", wraps=cache) as wrapped:
+            self.assertEqual(bucket.take()[1], 2)
+            self.assertEqual(
+                [call[0] for call in wrapped.method_calls], ["incr"]
+            )
+            wrapped.reset_mock()
+            # Buckets in sustained use keep their key
+            self.assertEqual(bucket.take()[1], 1)
+            self.assertEqual(
+                [call[0] for call in wrapped.method_calls], ["incr", "touch"]
+            )
+
+    def test_bucket_refills(self):
+        bucket = throttling.Bucket("test", 2, 60)
+        now = time.time_ns()
+        with mock.patch("time.time_ns", return_value=now):
+            self.assertEqual(bucket.take(), (True, 1, 30.0, 0))
+            self.assertEqual(bucket.take(), (True, 0, 60.0, 0))
+            self.assertEqual(bucket.take(), (False, 0, 60.0, 30.0))
+        with mock.patch("time.time_ns", return_value=now + 45 * 10**9):
+            self.assertEqual(bucket.take(), (True, 0, 45.0, 0))
+            self.assertFalse(bucket.take()[0])
+        with mock.patch("time.time_ns", return_value=now + 600 * 10**9):
+            self.assertEqual(bucket.take(), (True, 1, 30.0, 0))
+
+
+class ExportTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        User.objects.filter(username="Tester").update(is_staff=True)
+        self.blogs = [
+            create_blog(
+                self.access_token,
+                {"title": f"Blog {i}", "content": "Content", "tagline": "tag"},
+            )
+            for i in range(3)
+        ]
+        self.client.post(
+            reverse("blogs:comment-list", args=(self.blogs[0]["id"],)),
+            {"text": "Comment"},
+            headers={"Authorization": f"Bearer {self.access_token}"},
+        )
+
+    def export(self, query=""):
+        response = self.client.get(
+            reverse("blogs:export") + query,
+            headers={"Authorization": f"Bearer {self.access_token}"},
+        )
+        self.assertTrue(response.streaming)
+        return [json.loads(line) for line in response.streaming_content]
+
+    def test_export_streams_blogs_and_comments(self):
+        rows = self.export()
+        self.assertEqual(
+            [row["type"] for row in rows], ["blog", "blog", "blog", "comment"]
+        )
+        self.assertEqual(rows[0]["id"], self.blogs[0]["id"])
+        self.assertEqual(rows[0]["num_comments"], 1)
+        self.assertEqual(rows[0]["content"], "Content")
+        self.assertNotIn("is_liked", rows[0])
+        self.assertEqual(rows[3]["blog"], self.blogs[0]["id"])
+
+    def test_incremental_export_resumes_after_last_row(self):
+        last = self.export("?type=blog")[1]
+        query = urlencode(
+            {"type": "blog", "since": last["created_at"], "since_id": last["id"]}
+        )
+        rows = self.export(f"?{query}")
+        self.assertEqual([row["id"] for row in rows], [self.blogs[2]["id"]])
+
+    def test_export_requires_staff(self):
+        User.objects.filter(username="Tester").update(is_staff=False)
+        response = self.client.get(
+            reverse("blogs:export"),
+            headers={"Authorization": f"Bearer {self.access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_invalid_since(self):
+        response = self.client.get(
+            reverse("blogs:export") + "?since=yesterday",
+            headers={"Authorization": f"Bearer {self.access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command("export_blogs", "--type", "comment", stdout=out, stderr=StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row["text"] for row in rows], ["Comment"])
+
+
+class PerformanceMiddlewareTests(BlogsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        self.headers = {"Authorization": f"Bearer {self.access_token}"}
+        create_blog(
+            self.access_token,
+            {"title": "Test blog", "content": "Content", "tagline": "tag"},
+        )
+        admin_token, _ = register_user_and_get_access_token("Admin", "test123")
+        User.objects.filter(username="Admin").update(is_staff=True)
+        self.admin_headers = {"Authorization": f"Bearer {admin_token}"}
+        # The requests above may have been sampled
+        metrics.registry.reset()
+
+    def test_metrics_are_for_staff_only(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(reverse("metrics"), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @mock.patch.object(middleware, "PERF_SAMPLE_RATE", 1.0)
+    def test_server_timing_and_metrics(self):
+        response = self.client.get(reverse("blogs:blog-list"), headers=self.headers)
+        timing = response["Server-Timing"]
+        self.assertIn('desc="1 queries"', timing)
+        for phase in ["db", "serialize", "render", "total"]:
+            self.assertIn(f"{phase};dur=", timing)
+        response = self.client.get(reverse("metrics"), headers=self.admin_headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn(
+            'http_requests_total{view="blogs:blog-list",method="GET",status="200"} 1',
+            body,
+        )
+        self.assertIn(
+            'http_request_db_queries_count{view="blogs:blog-list",method="GET"} 1',
+            body,
+        )
+
+    @mock.patch.object(middleware, "PERF_SAMPLE_RATE", 1.0)
+    def test_async_view_is_timed(self):
+        response = self.client.get(reverse("blogs:async-home"), headers=self.headers)
+        self.assertIn("total;dur=", response["Server-Timing"])
+
+    @mock.patch.object(middleware, "PERF_SAMPLE_RATE", 0.0)
+    def test_unsampled_requests_are_not_timed(self):
+        response = self.client.get(reverse("blogs:blog-list"), headers=self.headers)
+        self.assertNotIn("Server-Timing", response)
+        self.assertNotIn("blogs:blog-list", metrics.registry.render())
+
+
+class QueryBudgetTests(BlogsTestCase):
+    # Queries allowed per endpoint with a cold cache, whatever the page size
+    QUERY_BUDGETS = {
+        "blogs:home": 3,
+        "blogs:async-home": 3,
+        "blogs:blog-list": 1,
+        "blogs:search": 1,
+        "blogs:trending": 2,
+        "blogs:blog": 2,
+        "blogs:async-blog": 2,
+        "blogs:comment-list": 1,
+        "blogs:async-comment-list": 1,
+        "blogs:comment-threads": 2,
+        "blogs:comment-thread": 2,
+        "user-list": 1,
+        "profile-user": 1,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.access_token, _ = register_user_and_get_access_token("Tester", "test123")
+        self.headers = {"Authorization": f"Bearer {self.access_token}"}
+        for i in range(5):
+            blog = create_blog(
+                self.access_token,
+                {"title": f"Blog {i}", "content": "Content", "tagline": "tag"},
+            )
+            self.client.post(
+                reverse("blogs:like-blog", args=(blog["id"],)), headers=self.headers
+            )
+            # The first comment gets the others as replies
+            comment = self.client.post(
+                reverse("blogs:comment-list", args=(blog["id"],)),
+                {"text": "Comment 0"},
+                headers=self.headers,
+            ).data
+            for j in range(1, 5):
+                self.client.post(
+                    reverse("blogs:comment-list", args=(blog["id"],)),
+                    {"text": f"Comment {j}", "parent": comment["id"]},
+                    headers=self.headers,
+                )
+        self.blog_id = blog["id"]
+        self.comment_id = comment["id"]
+
+    def url(self, name):
+        if name in ["blogs:blog", "blogs:async-blog"]:
+            return reverse(name, args=(self.blog_id,))
+        if name in [
+            "blogs:comment-list",
+            "blogs:async-comment-list",
+            "blogs:comment-threads",
+        ]:
+            return reverse(name, args=(self.blog_id,))
+        if name == "blogs:comment-thread":
+            return reverse(name, args=(self.blog_id, self.comment_id))
+        if name == "blogs:search":
+            return reverse(name) + "?q=blog"
+        return reverse(name)
+
+    def test_endpoints_stay_within_query_budget(self):
+        for name, budget in self.QUERY_BUDGETS.items():
+            with self.subTest(endpoint=name):
+                clear_blog_cache()
+                with self.assertQueryBudget(budget):
+                    response = self.client.get(self.url(name), headers=self.headers)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_n_plus_one_is_detected(self):
+        with self.assertRaisesRegex(AssertionError, "likely an N\\+1"):
+            with self.assertQueryBudget(100):
+                for blog in Blog.objects.all():
+                    blog.likes.count()
+
+    def test_budget_is_enforced(self):
+        with self.assertRaisesRegex(AssertionError, "budget is 1"):
+            with self.assertQueryBudget(1):
+                Blog.objects.count()
+                Comment.objects.count()
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND name = 'a''b'"),
+            "SELECT * FROM t WHERE id IN (?) AND name = ?",
+        )
+        self.assertEqual(
+            fingerprint("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)"),
+            "INSERT INTO t (a, b) VALUES (?), ...",
+        )
+
+
+class BlogSearchViewTests(BlogsTestCase):
+    def search(self, access_token, query):
+        response = self.client.get(
+            reverse("blogs:search"),
+            {"q": query},
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [blog["id"] for blog in response.data["results"]]
+
+    def test_search_ranks_title_matches_first(self):
+        access_token, user_response = register_user_and_get_access_token(
+            "Tester", "test123"
+        )
+        in_content = create_blog(
+            access_token,
+            {
+                "title": "First blog",
+                "content": "Notes about django migrations",
+                "tagline": "python",
+            },
+        )
+        in_title = create_blog(
+            access_token,
+            {
+                "title": "Django tips",
+                "content": "Content text",
+                "tagline": "python",
+            },
+        )
+        create_blog(
+            access_token,
+            {
+                "title": "Unrelated",
+                "content": "Content text",
+                "tagline": "rust",
+            },
+        )
+        self.assertEqual(
+            self.search(access_token, "django"), [in_title["id"], in_content["id"]]
+        )
+        self.assertEqual(self.search(access_token, ""), [])
+
+
+class BenchmarkCommandTests(BlogsTestCase):
+    def test_benchmark_reports_every_route(self):
+        stdout = StringIO()
+        call_command(
+            "benchmark",
+            users=3,
+            blogs=5,
+            likes=10,
+            comments=10,
+            requests=2,
+            warmup=0,
+            route=["blogs:home", "blogs:blog", "blogs:like-blog"],
+            stdout=stdout,
+        )
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report["volumes"]["blogs"], 5)
+        self.assertEqual(report["missing_routes"], [])
+        routes = {(row["route"], row["method"]): row for row in report["routes"]}
+        self.assertEqual(
+            set(routes),
+            {
+                ("blogs:home", "GET"),
+                ("blogs:blog", "GET"),
+                ("blogs:like-blog", "POST"),
+                ("blogs:like-blog", "DELETE"),
+            },
+        )
+        for row in routes.values():
+            self.assertTrue(all(code < 400 for code in row["status"]))
+            self.assertLessEqual(row["p50_ms"], row["p99_ms"])
+            self.assertGreater(row["queries_per_request"], 0)
+
+    def test_commit_hooks_run(self):
+        with mock.patch(
+            "blogs.cache.invalidate_blog", wraps=blog_cache.invalidate_blog
+        ) as invalidate_blog:
+            call_command(
+                "benchmark",
+                users=3,
+                blogs=5,
+                likes=10,
+                comments=10,
+                requests=2,
+                warmup=0,
+                route=["blogs:update-blog"],
+                stdout=StringIO(),
+            )
+        self.assertEqual(invalidate_blog.call_count, 2)
+
+    def test_bulk_and_admin_routes(self):
+        stdout = StringIO()
+        call_command(
+            "benchmark",
+            users=3,
+            blogs=5,
+            likes=10,
+            comments=10,
+            requests=1,
+            warmup=0,
+            route=["blogs:bulk-blogs", "blogs:bulk-like-blogs", "blogs:export"],
+            stdout=stdout,
+        )
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(len(report["routes"]), 4)
+        for row in report["routes"]:
+            self.assertTrue(all(code < 400 for code in row["status"]), row)
+
+
+class RecountBlogsCommandTests(BlogsTestCase):
+    def test_repair_counters(self):
+        user = User.objects.create_user(username="Tester", password="test123")
+        blogs = [
+            Blog.objects.create(
+                title=f"Test blog {i}", content="Content", tagline="", author=user
+            )
+            for i in range(3)
+        ]
+        Like.objects.create(user=user, blog=blogs[0])
+        Comment.objects.create(author=user, blog=blogs[0], text="Comment text")
+        Comment.objects.create(author=user, blog=blogs[2], text="Comment text")
+        Blog.objects.filter(pk=blogs[1].pk).update(like_count=5, comment_count=5)
+        call_command("recount_blogs", batch_size=2, stdout=StringIO())
+        counts = list(
+            Blog.objects.order_by("pk").values_list("like_count", "comment_count")
+        )
+        self.assertEqual(counts, [(1, 1), (0, 0), (0, 1)])
@@ -0,0 +1,217 @@
+"""
+Token bucket throttles for the API, per user and per client IP, with
+separate rates for reads, writes and logins in DEFAULT_THROTTLE_RATES
+("<scope>": "<requests>/<period>", None for no limit). A rate of 120/min
+lets a client burst 120 requests, then refills one every half second.
+
+A bucket is stored as one integer in the cache, the time in microseconds at
+which it will be full again, in the manner of the generic cell rate
+algorithm. A request to a bucket that is more than half full costs a single
+atomic cache.incr(). Other requests write again:
+- a new bucket is created with cache.add(), so concurrent first requests
+  all count
+- a bucket that had refilled restarts from now with cache.set(), which may
+  drop the cost of requests racing with it, at most those that arrive at
+  once at an idle client's full bucket
+- a rejected request takes its cost back with cache.decr()
+- rejected requests and those that leave the bucket under half full refresh
+  the key's expiry, which incr() leaves alone, so that the debt of a bucket
+  in sustained use is not forgotten
+DRF's SimpleRateThrottle instead reads and writes a list of timestamps per
+client, and concurrent requests can overwrite each other's.
+
+Client IPs come from REMOTE_ADDR, or from X-Forwarded-For behind the
+NUM_PROXIES proxies set in REST_FRAMEWORK.
+
+The remaining quota is reported by RateLimitHeadersMiddleware.
+"""
+
+import math
+import time
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Refill periods a bucket key is kept after its last request, by which time
+# the bucket is full again
+THROTTLE_KEY_PERIODS = 10
+
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """
+    Return (requests, seconds) of a "<requests>/<period>" rate, or None
+    """
+    if rate is None:
+        return None
+    num, period = rate.split("/")
+    return int(num), DURATIONS[period[0]]
+
+
+class Bucket:
+    """
+    A token bucket holding up to capacity requests, refilled over period
+    seconds
+    """
+
+    def __init__(self, key, capacity, period):
+        self.key = key
+        self.capacity = capacity
+        self.period = period
+        # Microseconds to refill one request
+        self.interval = max(1, period * 1_000_000 // capacity)
+        self.timeout = period * THROTTLE_KEY_PERIODS
+
+    def result(self, now, full_at):
+        """
+        Return (allowed, remaining, seconds until full, seconds to wait)
+        once a request moved the bucket to full_at
+        """
+        debt = full_at - now
+        excess = debt - self.capacity * self.interval
+        if excess > 0:
+            # The rejected request's cost is taken back
+            debt -= self.interval
+        remaining = max(0, self.capacity - math.ceil(debt / self.interval))
+        return excess <= 0, remaining, debt / 1_000_000, max(0, excess) / 1_000_000
+
+    def take(self):
+        now = time.time_ns() // 1000
+        try:
+            full_at = cache.incr(self.key, self.interval)
+        except ValueError:
+            if cache.add(self.key, now + self.interval, self.timeout):
+                return self.result(now, now + self.interval)
+            # Created by a concurrent request
+            full_at = cache.incr(self.key, self.interval)
+        if full_at < now + self.interval:
+            # A refilled bucket starts from now
+            full_at = now + self.interval
+            cache.set(self.key, full_at, self.timeout)
+            return self.result(now, full_at)
+        result = self.result(now, full_at)
+        if not result[0]:
+            cache.decr(self.key, self.interval)
+        if result[1] < self.capacity / 2:
+            cache.touch(self.key, self.timeout)
+        return result
+
+    async def atake(self):
+        now = time.time_ns() // 1000
+        try:
+            full_at = await cache.aincr(self.key, self.interval)
+        except ValueError:
+            if await cache.aadd(self.key, now + self.interval, self.timeout):
+                return self.result(now, now + self.interval)
+            full_at = await cache.aincr(self.key, self.interval)
+        if full_at < now + self.interval:
+            full_at = now + self.interval
+            await cache.aset(self.key, full_at, self.timeout)
+            return self.result(now, full_at)
+        result = self.result(now, full_at)
+        if not result[0]:
+            await cache.adecr(self.key, self.interval)
+        if result[1] < self.capacity / 2:
+            await cache.atouch(self.key, self.timeout)
+        return result
+
+
+def record_quota(request, limit, remaining, reset):
+    """
+    Keep the tightest quota of the request's throttles for the response
+    headers
+    """
+    request = getattr(request, "_request", request)
+    quota = getattr(request, "rate_limit", None)
+    if quota is None or remaining < quota[1]:
+        request.rate_limit = (limit, remaining, reset)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle requests with the bucket of their client and scope. The scope
+    is the prefix and the view group, "read" for safe methods, "write"
+    otherwise, or the fixed scope of subclasses
+    """
+
+    prefix = None
+    scope = None
+
+    def get_ident_key(self, request):
+        """
+        The client's part of the bucket key, None to not throttle
+        """
+        raise NotImplementedError
+
+    def get_scope(self, request):
+        if self.scope is not None:
+            return self.scope
+        group = "read" if request.method in SAFE_METHODS else "write"
+        return f"{self.prefix}_{group}"
+
+    def get_bucket(self, request):
+        scope = self.get_scope(request)
+        # Read per request so rates can be overridden in tests
+        rate = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(scope))
+        if rate is None:
+            return None
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return None
+        return Bucket(f"blogs:throttle:{scope}:{ident}", *rate)
+
+    def finish(self, request, bucket, allowed, remaining, reset, wait):
+        record_quota(request, bucket.capacity, remaining, reset)
+        self.wait_seconds = wait
+        return allowed
+
+    def allow_request(self, request, view):
+        bucket = self.get_bucket(request)
+        if bucket is None:
+            return True
+        return self.finish(request, bucket, *bucket.take())
+
+    async def aallow_request(self, request):
+        bucket = self.get_bucket(request)
+        if bucket is None:
+            return True
+        return self.finish(request, bucket, *await bucket.atake())
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    """
+    Buckets of authenticated users
+    """
+
+    prefix = "user"
+
+    def get_ident_key(self, request):
+        user = request.user
+        if user is None or not user.is_authenticated:
+            return None
+        return user.pk
+
+
+class IPBucketThrottle(TokenBucketThrottle):
+    """
+    Buckets of client IPs
+    """
+
+    prefix = "ip"
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+class LoginBucketThrottle(IPBucketThrottle):
+    """
+    Logins per client IP, on top of the failed login limits of
+    blogs.passwords
+    """
+
+    scope = "login"
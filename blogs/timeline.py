@@ -0,0 +1,160 @@
+import heapq
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from .cache import BLOG_CACHE_TIMEOUT
+from .models import Blog, Follow, TimelineEntry
+
+# Fanned-out follows an author may have. Later follows are merged into the
+# follower's timeline on read, which caps the rows written per new blog
+TIMELINE_FANOUT_MAX_FOLLOWERS = getattr(
+    settings, "TIMELINE_FANOUT_MAX_FOLLOWERS", 10000
+)
+# Latest blogs of a newly followed author copied into the follower's timeline
+TIMELINE_BACKFILL = getattr(settings, "TIMELINE_BACKFILL", 100)
+
+
+def _pulled_authors_key(user_id):
+    return f"blogs:timeline:pulled:{user_id}"
+
+
+def _pulled_authors_query(user):
+    return Follow.objects.filter(follower=user, fan_out=False).values_list(
+        "author_id", flat=True
+    )
+
+
+def pulled_authors(user):
+    """
+    Return the followed authors whose blogs are merged in on read
+    """
+    key = _pulled_authors_key(user.pk)
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(_pulled_authors_query(user))
+        cache.set(key, author_ids, BLOG_CACHE_TIMEOUT)
+    return author_ids
+
+
+async def apulled_authors(user):
+    """
+    Async version of pulled_authors()
+    """
+    key = _pulled_authors_key(user.pk)
+    author_ids = await cache.aget(key)
+    if author_ids is None:
+        author_ids = [author_id async for author_id in _pulled_authors_query(user)]
+        await cache.aset(key, author_ids, BLOG_CACHE_TIMEOUT)
+    return author_ids
+
+
+class MergedTimeline:
+    """
+    The merge of querysets that each yield rows with blog_id and created_at,
+    supporting the order_by(), filter() and slicing done by cursor
+    pagination. Each queryset is ordered, filtered and limited on its own,
+    so each is a bounded range scan, and the rows are merged in Python
+    """
+
+    def __init__(self, querysets, ordering=(), limit=None):
+        self.querysets = querysets
+        self.ordering = ordering
+        self.limit = limit
+
+    def order_by(self, *ordering):
+        # Ties are broken by blog so that rows from either queryset compare
+        ordering = tuple(
+            {"id": "blog_id", "-id": "-blog_id"}.get(field, field)
+            for field in ordering
+        )
+        return MergedTimeline(
+            [queryset.order_by(*ordering) for queryset in self.querysets], ordering
+        )
+
+    def filter(self, *args, **kwargs):
+        return MergedTimeline(
+            [queryset.filter(*args, **kwargs) for queryset in self.querysets],
+            self.ordering,
+        )
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice) or k.step is not None or k.stop is None:
+            raise TypeError("MergedTimeline only supports bounded slices")
+        return MergedTimeline(self.querysets, self.ordering, k)
+
+    def _merge(self, results):
+        fields = [field.lstrip("-") for field in self.ordering]
+        merged = heapq.merge(
+            *results,
+            key=lambda row: [getattr(row, field) for field in fields],
+            reverse=self.ordering[0].startswith("-"),
+        )
+        rows = []
+        seen = set()
+        for row in merged:
+            if row.blog_id not in seen:
+                seen.add(row.blog_id)
+                rows.append(row)
+        return rows[self.limit]
+
+    def __iter__(self):
+        stop = self.limit.stop
+        return iter(self._merge([list(queryset[:stop]) for queryset in self.querysets]))
+
+
+def home_queryset(user, author_ids):
+    """
+    Return the user's home timeline as rows with blog_id, created_at and
+    liked_by_user: a range scan of the user's timeline entries, merged with
+    one of the pulled authors' blogs
+    """
+    entries = (
+        TimelineEntry.objects.filter(user=user)
+        .for_user(user)
+        .only("blog_id", "created_at")
+    )
+    if not author_ids:
+        return entries
+    blogs = (
+        Blog.objects.filter(author_id__in=author_ids)
+        .for_user(user)
+        .annotate(blog_id=F("pk"))
+        .only("id", "created_at")
+    )
+    return MergedTimeline([entries, blogs])
+
+
+def follow(follower, author):
+    """
+    Follow an author, returning (follow, created). The follow is fanned out
+    on write while the author has fewer than TIMELINE_FANOUT_MAX_FOLLOWERS
+    fanned-out follows
+    """
+    with transaction.atomic():
+        fanned_out = Follow.objects.filter(author=author, fan_out=True)
+        fan_out = fanned_out[:TIMELINE_FANOUT_MAX_FOLLOWERS].count() < (
+            TIMELINE_FANOUT_MAX_FOLLOWERS
+        )
+        follow, created = Follow.objects.get_or_create(
+            follower=follower, author=author, defaults={"fan_out": fan_out}
+        )
+        if created and follow.fan_out:
+            TimelineEntry.objects.backfill(follow, TIMELINE_BACKFILL)
+    if created and not follow.fan_out:
+        transaction.on_commit(lambda: cache.delete(_pulled_authors_key(follower.pk)))
+    return follow, created
+
+
+def unfollow(follower, author):
+    """
+    Stop following an author and drop their blogs from the follower's
+    timeline, returning whether the follower was following them
+    """
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(follower=follower, author=author).delete()
+        if deleted:
+            TimelineEntry.objects.filter(user=follower, blog__author=author).delete()
+    if deleted:
+        transaction.on_commit(lambda: cache.delete(_pulled_authors_key(follower.pk)))
+    return bool(deleted)
@@ -0,0 +1,92 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import Blog, Comment, Like
+
+# Seconds after which an engagement event counts half as much
+TRENDING_HALF_LIFE = getattr(settings, "TRENDING_HALF_LIFE", 12 * 3600)
+TRENDING_LIKE_WEIGHT = getattr(settings, "TRENDING_LIKE_WEIGHT", 1.0)
+TRENDING_COMMENT_WEIGHT = getattr(settings, "TRENDING_COMMENT_WEIGHT", 2.0)
+# Half-lives of history read by recompute(), older events weigh < 2 ** -20
+TRENDING_WINDOW_HALF_LIVES = getattr(settings, "TRENDING_WINDOW_HALF_LIVES", 20)
+# Most blogs listed by /api/blogs/trending/
+TRENDING_MAX_RESULTS = getattr(settings, "TRENDING_MAX_RESULTS", 100)
+
+# Origin of the event scores. Scores only grow by one per half-life since,
+# and a stored trend_score stays comparable across blogs without rescaling
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def event_score(weight, when=None):
+    """
+    Log2 score of an event of the given weight, growing by one per half-life
+    so that older events weigh exponentially less than newer ones
+    """
+    when = timezone.now() if when is None else when
+    return math.log2(weight) + (when - EPOCH).total_seconds() / TRENDING_HALF_LIFE
+
+
+def decayed(trend_score, now=None):
+    """
+    Engagement weight a trend_score amounts to at now
+    """
+    if trend_score is None:
+        return 0.0
+    return 2 ** (trend_score - event_score(1, now))
+
+
+def _log_sum(scores):
+    high = max(scores)
+    return high + math.log2(sum(2 ** (score - high) for score in scores))
+
+
+def like_score():
+    return event_score(TRENDING_LIKE_WEIGHT)
+
+
+def record_comments(blog_id, count=1):
+    """
+    Add count new comments to the blog's trend_score
+    """
+    return Blog.objects.filter(pk=blog_id).bump_trending(
+        event_score(TRENDING_COMMENT_WEIGHT * count)
+    )
+
+
+def recompute(blog_ids, now=None):
+    """
+    Rebuild the trend_score of the blogs from their likes and comments of the
+    last TRENDING_WINDOW_HALF_LIVES half-lives, grouped by hour, and clear it
+    for blogs without any. This drops unliked and deleted engagement that the
+    incremental updates do not subtract
+    """
+    now = timezone.now() if now is None else now
+    since = now - timedelta(seconds=TRENDING_HALF_LIFE * TRENDING_WINDOW_HALF_LIVES)
+    scores = defaultdict(list)
+    for model, weight in (
+        (Like, TRENDING_LIKE_WEIGHT),
+        (Comment, TRENDING_COMMENT_WEIGHT),
+    ):
+        rows = (
+            model.objects.filter(blog_id__in=blog_ids, created_at__gte=since)
+            .annotate(hour=TruncHour("created_at"))
+            .values("blog_id", "hour")
+            .annotate(events=Count("id"))
+            .values_list("blog_id", "hour", "events")
+        )
+        for blog_id, hour, events in rows:
+            # Events are scored at the middle of their hour, not yet reached
+            # by the current hour's
+            when = min(hour + timedelta(minutes=30), now)
+            scores[blog_id].append(event_score(weight * events, when))
+    blogs = [
+        Blog(pk=blog_id, trend_score=_log_sum(scores[blog_id]))
+        if blog_id in scores
+        else Blog(pk=blog_id, trend_score=None)
+        for blog_id in blog_ids
+    ]
+    return Blog.objects.bulk_update(blogs, ["trend_score"])
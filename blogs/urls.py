@@ -1,15 +1,27 @@
 from django.urls import path
-from blogs import views
+from blogs import views, async_views
 
 app_name = "blogs"
 
 urlpatterns = [
     path("home/", views.HomeBlogListView.as_view(), name="home"),
+    path("search/", views.BlogSearchView.as_view(), name="search"),
+    path("trending/", views.TrendingBlogListView.as_view(), name="trending"),
+    path("export/", views.export_blogs, name="export"),
     path("<int:pk>/", views.BlogRetrieveView.as_view(), name="blog"),
     path("", views.BlogListCreateView.as_view(), name="blog-list"),
+    path("bulk/", views.bulk_create_blogs, name="bulk-blogs"),
     path("update/<int:pk>/", views.BlogUpdateView.as_view(), name="update-blog"),
     path("delete/<int:pk>/", views.BlogDeleteView.as_view(), name="delete-blog"),
     path("<int:fk>/like/", views.like_blog, name="like-blog"),
+    path("likes/bulk/", views.bulk_like_blogs, name="bulk-like-blogs"),
     path("<int:fk>/comments/", views.CommentCreateListView.as_view(), name="comment-list"),
+    path("<int:fk>/comments/bulk/", views.bulk_create_comments, name="bulk-comments"),
+    path("<int:fk>/comments/threads/", views.CommentThreadListView.as_view(), name="comment-threads"),
+    path("<int:fk>/comments/<int:pk>/thread/", views.CommentThreadView.as_view(), name="comment-thread"),
     path("comments/delete/<int:pk>/", views.CommentDeleteView.as_view(), name="delete-comment"),
+    path("async/home/", async_views.home_blogs, name="async-home"),
+    path("async/<int:pk>/", async_views.blog_detail, name="async-blog"),
+    path("async/<int:fk>/like/", async_views.like_blog, name="async-like-blog"),
+    path("async/<int:fk>/comments/", async_views.comment_list, name="async-comment-list"),
 ]
\ No newline at end of file
@@ -1,40 +1,72 @@
+from collections import Counter
 from django.contrib.auth.models import User
 from .models import Blog, Like, Comment
 from .serializers import (
     UserSerializer,
     BlogSerializer,
+    BlogListSerializer,
     CommentSerializer,
+    LikeSerializer,
+    BULK_MAX_ITEMS,
+    COMMENT_REPLY_PREVIEW,
+    COMMENT_REPLY_PREVIEW_MAX,
 )
+from .pagination import (
+    BlogCursorPagination,
+    BlogSearchCursorPagination,
+    CommentCursorPagination,
+)
+from .mixins import ValuesListMixin
+from .renderers import FAST_RENDERER_CLASSES
+from . import cache, conditional, export, likes, tasks, timeline, trending
+from django.db import transaction
+from django.db.models import F, Value
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.decorators import (
     api_view,
     permission_classes,
     authentication_classes,
+    renderer_classes,
+    throttle_classes,
 )
 from rest_framework.response import Response
 from rest_framework import generics
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from .authentication import tokens_for_user
+from rest_framework.exceptions import (
+    AuthenticationFailed,
+    NotFound,
+    ParseError,
+    Throttled,
+)
+from . import passwords
+from .throttling import LoginBucketThrottle
 
 
 # Create your views here.
 @api_view(["POST"])
 @permission_classes([AllowAny])
 @authentication_classes([])
+@throttle_classes([LoginBucketThrottle])
 def user_login(request):
     try:
         username = request.data["username"]
         password = request.data["password"]
-        user = authenticate(username=username, password=password)
+        # The client IP the login throttle uses, see NUM_PROXIES
+        ip = LoginBucketThrottle().get_ident(request)
+        passwords.check_failures(username, ip)
+        user = passwords.verify_credentials(username, password)
         if not user:
+            passwords.record_failure(username, ip)
             raise AuthenticationFailed(
                 "No active account found with the given credentials"
             )
+        passwords.clear_failures(username)
         serializer = UserSerializer(user)
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user)
         return Response(
             {
                 "refresh": str(refresh),
@@ -43,7 +75,12 @@ def user_login(request):
             },
             status=status.HTTP_200_OK,
         )
-    except (KeyError, AuthenticationFailed) as error:
+    except (
+        KeyError,
+        AuthenticationFailed,
+        Throttled,
+        passwords.LoginUnavailable,
+    ) as error:
         match error:
             case KeyError():
                 return Response(
@@ -55,6 +92,11 @@ def user_login(request):
                     {"error": {"message": error.detail}},
                     status=status.HTTP_404_NOT_FOUND,
                 )
+            case Throttled() | passwords.LoginUnavailable():
+                return Response(
+                    {"error": {"message": error.detail}},
+                    status=error.status_code,
+                )
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -63,7 +105,11 @@ class ProfileUserRetrieveView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        serializer = UserSerializer(request.user)
+        user = request.user
+        # Users authenticated from token claims only have a few fields loaded
+        if user.get_deferred_fields():
+            user = User.objects.get(pk=user.pk)
+        serializer = UserSerializer(user)
         return Response(serializer.data)
 
 
@@ -74,32 +120,173 @@ class CreateUserView(generics.CreateAPIView):
     authentication_classes = []
 
 
+def blog_list_rows(page, blogs, request, pending=None):
+    """
+    Merge cached blog data with the page's is_liked flags and the reader's
+    pending likes, and apply ?fields=
+    """
+    fields = BlogListSerializer.requested_fields(request)
+    pending = pending or {}
+    data = []
+    for entry in page:
+        if entry.blog_id not in blogs:
+            continue
+        blog, is_liked = likes.apply_pending(
+            blogs[entry.blog_id], entry.liked_by_user, pending.get(entry.blog_id)
+        )
+        row = {**blog, "is_liked": is_liked}
+        data.append(
+            {
+                name: row[name]
+                for name in BlogListSerializer.Meta.fields
+                if name in fields
+            }
+        )
+    return data
+
+
 class HomeBlogListView(generics.ListAPIView):
-    queryset = Blog.objects.all()
-    serializer_class = BlogSerializer
+    serializer_class = BlogListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = BlogCursorPagination
 
+    def get_queryset(self):
+        user = self.request.user
+        return timeline.home_queryset(user, timeline.pulled_authors(user))
+
+    def list(self, request, *args, **kwargs):
+        # Only the timeline columns are read here, the rest comes from the cache
+        page = self.paginate_queryset(self.get_queryset())
+        blog_ids = [entry.blog_id for entry in page]
+        blogs = cache.get_blogs(
+            blog_ids,
+            BlogListSerializer,
+            Blog.objects.defer("content").with_excerpt(),
+        )
+        pending = likes.pending(request.user, blog_ids)
+        data = blog_list_rows(page, blogs, request, pending)
+        return self.get_paginated_response(data)
 
-class BlogListCreateView(generics.ListCreateAPIView):
-    serializer_class = BlogSerializer
+
+class BlogListCreateView(ValuesListMixin, generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = BlogCursorPagination
+    renderer_classes = FAST_RENDERER_CLASSES
+    fast_serialization = True
+    extra_columns = ["id", "liked_by_user"]
+
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return BlogListSerializer
+        return BlogSerializer
+
+    def serialize_page(self, page, fields):
+        data = super().serialize_page(page, fields)
+        return likes.apply_pending_rows(
+            self.request.user,
+            [(row["id"], row["liked_by_user"]) for row in page],
+            data,
+        )
 
     def get_queryset(self):
         user = self.request.user
-        return Blog.objects.filter(author=user)
+        queryset = Blog.objects.filter(author=user).defer("content").for_user(user)
+        if "excerpt" in BlogListSerializer.requested_fields(self.request):
+            queryset = queryset.with_excerpt()
+        return queryset
 
     def perform_create(self, serializer):
         if serializer.is_valid():
-            serializer.save(author=self.request.user)
+            with transaction.atomic():
+                blog = serializer.save(author=self.request.user)
+                tasks.index_blogs.enqueue([blog.pk])
+                tasks.fan_out_blogs.enqueue([blog.pk])
         else:
             print(serializer.errors)
 
 
+class BlogSearchView(generics.ListAPIView):
+    serializer_class = BlogListSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = BlogSearchCursorPagination
+
+    def get_queryset(self):
+        text = self.request.query_params.get("q", "").strip()
+        if not text:
+            # The paginator orders by rank, so even the empty result needs it
+            return Blog.objects.annotate(rank=Value(0.0)).none()
+        user = self.request.user
+        queryset = Blog.objects.search(text).defer("content").for_user(user)
+        if "excerpt" in BlogListSerializer.requested_fields(self.request):
+            queryset = queryset.with_excerpt()
+        return queryset
+
+    def get_paginated_response(self, data):
+        likes.apply_pending_rows(
+            self.request.user,
+            [(blog.pk, blog.liked_by_user) for blog in self.paginator.page],
+            data,
+        )
+        return super().get_paginated_response(data)
+
+
+class TrendingBlogListView(generics.ListAPIView):
+    """
+    The ?limit= blogs with the highest time-decayed engagement
+    """
+
+    serializer_class = BlogListSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        return (
+            Blog.objects.trending()
+            .only("id")
+            .annotate(blog_id=F("pk"))
+            .with_is_liked(user)
+        )
+
+    def list(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            raise ParseError("limit must be an integer")
+        limit = max(1, min(limit, trending.TRENDING_MAX_RESULTS))
+        # Reads the top of the trend_score index, the rest comes from the cache
+        page = list(self.get_queryset()[:limit])
+        blog_ids = [entry.blog_id for entry in page]
+        blogs = cache.get_blogs(
+            blog_ids,
+            BlogListSerializer,
+            Blog.objects.defer("content").with_excerpt(),
+        )
+        pending = likes.pending(request.user, blog_ids)
+        return Response({"results": blog_list_rows(page, blogs, request, pending)})
+
+
 class BlogRetrieveView(generics.RetrieveAPIView):
-    queryset = Blog.objects.all()
     serializer_class = BlogSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return Blog.objects.for_user(self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        blog_id = self.kwargs["pk"]
+        data = cache.get_blogs([blog_id]).get(blog_id)
+        if data is None:
+            raise NotFound()
+        is_liked = Like.objects.filter(user=request.user, blog_id=blog_id).exists()
+        pending = likes.pending(request.user, [blog_id]).get(blog_id)
+        data, is_liked = likes.apply_pending(data, is_liked, pending)
+        etag, last_modified = conditional.blog_validators(data, is_liked, pending)
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is None:
+            response = Response({**data, "is_liked": is_liked})
+            conditional.set_validators(response, etag, last_modified)
+        return response
+
 
 class BlogUpdateView(generics.UpdateAPIView):
     serializer_class = BlogSerializer
@@ -109,6 +296,12 @@ class BlogUpdateView(generics.UpdateAPIView):
         user = self.request.user
         return Blog.objects.filter(author=user)
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            blog = serializer.save()
+            tasks.index_blogs.enqueue([blog.pk])
+            transaction.on_commit(lambda: cache.invalidate_blog(blog.pk))
+
 
 class BlogDeleteView(generics.DestroyAPIView):
     serializer_class = BlogSerializer
@@ -118,23 +311,127 @@ class BlogDeleteView(generics.DestroyAPIView):
         user = self.request.user
         return Blog.objects.filter(author=user)
 
+    def perform_destroy(self, instance):
+        blog_id = instance.pk
+        instance.delete()
+        transaction.on_commit(lambda: cache.invalidate_blog(blog_id))
 
-class CommentCreateListView(generics.ListCreateAPIView):
+
+class CommentCreateListView(ValuesListMixin, generics.ListCreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CommentCursorPagination
+    renderer_classes = FAST_RENDERER_CLASSES
+    fast_serialization = True
+    conditional = True
 
     def get_queryset(self):
         blog_id = self.kwargs["fk"]
         return Comment.objects.filter(blog_id=blog_id)
 
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), "blog_id": self.kwargs["fk"]}
+
     def perform_create(self, serializer):
         blog_id = self.kwargs["fk"]
         if serializer.is_valid():
-            serializer.save(author=self.request.user, blog_id=blog_id)
+            with transaction.atomic():
+                if not Blog.objects.filter(pk=blog_id).update(
+                    comment_count=F("comment_count") + 1, updated_at=timezone.now()
+                ):
+                    raise NotFound()
+                comment = serializer.save(author=self.request.user, blog_id=blog_id)
+                if comment.parent_id:
+                    Comment.objects.add_replies({comment.parent_id: 1})
+                tasks.record_comments.enqueue(blog_id, 1)
+                transaction.on_commit(lambda: cache.invalidate_blog(blog_id))
         else:
             print(serializer.errors)
 
 
+class CommentThreadListView(ValuesListMixin, generics.ListAPIView):
+    """
+    Top-level comments of a blog, oldest first, each with its first
+    ?replies= direct replies. The page and all its replies take two queries
+    """
+
+    serializer_class = CommentSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = CommentCursorPagination
+    renderer_classes = FAST_RENDERER_CLASSES
+    fast_serialization = True
+    conditional = True
+
+    def get_queryset(self):
+        return Comment.objects.filter(blog_id=self.kwargs["fk"]).top_level()
+
+    def get_replies(self, page):
+        """
+        Return (limit, rows) of the first ?replies= direct replies of the
+        page's comments, loaded once for the validators and the response
+        """
+        if getattr(self, "_replies", None) is None:
+            try:
+                limit = int(
+                    self.request.query_params.get("replies", COMMENT_REPLY_PREVIEW)
+                )
+            except ValueError:
+                raise ParseError("replies must be an integer")
+            limit = max(0, min(limit, COMMENT_REPLY_PREVIEW_MAX))
+            parent_ids = [row["id"] for row in page if row.get("reply_count", 1)]
+            rows = []
+            if limit and parent_ids:
+                columns = CommentSerializer.values_columns(
+                    CommentSerializer.values_fields()
+                )
+                rows = list(
+                    Comment.objects.first_replies(parent_ids, limit).values(
+                        *{*columns, "updated_at", "reply_count"}
+                    )
+                )
+            self._replies = (limit, rows)
+        return self._replies
+
+    def validator_parts(self, page):
+        # A nested reply advances the updated_at of its parent reply
+        limit, rows = self.get_replies(page)
+        return limit, [
+            (row["id"], row["updated_at"], row["reply_count"]) for row in rows
+        ]
+
+    def get_paginated_response(self, data):
+        limit, rows = self.get_replies(self.paginator.page)
+        replies = {}
+        fields = CommentSerializer.values_fields()
+        for reply in CommentSerializer.serialize_values(rows, fields):
+            replies.setdefault(reply["parent"], []).append(reply)
+        for comment in data:
+            comment["replies"] = replies.get(comment["id"], [])
+        return super().get_paginated_response(data)
+
+
+class CommentThreadView(ValuesListMixin, generics.ListAPIView):
+    """
+    A comment and all the replies below it, oldest first. Rows carry their
+    parent so clients can rebuild the tree one page at a time
+    """
+
+    serializer_class = CommentSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = CommentCursorPagination
+    renderer_classes = FAST_RENDERER_CLASSES
+    fast_serialization = True
+    conditional = True
+
+    def get_queryset(self):
+        comment = get_object_or_404(
+            Comment.objects.only("id", "path"),
+            pk=self.kwargs["pk"],
+            blog_id=self.kwargs["fk"],
+        )
+        return Comment.objects.thread(comment)
+
+
 class CommentDeleteView(generics.DestroyAPIView):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
@@ -143,31 +440,215 @@ class CommentDeleteView(generics.DestroyAPIView):
         user = self.request.user
         return Comment.objects.filter(author=user)
 
+    def perform_destroy(self, instance):
+        # Deleting a comment deletes its replies
+        with transaction.atomic():
+            deleted = Comment.objects.delete_thread(instance)
+            Blog.objects.filter(pk=instance.blog_id).update(
+                comment_count=F("comment_count") - deleted, updated_at=timezone.now()
+            )
+            if instance.parent_id:
+                Comment.objects.add_replies({instance.parent_id: -1})
+            transaction.on_commit(lambda: cache.invalidate_blog(instance.blog_id))
+
 
 @api_view(["POST", "DELETE"])
 @permission_classes([IsAuthenticated])
 def like_blog(request, fk):
     """
-    Like a blog, or delete a like from a blog
+    Like a blog, or delete a like from a blog, returning the new like count.
+    With LIKE_BUFFER on, the like is written by the next flush
     """
+    if likes.enabled():
+        like_count = likes.record(request.user, fk, request.method == "POST")
+        if like_count is None:
+            raise NotFound()
+        if request.method == "POST":
+            return Response({"num_likes": like_count}, status=status.HTTP_201_CREATED)
+        return Response({"num_likes": like_count}, status=status.HTTP_200_OK)
+
     if request.method == "POST":
-        like = Like.objects.get_or_create(user=request.user, blog_id=fk)
-        return Response(status=status.HTTP_201_CREATED)
+        like_count = Like.objects.like(
+            request.user, fk, trend_score=trending.like_score()
+        )
+        if like_count is None:
+            raise NotFound()
+        transaction.on_commit(lambda: cache.invalidate_blog(fk))
+        return Response({"num_likes": like_count}, status=status.HTTP_201_CREATED)
+
+    if request.method == "DELETE":
+        like_count = Like.objects.unlike(request.user, fk)
+        if like_count is None:
+            raise NotFound()
+        transaction.on_commit(lambda: cache.invalidate_blog(fk))
+        return Response({"num_likes": like_count}, status=status.HTTP_200_OK)
+
+
+def bulk_response(results, success_status=status.HTTP_201_CREATED):
+    """
+    Respond with the per-item results, using 207 Multi-Status when some
+    items did not succeed
+    """
+    if all(result["status"] == success_status for result in results):
+        response_status = success_status
+    else:
+        response_status = status.HTTP_207_MULTI_STATUS
+    return Response({"results": results}, status=response_status)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def bulk_create_blogs(request):
+    """
+    Create a list of blogs in one transaction
+    """
+    serializer = BlogSerializer(
+        data=request.data,
+        many=True,
+        max_length=BULK_MAX_ITEMS,
+        context={"request": request},
+    )
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        blogs = serializer.save(author=request.user)
+        blog_ids = [blog.pk for blog in blogs]
+        tasks.index_blogs.enqueue(blog_ids)
+        tasks.fan_out_blogs.enqueue(blog_ids)
+    for blog in blogs:
+        blog.liked_by_user = False
+    results = serializer.item_results(
+        {"status": status.HTTP_201_CREATED, "data": data} for data in serializer.data
+    )
+    return bulk_response(results)
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def bulk_create_comments(request, fk):
+    """
+    Create a list of comments on a blog in one transaction
+    """
+    serializer = CommentSerializer(
+        data=request.data,
+        many=True,
+        max_length=BULK_MAX_ITEMS,
+        context={"request": request, "blog_id": fk},
+    )
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        added = len(serializer.validated_data)
+        blogs = Blog.objects.filter(pk=fk)
+        if not blogs.update(
+            comment_count=F("comment_count") + added, updated_at=timezone.now()
+        ):
+            raise NotFound()
+        serializer.save(author=request.user, blog_id=fk)
+        Comment.objects.add_replies(
+            Counter(
+                attrs["parent_id"]
+                for attrs in serializer.validated_data
+                if attrs.get("parent_id")
+            )
+        )
+        if added:
+            tasks.record_comments.enqueue(fk, added)
+        transaction.on_commit(lambda: cache.invalidate_blog(fk))
+    results = serializer.item_results(
+        {"status": status.HTTP_201_CREATED, "data": data} for data in serializer.data
+    )
+    return bulk_response(results)
+
+
+@api_view(["POST", "DELETE"])
+@permission_classes([IsAuthenticated])
+def bulk_like_blogs(request):
+    """
+    Like, or delete likes from, a list of blogs, returning their new like counts
+    """
+    serializer = LikeSerializer(data=request.data, many=True, max_length=BULK_MAX_ITEMS)
+    serializer.is_valid(raise_exception=True)
+    blog_ids = [item["blog"] for item in serializer.validated_data]
+    if request.method == "POST":
+        success_status = status.HTTP_201_CREATED
+        like_counts = Like.objects.like_many(
+            request.user, blog_ids, trend_score=trending.like_score()
+        )
+    else:
+        success_status = status.HTTP_200_OK
+        like_counts = Like.objects.unlike_many(request.user, blog_ids)
+    likes.written(request.user, blog_ids, request.method == "POST")
+    transaction.on_commit(lambda: cache.invalidate_blogs(like_counts))
+    results = serializer.item_results(
+        {
+            "status": success_status,
+            "data": {"blog": blog_id, "num_likes": like_counts[blog_id]},
+        }
+        if blog_id in like_counts
+        else {
+            "status": status.HTTP_404_NOT_FOUND,
+            "errors": {"detail": NotFound.default_detail},
+        }
+        for blog_id in blog_ids
+    )
+    return bulk_response(results, success_status)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def export_blogs(request):
+    """
+    Stream blogs and comments as newline-delimited JSON, optionally only the
+    ones created after ?since= and ?since_id=
+    """
+    types = request.query_params.getlist("type") or list(export.EXPORT_TYPES)
+    unknown = set(types) - export.EXPORT_TYPES.keys()
+    if unknown:
+        raise ParseError(f"Unknown export type: {', '.join(sorted(unknown))}")
+    try:
+        since, since_id = export.parse_since(
+            request.query_params.get("since"), request.query_params.get("since_id")
+        )
+    except ValueError as error:
+        raise ParseError(str(error))
+    return StreamingHttpResponse(
+        export.export_lines(types, since, since_id),
+        content_type="application/x-ndjson",
+    )
+
+
+@api_view(["POST", "DELETE"])
+@permission_classes([IsAuthenticated])
+def follow_user(request, pk):
+    """
+    Follow a user, or stop following a user
+    """
+    author = get_object_or_404(User.objects.only("id"), pk=pk)
+    if author.pk == request.user.pk:
+        raise ParseError("Users cannot follow themselves")
+
+    if request.method == "POST":
+        follow, created = timeline.follow(request.user, author)
+        return Response(
+            {"author": author.pk, "fan_out": follow.fan_out},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
 
     if request.method == "DELETE":
-        like = get_object_or_404(Like, user=request.user, blog_id=fk)
-        like.delete()
+        if not timeline.unfollow(request.user, author):
+            raise NotFound()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(["GET"])
+@renderer_classes(FAST_RENDERER_CLASSES)
 def user_list(request):
     """
     List all users, or create a new user
     """
     users = User.objects.all()
-    serializer = UserSerializer(users, many=True)
-    return Response(serializer.data)
+    fields = UserSerializer.values_fields()
+    users = users.values(*UserSerializer.values_columns(fields))
+    return Response(UserSerializer.serialize_values(users, fields))
 
 
 @api_view(["GET", "PUT"])
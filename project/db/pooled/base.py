@@ -0,0 +1,88 @@
+"""
+PostgreSQL backend that borrows connections from a psycopg_pool pool instead
+of opening one per request, for ASGI workers where persistent per-thread
+connections do not apply. OPTIONS["pool"] holds the ConnectionPool arguments
+(min_size, max_size, timeout, ...). Use it with CONN_MAX_AGE = 0 so the
+connection goes back to the pool when the request finishes.
+"""
+
+import threading
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from psycopg import IsolationLevel
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    ConnectionPool = None
+
+# (alias, database name) -> pool, shared by the per-thread wrappers
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def pool(self):
+        if ConnectionPool is None:
+            raise ImproperlyConfigured(
+                "The pooled database backend requires the psycopg-pool package"
+            )
+        key = (self.alias, self.settings_dict["NAME"])
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(
+                    kwargs=self.get_connection_params(),
+                    # Discard connections the server closed before lending them
+                    check=ConnectionPool.check_connection,
+                    name=self.alias,
+                    open=True,
+                    **self.settings_dict["OPTIONS"].get("pool", {}),
+                )
+                _pools[key] = pool
+        return pool
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        # Connections to the maintenance database while creating the test
+        # database are short lived and not pooled
+        if self.settings_dict["NAME"] is None:
+            self.pooled = False
+            return super().get_new_connection(conn_params)
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+        try:
+            self.isolation_level = IsolationLevel(
+                IsolationLevel.READ_COMMITTED
+                if isolation_level is None
+                else isolation_level
+            )
+        except ValueError:
+            raise ImproperlyConfigured(
+                f"Invalid transaction isolation level {isolation_level} "
+                f"specified. Use one of the psycopg.IsolationLevel values."
+            )
+        connection = self.pool.getconn()
+        # A previous borrower may have changed it
+        connection.isolation_level = (
+            None if isolation_level is None else self.isolation_level
+        )
+        self.pooled = True
+        return connection
+
+    def _close(self):
+        if self.connection is None or not getattr(self, "pooled", False):
+            return super()._close()
+        with self.wrap_database_errors:
+            self.pool.putconn(self.connection)
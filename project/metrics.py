@@ -0,0 +1,190 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from .queries import QueryObserver
+
+# Timings of the sampled request being handled, None when not sampling
+current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings(QueryObserver):
+    """
+    Time spent per phase (db, serialize, render) by one sampled request,
+    collected while it is entered
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.queries = 0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def record(self, sql, seconds):
+        self.add("db", seconds)
+        self.queries += 1
+
+    def __enter__(self):
+        super().__enter__()
+        self._timings_token = current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        current.reset(self._timings_token)
+        super().__exit__(*exc_info)
+
+
+@contextmanager
+def timer(phase):
+    """
+    Add the time spent in the block to the phase of the sampled request
+    """
+    timings = current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - start)
+
+
+def _format_labels(labels):
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels
+    )
+    return ",".join(f'{name}="{value}"' for name, value in escaped)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = _format_labels((*labels, ("le", bound)))
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {bucket_count}")
+            inf_labels = _format_labels((*labels, ("le", "+Inf")))
+            lines.append(f"{self.name}_bucket{{{inf_labels}}} {count}")
+            lines.append(f"{self.name}_sum{{{_format_labels(labels)}}} {total}")
+            lines.append(f"{self.name}_count{{{_format_labels(labels)}}} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels):
+        self.series[labels] = self.series.get(labels, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{_format_labels(labels)}}} {value}")
+        return lines
+
+
+SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Registry:
+    """
+    In-process aggregates of the sampled requests, per worker process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter(
+                "http_requests_total", "Sampled requests by view and status"
+            )
+            self.histograms = {
+                "total": Histogram(
+                    "http_request_duration_seconds", "Request wall time", SECONDS
+                ),
+                "db": Histogram(
+                    "http_request_db_duration_seconds",
+                    "Time in database queries",
+                    SECONDS,
+                ),
+                "queries": Histogram(
+                    "http_request_db_queries",
+                    "Database queries per request",
+                    (0, 1, 2, 3, 5, 10, 20, 50, 100),
+                ),
+                "serialize": Histogram(
+                    "http_request_serialize_duration_seconds",
+                    "Time in serializers",
+                    SECONDS,
+                ),
+                "render": Histogram(
+                    "http_request_render_duration_seconds",
+                    "Time rendering the response body",
+                    SECONDS,
+                ),
+                "size": Histogram(
+                    "http_response_size_bytes",
+                    "Response body size",
+                    (100, 1000, 10000, 100000, 1000000, 10000000),
+                ),
+            }
+
+    def observe(self, view, method, status, values):
+        labels = (("view", view), ("method", method))
+        with self._lock:
+            self.requests.inc((*labels, ("status", status)))
+            for name, value in values.items():
+                self.histograms[name].observe(labels, value)
+
+    def render(self):
+        with self._lock:
+            lines = self.requests.render()
+            for histogram in self.histograms.values():
+                lines += histogram.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """
+    Expose the aggregates in the Prometheus text format, to staff users only
+    """
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
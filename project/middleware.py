@@ -0,0 +1,164 @@
+import logging
+import math
+import random
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from . import metrics, queries
+
+logger = logging.getLogger(__name__)
+
+# Fraction of requests timed, 0 leaves only a random() call per request
+PERF_SAMPLE_RATE = getattr(settings, "PERF_SAMPLE_RATE", 1.0)
+# Whether QueryInspectionMiddleware is active, meant for tests and staging
+QUERY_INSPECTION = getattr(settings, "QUERY_INSPECTION", False)
+
+
+class PerformanceMiddleware:
+    """
+    Time a sample of requests, report the database, serializer and render
+    phases in a Server-Timing header and aggregate them for /api/_metrics
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= PERF_SAMPLE_RATE:
+            return self.get_response(request)
+        with metrics.RequestTimings() as timings:
+            response = self.get_response(request)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        if random.random() >= PERF_SAMPLE_RATE:
+            return await self.get_response(request)
+        with metrics.RequestTimings() as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings)
+
+    def process_template_response(self, request, response):
+        timings = metrics.current.get()
+        if timings is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: timings.add("render", time.perf_counter() - start)
+            )
+        return response
+
+    def finish(self, request, response, timings):
+        phases = timings.phases
+        values = {
+            "total": time.perf_counter() - timings.start,
+            "db": phases.get("db", 0.0),
+            "queries": timings.queries,
+            "serialize": phases.get("serialize", 0.0),
+            "render": phases.get("render", 0.0),
+        }
+        if not response.streaming:
+            values["size"] = len(response.content)
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        metrics.registry.observe(view, request.method, response.status_code, values)
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={values["db"] * 1000:.3f};desc="{timings.queries} queries"',
+                f'serialize;dur={values["serialize"] * 1000:.3f}',
+                f'render;dur={values["render"] * 1000:.3f}',
+                f'total;dur={values["total"] * 1000:.3f}',
+            ]
+        )
+        return response
+
+
+class QueryInspectionMiddleware:
+    """
+    Log requests that repeat a statement shape more than
+    QUERY_REPEAT_THRESHOLD times or run queries slower than SLOW_QUERY_MS
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not QUERY_INSPECTION:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with queries.QueryRecorder() as recorder:
+            response = self.get_response(request)
+        self.report(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        with queries.QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        self.report(request, recorder)
+        return response
+
+    def report(self, request, recorder):
+        for shape, count in recorder.repeated().items():
+            logger.warning(
+                "%s %s repeated a query %d times: %s",
+                request.method,
+                request.path,
+                count,
+                shape,
+            )
+        for sql, milliseconds in recorder.slow():
+            logger.warning(
+                "%s %s ran a %.1f ms query: %s",
+                request.method,
+                request.path,
+                milliseconds,
+                sql,
+            )
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Report the tightest throttle quota of the request (see blogs.throttling)
+    in X-RateLimit-Limit, X-RateLimit-Remaining and X-RateLimit-Reset, the
+    seconds until the quota is full again
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    def add_headers(self, request, response):
+        quota = getattr(request, "rate_limit", None)
+        if quota is not None:
+            limit, remaining, reset = quota
+            response["X-RateLimit-Limit"] = str(limit)
+            response["X-RateLimit-Remaining"] = str(remaining)
+            response["X-RateLimit-Reset"] = str(math.ceil(reset))
+        return response
@@ -0,0 +1,153 @@
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Executions of one statement shape per request above which it is flagged
+QUERY_REPEAT_THRESHOLD = getattr(settings, "QUERY_REPEAT_THRESHOLD", 3)
+SLOW_QUERY_MS = getattr(settings, "SLOW_QUERY_MS", 100)
+
+# Innermost active QueryObserver, None when nothing is recorded
+current = ContextVar("query_observer", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"%s|\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    Reduce a statement to its shape, replacing literals and parameters with
+    ? and collapsing IN lists and the rows of multi-row VALUES
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _LIST.sub("(?)", sql)
+    sql = _ROWS.sub("(?), ...", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def record_query(execute, sql, params, many, context):
+    observer = current.get()
+    if observer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - start
+        while observer is not None:
+            observer.record(sql, seconds)
+            observer = observer.parent
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# Connections are per thread, so the recorder is added to each new one
+connection_created.connect(install_query_recorder)
+
+
+class QueryObserver:
+    """
+    Context in which each executed statement is passed to record(), including
+    in the threads running async views. Observers nest, the outer ones also
+    see the queries of the inner ones
+    """
+
+    def record(self, sql, seconds):
+        raise NotImplementedError
+
+    def __enter__(self):
+        # Connections opened before this module was imported missed the
+        # connection_created signal
+        for alias in connections:
+            install_query_recorder(connections[alias])
+        self.parent = current.get()
+        self._token = current.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        current.reset(self._token)
+
+
+class QueryRecorder(QueryObserver):
+    """
+    Record the SQL executed in this context
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def record(self, sql, seconds):
+        self.queries.append((sql, seconds))
+
+    def repeated(self, threshold=None):
+        """
+        Return {fingerprint: executions} of the shapes executed more than
+        threshold times, the signature of an N+1 query
+        """
+        threshold = QUERY_REPEAT_THRESHOLD if threshold is None else threshold
+        counts = Counter(fingerprint(sql) for sql, seconds in self.queries)
+        return {
+            shape: count
+            for shape, count in counts.items()
+            # Batches of a bulk write repeat by design
+            if count > threshold and "(?), ..." not in shape
+        }
+
+    def slow(self, threshold_ms=None):
+        """
+        Return (sql, milliseconds) of the queries slower than threshold_ms
+        """
+        threshold_ms = SLOW_QUERY_MS if threshold_ms is None else threshold_ms
+        return [
+            (sql, seconds * 1000)
+            for sql, seconds in self.queries
+            if seconds * 1000 > threshold_ms
+        ]
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin failing tests that run more queries than their budget or
+    repeat a statement shape like an N+1 loop does
+    """
+
+    def assertQueryBudget(self, budget, repeat_threshold=None):
+        return _QueryBudgetContext(self, budget, repeat_threshold)
+
+
+class _QueryBudgetContext(QueryRecorder):
+    def __init__(self, test_case, budget, repeat_threshold):
+        super().__init__()
+        self.test_case = test_case
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        statements = "\n".join(
+            f"{i}. {sql}" for i, (sql, seconds) in enumerate(self.queries, start=1)
+        )
+        self.test_case.assertLessEqual(
+            len(self.queries),
+            self.budget,
+            f"{len(self.queries)} queries executed, budget is {self.budget}\n"
+            f"{statements}",
+        )
+        repeated = self.repeated(self.repeat_threshold)
+        self.test_case.assertFalse(
+            repeated,
+            "Repeated query shapes, likely an N+1:\n"
+            + "\n".join(f"{count}x {shape}" for shape, count in repeated.items()),
+        )
@@ -10,11 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import dotenv_values
 
-config = dotenv_values(".env")
+# Environment variables override the values in .env
+config = {**dotenv_values(".env"), **os.environ}
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -34,9 +37,26 @@ ALLOWED_HOSTS = []
 # REST FRAMEWORK
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "blogs.authentication.StatelessJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
+    # Token buckets per user and client IP, see blogs.throttling. A rate of
+    # N/period allows bursts of N requests
+    "DEFAULT_THROTTLE_CLASSES": [
+        "blogs.throttling.UserBucketThrottle",
+        "blogs.throttling.IPBucketThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "user_read": "1200/min",
+        "user_write": "300/min",
+        "ip_read": "3000/min",
+        "ip_write": "600/min",
+        "login": "30/min",
+    },
+    # Proxies in front of the app that append to X-Forwarded-For. 0 when
+    # clients connect directly: the IP throttles then use REMOTE_ADDR and
+    # ignore X-Forwarded-For, which clients can forge
+    "NUM_PROXIES": int(config.get("NUM_PROXIES", 0)),
 }
 
 # SIMPLE JWT
@@ -46,6 +66,10 @@ SIMPLE_JWT = {
     "TOKEN_OBTAIN_SERIALIZER": "blogs.serializers.CustomTokenObtainPairSerializer",
     "SIGNING_KEY": config["JWT_SECRET_KEY"],
 }
+# Seconds each process caches a user's token revocation marker, how long a
+# password change, deactivation or deletion takes to revoke their tokens
+# everywhere when the cache is not shared
+TOKEN_VERSION_CACHE_TIMEOUT = 60
 
 # Application definition
 
@@ -62,6 +86,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "project.middleware.PerformanceMiddleware",
+    "project.middleware.QueryInspectionMiddleware",
+    "project.middleware.RateLimitHeadersMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -95,17 +122,172 @@ WSGI_APPLICATION = "project.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
+#
+# Every value comes from the environment (or .env). DB_POOL chooses how
+# connections are reused between requests:
+#   persistent  kept open per worker thread for DB_CONN_MAX_AGE seconds and
+#               health checked before reuse, for WSGI workers
+#   pool        borrowed from a psycopg_pool pool of DB_POOL_MIN_SIZE to
+#               DB_POOL_MAX_SIZE connections, for ASGI workers
+#   none        a new connection for every request
+
+DB_POOL = config.get("DB_POOL", "persistent")
+if DB_POOL not in ("persistent", "pool", "none"):
+    raise ImproperlyConfigured(f"Unknown DB_POOL {DB_POOL!r}")
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": "blogs",
-        "USER": "postgres",
-        "PASSWORD": "dothingsthatdontscale",
-        "HOST": "localhost",
-        "PORT": "5433",
+        "ENGINE": (
+            "project.db.pooled"
+            if DB_POOL == "pool"
+            else "django.db.backends.postgresql"
+        ),
+        "NAME": config.get("DB_NAME", "blogs"),
+        "USER": config.get("DB_USER", "postgres"),
+        "PASSWORD": config.get("DB_PASSWORD", ""),
+        "HOST": config.get("DB_HOST", "localhost"),
+        "PORT": config.get("DB_PORT", "5433"),
+        "CONN_MAX_AGE": (
+            int(config.get("DB_CONN_MAX_AGE", 600)) if DB_POOL == "persistent" else 0
+        ),
+        "CONN_HEALTH_CHECKS": DB_POOL == "persistent",
+        "OPTIONS": {},
+    }
+}
+if DB_POOL == "pool":
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(config.get("DB_POOL_MIN_SIZE", 2)),
+        "max_size": int(config.get("DB_POOL_MAX_SIZE", 10)),
+        "timeout": float(config.get("DB_POOL_TIMEOUT", 10)),
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+#
+# The blog cache, its invalidation on writes, token revocations, the like
+# buffer and the throttles need a cache shared by every worker process.
+# CACHE_BACKEND chooses it:
+#   redis      a Redis server at CACHE_LOCATION (needs the redis package),
+#              for any deployment of more than one process
+#   memcached  memcached servers at CACHE_LOCATION, comma separated (needs
+#              the pymemcache package)
+#   locmem     memory private to each process, only for development with a
+#              single process: other processes keep serving blogs for up to
+#              BLOG_CACHE_TIMEOUT seconds after they change
+
+CACHE_BACKENDS = {
+    "redis": "django.core.cache.backends.redis.RedisCache",
+    "memcached": "django.core.cache.backends.memcached.PyMemcacheCache",
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+}
+CACHE_BACKEND = config.get("CACHE_BACKEND", "locmem")
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f"Unknown CACHE_BACKEND {CACHE_BACKEND!r}")
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
     }
 }
+if CACHE_BACKEND == "redis":
+    CACHES["default"]["LOCATION"] = config.get(
+        "CACHE_LOCATION", "redis://localhost:6379/0"
+    )
+elif CACHE_BACKEND == "memcached":
+    CACHES["default"]["LOCATION"] = config.get(
+        "CACHE_LOCATION", "localhost:11211"
+    ).split(",")
+
+BLOG_CACHE_TIMEOUT = 300
+BLOG_VERSION_TIMEOUT = 600
+
+
+# Bulk writes
+# Largest list accepted by the bulk blog, comment and like endpoints
+
+BULK_MAX_ITEMS = 1000
+
+
+# Home timeline
+# New blogs are copied into the timelines of the author's followers, up to
+# TIMELINE_FANOUT_MAX_FOLLOWERS of them, later followers merge the author's
+# blogs in on read
+
+TIMELINE_FANOUT_MAX_FOLLOWERS = 10000
+TIMELINE_BACKFILL = 100
+
+
+# Trending
+# /api/blogs/trending/ ranks blogs by likes and comments (weighted by
+# TRENDING_LIKE_WEIGHT and TRENDING_COMMENT_WEIGHT) that count half as much
+# every TRENDING_HALF_LIFE seconds. `manage.py recompute_trending` rebuilds
+# the scores from the last TRENDING_WINDOW_HALF_LIVES half-lives
+
+TRENDING_HALF_LIFE = 12 * 3600
+TRENDING_LIKE_WEIGHT = 1.0
+TRENDING_COMMENT_WEIGHT = 2.0
+TRENDING_WINDOW_HALF_LIVES = 20
+TRENDING_MAX_RESULTS = 100
+
+
+# Background tasks
+# Side effects of the write endpoints (timeline fan-out, search indexing,
+# trending) run after commit on TASK_BACKEND: "thread" for a pool of
+# TASK_WORKERS threads per process, "database" for a durable queue run by
+# `manage.py run_worker` (with a cache shared by the processes), or
+# "immediate". Failed tasks are retried TASK_RETRIES times, TASK_RETRY_DELAY
+# seconds apart, doubling each time
+
+TASK_BACKEND = config.get("TASK_BACKEND", "thread")
+TASK_WORKERS = 4
+TASK_RETRIES = 3
+TASK_RETRY_DELAY = 1.0
+
+
+# Like write buffer
+# With LIKE_BUFFER on, likes and unlikes are acknowledged at once and written
+# every LIKE_BUFFER_INTERVAL seconds per process, batched and deduplicated,
+# with one like_count update per blog. For viral blogs whose like_count row
+# becomes a lock hotspot. Needs a cache shared by the processes
+
+LIKE_BUFFER = config.get("LIKE_BUFFER", "false").lower() == "true"
+LIKE_BUFFER_INTERVAL = 1.0
+LIKE_BUFFER_INTENT_TIMEOUT = 300
+
+
+# Export
+# Rows fetched per round trip while streaming /api/blogs/export/
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+# Performance instrumentation
+# Share of requests timed by project.middleware.PerformanceMiddleware, which
+# adds a Server-Timing header to them and aggregates them at /api/_metrics
+
+PERF_SAMPLE_RATE = 0.1
+
+# project.middleware.QueryInspectionMiddleware logs requests repeating a
+# statement shape more than QUERY_REPEAT_THRESHOLD times, a likely N+1, or
+# running queries slower than SLOW_QUERY_MS
+
+QUERY_INSPECTION = DEBUG
+QUERY_REPEAT_THRESHOLD = 3
+SLOW_QUERY_MS = 100
+
+
+# Login
+# Password hashes run in a process pool of LOGIN_HASH_WORKERS processes
+# (0 hashes on the request thread), and usernames with LOGIN_MAX_FAILURES
+# failed attempts within LOGIN_FAILURE_WINDOW seconds are rejected unhashed
+
+LOGIN_HASH_WORKERS = 2
+LOGIN_HASH_MAX_PENDING = 64
+LOGIN_HASH_QUEUE_TIMEOUT = 5
+LOGIN_MAX_FAILURES = 5
+LOGIN_MAX_FAILURES_PER_IP = 50
+LOGIN_FAILURE_WINDOW = 300
 
 
 # Password validation
@@ -0,0 +1,49 @@
+"""
+Settings profile for the API workers, which only serve the JWT authenticated
+/api/ routes. Run them with DJANGO_SETTINGS_MODULE=project.settings_api and
+keep project.settings for the admin.
+
+Sessions, messages, CSRF, clickjacking protection, the admin and the
+browsable API only serve browser clients, so they are left out of the
+middleware chain and the app registry. 'manage.py bench_startup' compares
+the cold start and per-request cost of both profiles.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK, TEMPLATES
+
+BROWSER_APPS = [
+    "django.contrib.admin",
+    "django.contrib.sessions",
+    "django.contrib.messages",
+    "django.contrib.staticfiles",
+]
+BROWSER_MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.middleware.csrf.CsrfViewMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+]
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in BROWSER_APPS]
+MIDDLEWARE = [name for name in MIDDLEWARE if name not in BROWSER_MIDDLEWARE]
+
+ROOT_URLCONF = "project.urls_api"
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    "DEFAULT_RENDERER_CLASSES": ("blogs.renderers.FastJSONRenderer",),
+}
+BROWSABLE_API = False
+
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        "OPTIONS": {
+            "context_processors": [
+                "django.template.context_processors.request",
+            ],
+        },
+    }
+]
@@ -17,23 +17,10 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import TokenRefreshView
-from blogs.views import (
-    user_detail,
-    user_list,
-    user_login,
-    CreateUserView,
-    ProfileUserRetrieveView,
-)
+from project import urls_api
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("api/register/", CreateUserView.as_view(), name="register-user"),
-    path("api/profile/user/", ProfileUserRetrieveView.as_view(), name="profile-user"),
-    path("api/user/<int:pk>/", user_detail, name="user"),
-    path("api/users/", user_list, name="user-list"),
-    path("api/blogs/", include("blogs.urls")),
-    path("api/login/", user_login, name="token"),
-    path("api/token/refresh", TokenRefreshView.as_view(), name="token-refresh"),
+    *urls_api.urlpatterns,
     path("api-auth/", include("rest_framework.urls")),
 ]
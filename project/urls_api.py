@@ -0,0 +1,28 @@
+"""
+URL configuration of the JWT API, served alone by the API workers (see
+project.settings_api) and next to the admin by project.urls
+"""
+
+from django.urls import path, include
+from rest_framework_simplejwt.views import TokenRefreshView
+from project.metrics import metrics_view
+from blogs.views import (
+    follow_user,
+    user_detail,
+    user_list,
+    user_login,
+    CreateUserView,
+    ProfileUserRetrieveView,
+)
+
+urlpatterns = [
+    path("api/register/", CreateUserView.as_view(), name="register-user"),
+    path("api/profile/user/", ProfileUserRetrieveView.as_view(), name="profile-user"),
+    path("api/user/<int:pk>/", user_detail, name="user"),
+    path("api/user/<int:pk>/follow/", follow_user, name="follow-user"),
+    path("api/users/", user_list, name="user-list"),
+    path("api/blogs/", include("blogs.urls")),
+    path("api/login/", user_login, name="token"),
+    path("api/token/refresh", TokenRefreshView.as_view(), name="token-refresh"),
+    path("api/_metrics", metrics_view, name="metrics"),
+]